@@ -0,0 +1,111 @@
+"""
+Ingest Benchmark
+
+Generates a synthetic medicine CSV (1M rows by default) and loads it with the bulk
+streaming loader. Optionally runs the old iterrows + execute-per-row approach on a
+smaller sample for comparison.
+
+Usage:
+    python benchmarks/bench_ingest.py
+    python benchmarks/bench_ingest.py --rows 1000000 --baseline-rows 100000
+"""
+
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Add the project root to sys.path so the services package can be imported
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services import medicine_dbutil
+
+
+MANUFACTURERS = ["Cipla Ltd", "Sun Pharmaceutical", "Abbott", "Pfizer", "Lupin Ltd", "Mankind Pharma"]
+INGREDIENTS = ["Paracetamol", "Ibuprofen", "Amoxycillin", "Cetirizine", "Metformin", "Aspirin", "Omeprazole"]
+
+
+def write_synthetic_csv(path, rows, seed=7):
+    """
+    Write a medicine CSV with the same columns as medicine_info_dataset.csv.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(medicine_dbutil.CSV_COLUMNS)
+        for i in range(rows):
+            ingredient = rng.choice(INGREDIENTS)
+            writer.writerow([
+                f"{ingredient[:4]}med {i} Tablet",
+                f"{ingredient} ({rng.choice([250, 500, 650])}mg)",
+                rng.choice(MANUFACTURERS),
+                f"Treatment of condition {rng.randint(1, 500)}",
+                "Nausea Headache Dizziness",
+            ])
+
+
+def baseline_iterrows(csv_path, db_path):
+    """
+    The original loader: pandas iterrows with one execute per row.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE medicines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            medicine_name TEXT NOT NULL,
+            composition TEXT NOT NULL,
+            manufacturer TEXT,
+            uses TEXT,
+            side_effects TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_medicine_name ON medicines(medicine_name)')
+    conn.execute('CREATE INDEX idx_composition ON medicines(composition)')
+
+    start = time.perf_counter()
+    df = pd.read_csv(csv_path)
+    for _, row in df.iterrows():
+        conn.execute(medicine_dbutil.INSERT_MEDICINE_SQL, (
+            row['Medicine Name'], row['Composition'], row['Manufacturer'], row['Uses'], row['Side_effects']
+        ))
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return len(df), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bulk medicine ingest")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--baseline-rows", type=int, default=0,
+                        help="also time the iterrows loader on this many rows (0 = skip)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "medicines.csv")
+        print(f"Generating {args.rows:,} synthetic rows...")
+        write_synthetic_csv(csv_path, args.rows)
+
+        medicine_dbutil.DB_PATH = os.path.join(tmp, "medicine_info.db")
+        start = time.perf_counter()
+        medicine_dbutil.insert_medicines_from_csv(csv_path=csv_path, batch_size=args.batch_size)
+        total = time.perf_counter() - start
+        print(f"Bulk loader end-to-end: {total:.2f}s ({args.rows / total:,.0f} rows/s incl. indexes)")
+
+        if args.baseline_rows:
+            sample_path = os.path.join(tmp, "sample.csv")
+            write_synthetic_csv(sample_path, args.baseline_rows)
+            rows, elapsed = baseline_iterrows(sample_path, os.path.join(tmp, "baseline.db"))
+            print(f"iterrows baseline: {rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
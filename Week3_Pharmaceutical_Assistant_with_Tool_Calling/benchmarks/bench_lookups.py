@@ -0,0 +1,251 @@
+"""
+Lookup Benchmark
+
+Generates synthetic catalogs at multiples of the shipped dataset sizes (1x, 10x, 100x by
+default), loads them with the bulk loaders and measures every lookup:
+
+- ingest rows/s per loader (including index builds, and the indication search index)
+- p50/p99 latency and throughput of each lookup, single-threaded and with 8 and 32 threads
+
+Synthetic drugs and interactions are copies of the shipped rows with numbered names, so
+class sizes and text lengths grow the way a larger catalog would. The medicine dataset is
+not shipped, so medicines are generated as in bench_ingest.py at its documented size.
+Results are written as JSON so runs can be compared for regressions.
+
+Usage:
+    python benchmarks/bench_lookups.py
+    python benchmarks/bench_lookups.py --scales 1 10 --ops 2000 --output results.json
+    python benchmarks/bench_lookups.py --read-model
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+# Add the project root to sys.path so the services package can be imported
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_ingest import write_synthetic_csv
+from services import comprehensive_drug_dbutil, indication_search, interactions_dbutil, medicine_dbutil, name_resolver, read_model
+
+
+DEFAULT_SCALES = (1, 10, 100)
+DEFAULT_THREADS = (1, 8, 32)
+DEFAULT_OPS = 5000               # lookups per function per thread count
+MEDICINE_BASE_ROWS = 11_825     # rows in medicine_info_dataset.csv
+MISS_RATE = 0.1                  # share of lookups for names that are not in the catalog
+
+
+def _load_shipped():
+    with open(comprehensive_drug_dbutil.CSV_PATH, newline="", encoding="utf-8") as f:
+        drugs = list(csv.DictReader(f))
+    with open(interactions_dbutil.JSON_PATH, encoding="utf-8") as f:
+        interactions = json.load(f)["ddi_database"]
+    return drugs, interactions
+
+
+def _copy_name(name, copy):
+    return name if copy == 0 else f"{name} {copy}"
+
+
+def write_synthetic_drugs(path, drugs, scale):
+    """
+    Write `scale` copies of the drug catalog; copies after the first get numbered names.
+    """
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(drugs[0]))
+        writer.writeheader()
+        for copy in range(scale):
+            for drug in drugs:
+                writer.writerow(dict(drug, **{"Generic Name": _copy_name(drug["Generic Name"], copy)}))
+    return len(drugs) * scale
+
+
+def write_synthetic_interactions(path, interactions, scale):
+    rows = []
+    for copy in range(scale):
+        for interaction in interactions:
+            rows.append(dict(
+                interaction,
+                interaction_id=len(rows) + 1,
+                drug_a=_copy_name(interaction["drug_a"], copy),
+                drug_b=_copy_name(interaction["drug_b"], copy),
+            ))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"ddi_database": rows}, f)
+    return len(rows)
+
+
+def timed_load(label, load, rows):
+    start = time.perf_counter()
+    load()
+    seconds = time.perf_counter() - start
+    print(f"  {label}: {rows:,} rows in {seconds:.2f}s ({rows / seconds:,.0f} rows/s incl. indexes)")
+    return {"rows": rows, "seconds": round(seconds, 4), "rows_per_s": round(rows / seconds)}
+
+
+def build_catalog(tmp, scale, drugs, interactions):
+    """
+    Generate and load all three databases for one scale. Returns the ingest results.
+    """
+    drugs_csv = os.path.join(tmp, "drugs.csv")
+    interactions_json = os.path.join(tmp, "interactions.json")
+    medicines_csv = os.path.join(tmp, "medicines.csv")
+
+    drug_rows = write_synthetic_drugs(drugs_csv, drugs, scale)
+    interaction_rows = write_synthetic_interactions(interactions_json, interactions, scale)
+    medicine_rows = MEDICINE_BASE_ROWS * scale
+    write_synthetic_csv(medicines_csv, medicine_rows)
+
+    comprehensive_drug_dbutil.DB_PATH = os.path.join(tmp, "comprehensive_drug.db")
+    interactions_dbutil.DB_PATH = os.path.join(tmp, "drug_interactions.db")
+    medicine_dbutil.DB_PATH = os.path.join(tmp, "medicine_info.db")
+
+    return {
+        "drugs": timed_load("drugs", lambda: comprehensive_drug_dbutil.insert_comprehensive_drugs_from_csv(
+            csv_path=drugs_csv), drug_rows),
+        "interactions": timed_load("interactions", lambda: interactions_dbutil.insert_interactions_from_json(
+            json_path=interactions_json), interaction_rows),
+        "medicines": timed_load("medicines", lambda: medicine_dbutil.insert_medicines_from_csv(
+            csv_path=medicines_csv), medicine_rows),
+    }
+
+
+def _sample(rng, values, count, miss):
+    return [miss if rng.random() < MISS_RATE else rng.choice(values) for _ in range(count)]
+
+
+def lookup_workloads(drugs, interactions, scale, count, seed=11):
+    """
+    Argument lists for each lookup, drawn from the catalog with MISS_RATE misses.
+    """
+    rng = random.Random(seed)
+    names = [_copy_name(d["Generic Name"], rng.randrange(scale)) for d in drugs for _ in range(2)]
+    classes = sorted({d["Drug Class"] for d in drugs})
+    pairs = []
+    for interaction in interactions:
+        copy = rng.randrange(scale)
+        pairs.append((_copy_name(interaction["drug_a"], copy), _copy_name(interaction["drug_b"], copy)))
+    medicine_terms = ["Para", "Ibup", "Cetirizine", "Metformin", "Omep", "Aspirin"]
+    indications = sorted({d["Indications"] for d in drugs}) + ["high blood pressure", "acid reflux", "condition 42"]
+
+    return {
+        "get_drug_details": [(n,) for n in _sample(rng, names, count, "Not A Drug")],
+        "get_drugs_by_class": [(c,) for c in _sample(rng, classes, count, "Not A Class")],
+        "check_drug_interaction": _sample(rng, pairs, count, ("Not A Drug", "Warfarin")),
+        "get_medicine_info": [(t,) for t in _sample(rng, medicine_terms, count, "zzzz")],
+        "search_by_indication": [(t,) for t in _sample(rng, indications, count, "zzzz")],
+    }
+
+
+LOOKUPS = {
+    "get_drug_details": comprehensive_drug_dbutil.get_drug_details,
+    "get_drugs_by_class": comprehensive_drug_dbutil.get_drugs_by_class,
+    "check_drug_interaction": interactions_dbutil.check_drug_interaction,
+    "get_medicine_info": medicine_dbutil.get_medicine_info,
+    "search_by_indication": indication_search.search_by_indication,
+}
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def measure(fn, args_list, threads):
+    """
+    Call fn once per args in args_list, spread over `threads` threads.
+    Returns p50/p99 latency in milliseconds and throughput in calls/s.
+    """
+    def run(chunk):
+        latencies = []
+        for args in chunk:
+            start = time.perf_counter()
+            fn(*args)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    chunks = [args_list[i::threads] for i in range(threads)]
+    start = time.perf_counter()
+    if threads == 1:
+        latencies = run(chunks[0])
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = [value for chunk in pool.map(run, chunks) for value in chunk]
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 4),
+        "ops_per_s": round(len(latencies) / wall),
+    }
+
+
+def bench_scale(scale, drugs, interactions, ops, threads_list, use_read_model):
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"\nScale {scale}x")
+        result = {"ingest": build_catalog(tmp, scale, drugs, interactions), "lookups": {}}
+
+        start = time.perf_counter()
+        name_resolver.get_resolver()
+        if use_read_model:
+            read_model.enable_read_model(snapshot_path=os.path.join(tmp, "read_model.snapshot"))
+        result["warmup_seconds"] = round(time.perf_counter() - start, 4)
+        print(f"  name resolver{' + read model' if use_read_model else ''} built in {result['warmup_seconds']:.2f}s")
+
+        workloads = lookup_workloads(drugs, interactions, scale, ops)
+        for name, fn in LOOKUPS.items():
+            # One untimed pass warms connections, statement caches and the fuzzy cache
+            measure(fn, workloads[name][:200], 1)
+            result["lookups"][name] = {}
+            for threads in threads_list:
+                stats = measure(fn, workloads[name], threads)
+                result["lookups"][name][str(threads)] = stats
+                print(f"  {name:<24} {threads:>2} threads  p50 {stats['p50_ms']:8.3f} ms  "
+                      f"p99 {stats['p99_ms']:8.3f} ms  {stats['ops_per_s']:>8,} ops/s")
+
+        read_model.disable_read_model()
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Week 3 lookups at growing catalog sizes")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES))
+    parser.add_argument("--threads", type=int, nargs="+", default=list(DEFAULT_THREADS))
+    parser.add_argument("--ops", type=int, default=DEFAULT_OPS, help="lookups per function per thread count")
+    parser.add_argument("--read-model", action="store_true", help="answer lookups from the in-process read model")
+    parser.add_argument("--output", default="bench_lookups.json", help="JSON results file")
+    args = parser.parse_args()
+
+    drugs, interactions = _load_shipped()
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "read_model": args.read_model,
+        "ops": args.ops,
+        "base_rows": {"drugs": len(drugs), "interactions": len(interactions), "medicines": MEDICINE_BASE_ROWS},
+        "scales": {},
+    }
+    for scale in args.scales:
+        report["scales"][f"{scale}x"] = bench_scale(scale, drugs, interactions, args.ops, args.threads,
+                                                    args.read_model)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
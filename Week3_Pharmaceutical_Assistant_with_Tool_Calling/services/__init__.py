@@ -7,20 +7,43 @@ __version__ = "0.1.0"
 __author__ = "Your Name"
 
 # Import main services/modules for easier access
-from .openfda_api import drug_lookup
+from .openfda_api import drug_lookup, drug_lookup_many
+from .openfda_client import OpenFDAClient
 from .medicine_dbutil import insert_medicines_from_csv,  get_medicine_info
-from .interactions_dbutil import insert_interactions_from_json, check_drug_interaction
-from .comprehensive_drug_dbutil import insert_comprehensive_drugs_from_csv, get_drugs_by_class, get_drug_details
+from .interactions_dbutil import insert_interactions_from_json, check_drug_interaction, check_interactions_matrix
+from .comprehensive_drug_dbutil import (
+    insert_comprehensive_drugs_from_csv, get_drugs_by_class, get_drug_details,
+    get_drug_details_many, get_therapeutic_alternatives
+)
 from .phase3_medicine_llm_schema import MEDICINE_TOOLS
+from .backend_pool import Backend, BackendPool
+from .dataset_sync import sync_dataset, rebuild_dataset, get_dataset_version
+from .name_resolver import resolve_name
+from .read_model import enable_read_model, disable_read_model
+from .indication_search import search_by_indication
 
 __all__ = [
     "drug_lookup",
+    "drug_lookup_many",
+    "OpenFDAClient",
     "insert_medicines_from_csv",
     "get_medicine_info",
     "insert_interactions_from_json",
     "check_drug_interaction",
+    "check_interactions_matrix",
     "insert_comprehensive_drugs_from_csv",
     "get_drugs_by_class",
     "get_drug_details",
-    "MEDICINE_TOOLS"
+    "get_drug_details_many",
+    "get_therapeutic_alternatives",
+    "MEDICINE_TOOLS",
+    "Backend",
+    "BackendPool",
+    "sync_dataset",
+    "rebuild_dataset",
+    "get_dataset_version",
+    "resolve_name",
+    "enable_read_model",
+    "disable_read_model",
+    "search_by_indication"
 ]
\ No newline at end of file
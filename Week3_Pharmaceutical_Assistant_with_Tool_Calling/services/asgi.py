@@ -0,0 +1,113 @@
+"""
+ASGI Helpers
+
+The small pieces shared by the framework-free ASGI apps (server.py, gateway.py): reading a
+request body, writing JSON and streamed responses, and admission control.
+"""
+
+import asyncio
+import contextlib
+import json
+
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class ServerBusy(Exception):
+    """
+    Raised when every slot is taken and the wait queue is full.
+    """
+
+
+class Admission:
+    """
+    At most max_concurrency holders of slot() at once; up to max_queue more wait for one,
+    and anyone beyond that gets ServerBusy straight away.
+    """
+
+    def __init__(self, max_concurrency, max_queue):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.waiting = 0
+        self.stats = {"admitted": 0, "rejected": 0}
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise ServerBusy(f"{self.active} requests running and {self.waiting} waiting")
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.stats["admitted"] += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def get_stats(self):
+        return dict(self.stats, active=self.active, waiting=self.waiting,
+                    max_concurrency=self.max_concurrency, max_queue=self.max_queue)
+
+
+async def read_body(receive, limit=MAX_BODY_BYTES):
+    """
+    The complete request body, or None if the client disconnected.
+    Raises ValueError when it is larger than limit.
+    """
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if len(body) > limit:
+            raise ValueError("Request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+def request_headers(scope):
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", ())}
+
+
+def encode_json(payload):
+    """
+    One JSON line (NDJSON), as bytes.
+    """
+    return (json.dumps(payload, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def send_json(send, status, payload, headers=()):
+    body = encode_json(payload)
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def start_stream(send, content_type, status=200):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"cache-control", b"no-cache")],
+    })
+
+
+async def send_chunk(send, data):
+    await send({"type": "http.response.body", "body": data, "more_body": True})
+
+
+async def end_stream(send):
+    await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,336 @@
+"""
+Backend Pool for OpenAI-compatible endpoints
+
+Spreads chat completions over several OpenAI-compatible backends (e.g. a
+multi-node Ollama setup) instead of a single hard-coded base_url.
+Each backend tracks its own time-to-first-token so the pool can send hedged
+requests: if the primary has not produced a token after its p95 latency,
+the same request goes to a second replica and whichever stream yields a
+token first wins. The losing stream is closed. Only content or tool call
+deltas count as tokens; the role-only delta that OpenAI-compatible servers
+send straight away does not.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+
+
+DEFAULT_HEDGE_DELAY = 1.0      # seconds, used until a backend has latency samples
+MIN_HEDGE_DELAY = 0.05         # never hedge faster than this
+LATENCY_WINDOW = 200           # number of recent samples kept per backend
+HEALTH_CHECK_TIMEOUT = 2.0
+
+
+class Backend:
+    """
+    A single OpenAI-compatible endpoint with health and latency tracking.
+    """
+
+    def __init__(self, base_url, api_key="ollama", name=None, window=LATENCY_WINDOW, client=None):
+        if client is None:
+            from openai import OpenAI
+
+            client = OpenAI(base_url=base_url, api_key=api_key)
+        self.base_url = base_url
+        self.name = name or base_url
+        self.client = client
+        self.healthy = True
+        self.in_flight = 0
+        self.failures = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def percentile(self, q):
+        """
+        Return the q-th percentile (0-1) of recent time-to-first-token samples,
+        or None if no samples have been recorded yet.
+        """
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def check_health(self, timeout=HEALTH_CHECK_TIMEOUT):
+        """
+        Probe the backend's /models endpoint and update the healthy flag.
+        """
+        try:
+            self.client.with_options(timeout=timeout, max_retries=0).models.list()
+            self.healthy = True
+        except Exception as e:
+            print(f"Backend {self.name} failed health check: {e}")
+            self.healthy = False
+        return self.healthy
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "failures": self.failures,
+            "p50_ttft": self.percentile(0.50),
+            "p95_ttft": self.percentile(0.95),
+        }
+
+
+def _has_token(chunk):
+    """
+    True if a streamed chunk carries generated content or tool calls.
+    """
+    if not chunk.choices:
+        return False
+    delta = chunk.choices[0].delta
+    return bool(getattr(delta, "content", None) or getattr(delta, "tool_calls", None))
+
+
+class _Attempt:
+    """
+    One in-flight streaming request. Cancelling closes the HTTP response so
+    a slow backend stops generating instead of running to completion.
+    """
+
+    def __init__(self):
+        self.stream = None
+        self._cancelled = threading.Event()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        stream = self.stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+
+class BackendPool:
+    """
+    Pool of OpenAI-compatible backends with health checks and hedged requests.
+
+    Usage:
+        pool = BackendPool.from_urls(["http://node1:11434/v1", "http://node2:11434/v1"])
+        pool.start_health_checks()
+        for chunk in pool.stream_chat(model="mistral", messages=messages):
+            ...
+    """
+
+    def __init__(self, backends, hedge_percentile=0.95,
+                 default_hedge_delay=DEFAULT_HEDGE_DELAY, min_hedge_delay=MIN_HEDGE_DELAY):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.backends = list(backends)
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_urls(cls, base_urls, api_key="ollama", **kwargs):
+        return cls([Backend(url, api_key=api_key) for url in base_urls], **kwargs)
+
+    # ------------------------------------------------------------------
+    # Health checks
+    # ------------------------------------------------------------------
+
+    def check_health(self):
+        return {backend.name: backend.check_health() for backend in self.backends}
+
+    def start_health_checks(self, interval=10.0):
+        """
+        Run health checks in a daemon thread every `interval` seconds.
+        """
+        if self._health_thread and self._health_thread.is_alive():
+            return
+
+        def _loop():
+            while not self._stop.is_set():
+                self.check_health()
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._health_thread = threading.Thread(target=_loop, name="backend-health", daemon=True)
+        self._health_thread.start()
+
+    def stop_health_checks(self):
+        self._stop.set()
+
+    # ------------------------------------------------------------------
+    # Selection
+    # ------------------------------------------------------------------
+
+    def ranked_backends(self):
+        """
+        Healthy backends first, ordered by load and then by median latency.
+        Falls back to every backend if none are marked healthy.
+        """
+        candidates = [b for b in self.backends if b.healthy] or list(self.backends)
+
+        def _key(backend):
+            p50 = backend.percentile(0.50)
+            return (backend.in_flight, p50 if p50 is not None else float("inf"))
+
+        return sorted(candidates, key=_key)
+
+    def hedge_delay(self, backend):
+        p = backend.percentile(self.hedge_percentile)
+        if p is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, p)
+
+    def stats(self):
+        return [backend.stats() for backend in self.backends]
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+
+    def _pump(self, backend, kwargs, events, attempt):
+        """
+        Run one streaming request and forward its chunks to the events queue.
+        """
+        backend.acquire()
+        start = time.perf_counter()
+        try:
+            stream = backend.client.chat.completions.create(stream=True, **kwargs)
+            attempt.stream = stream
+            if attempt.is_cancelled():
+                stream.close()
+                return
+            with stream:
+                first = True
+                for chunk in stream:
+                    if attempt.is_cancelled():
+                        break
+                    if first and _has_token(chunk):
+                        backend.record_latency(time.perf_counter() - start)
+                        first = False
+                    events.put((backend, "chunk", chunk))
+            events.put((backend, "done", None))
+        except Exception as e:
+            if not attempt.is_cancelled():
+                backend.record_failure()
+            events.put((backend, "error", e))
+        finally:
+            backend.release()
+
+    def stream_chat(self, hedge=True, **kwargs):
+        """
+        Stream a chat completion, hedging to a second backend when the first
+        is slower than its p95 time-to-first-token.
+
+        Accepts the same keyword arguments as client.chat.completions.create
+        (stream is always enabled). Yields ChatCompletionChunk objects from
+        the winning backend only.
+        """
+        remaining = self.ranked_backends()
+        events = queue.Queue()
+        attempts = {}
+        preludes = {}       # chunks received before a backend's first token
+        winner = None
+        last_error = None
+
+        def _launch():
+            backend = remaining.pop(0)
+            attempts[backend] = _Attempt()
+            threading.Thread(
+                target=self._pump,
+                args=(backend, kwargs, events, attempts[backend]),
+                daemon=True,
+            ).start()
+            return backend
+
+        primary = _launch()
+        deadline = time.monotonic() + self.hedge_delay(primary)
+        active = 1
+
+        try:
+            while True:
+                timeout = None
+                if winner is None and hedge and remaining:
+                    timeout = max(0.0, deadline - time.monotonic())
+                try:
+                    backend, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    # Primary is slower than its p95 - send the same request to a replica
+                    hedged = _launch()
+                    deadline = time.monotonic() + self.hedge_delay(hedged)
+                    active += 1
+                    continue
+
+                if winner is None:
+                    if kind == "chunk":
+                        if not _has_token(payload):
+                            preludes.setdefault(backend, []).append(payload)
+                            continue
+                        winner = backend
+                        for other, attempt in attempts.items():
+                            if other is not winner:
+                                attempt.cancel()
+                        yield from preludes.pop(backend, [])
+                        yield payload
+                        continue
+
+                    active -= 1
+                    prelude = preludes.pop(backend, [])
+                    if kind == "error":
+                        last_error = payload
+                    if kind == "done":
+                        # Stream finished without any token; nothing to hedge
+                        yield from prelude
+                        return
+                    if remaining and (active == 0 or not hedge):
+                        # Fail over; the replacement gets its own hedge delay
+                        replacement = _launch()
+                        deadline = time.monotonic() + self.hedge_delay(replacement)
+                        active += 1
+                    elif active == 0:
+                        raise last_error
+                    continue
+
+                if backend is not winner:
+                    continue
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    return
+                else:
+                    raise payload
+        finally:
+            for attempt in attempts.values():
+                attempt.cancel()
+
+    def chat(self, **kwargs):
+        """
+        Non-streaming convenience wrapper around stream_chat.
+        Returns the full assistant text.
+        """
+        parts = []
+        for chunk in self.stream_chat(**kwargs):
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        return "".join(parts)
@@ -0,0 +1,127 @@
+"""
+Bulk Streaming Loader
+
+Chunked ingest helpers shared by the medicine, interaction and comprehensive drug loaders.
+Source files are read in batches (CSV via pandas chunks, JSON via ijson when available) and
+written with executemany inside large transactions. Callers create indexes after the load,
+which is much cheaper than maintaining them row by row.
+"""
+
+import json
+import sqlite3
+import time
+
+import pandas as pd
+
+try:
+    import ijson  # optional: streams large JSON files instead of loading them whole
+except ImportError:
+    ijson = None
+
+
+DEFAULT_BATCH_SIZE = 50_000
+COMMIT_EVERY = 500_000           # rows per transaction
+
+LOADER_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",   # 256 MB while loading
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def tune_for_load(conn):
+    """
+    Apply pragmas that trade durability for speed during a bulk load.
+    A crash mid-load just means re-running the loader.
+    """
+    for pragma in LOADER_PRAGMAS:
+        conn.execute(pragma)
+
+
+def iter_csv_batches(csv_path, columns, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield lists of row tuples from a CSV file, batch_size rows at a time.
+    `columns` is the ordered list of CSV headers to extract.
+    """
+    reader = pd.read_csv(csv_path, usecols=columns, chunksize=batch_size, dtype=object)
+    for chunk in reader:
+        # pandas uses NaN for empty cells; SQLite expects NULL
+        chunk = chunk[columns].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield list(chunk.itertuples(index=False, name=None))
+
+
+def iter_json_batches(json_path, key, fields, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield lists of row tuples from the array stored under `key` in a JSON file.
+    Uses ijson to stream the file when installed, otherwise loads it with json.
+    """
+    with open(json_path, 'rb') as f:
+        if ijson is not None:
+            records = ijson.items(f, f'{key}.item', use_float=True)
+        else:
+            records = json.load(f)[key]
+
+        batch = []
+        for record in records:
+            batch.append(tuple(record.get(field) for field in fields))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _insert_rows_individually(cursor, insert_sql, batch, skipped_rows, offset):
+    for i, row in enumerate(batch):
+        try:
+            cursor.execute(insert_sql, row)
+        except sqlite3.Error as e:
+            skipped_rows.append((offset + i, row[0], str(e)))
+
+
+def bulk_insert(conn, insert_sql, batches, commit_every=COMMIT_EVERY, skipped_rows=None):
+    """
+    Insert batches of rows with executemany, committing every `commit_every` rows.
+
+    If a batch fails (e.g. a NOT NULL violation), that batch is retried row by row and
+    the failing rows are appended to skipped_rows as (row_number, first_column, error).
+
+    Returns (rows_inserted, elapsed_seconds).
+    """
+    if skipped_rows is None:
+        skipped_rows = []
+
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    rows_seen = 0
+    skipped_before = len(skipped_rows)
+    uncommitted = 0
+
+    for batch in batches:
+        if not conn.in_transaction:
+            cursor.execute('BEGIN')
+        try:
+            cursor.execute('SAVEPOINT batch')
+            cursor.executemany(insert_sql, batch)
+            cursor.execute('RELEASE batch')
+        except sqlite3.Error:
+            cursor.execute('ROLLBACK TO batch')
+            cursor.execute('RELEASE batch')
+            _insert_rows_individually(cursor, insert_sql, batch, skipped_rows, rows_seen)
+
+        rows_seen += len(batch)
+        uncommitted += len(batch)
+        if uncommitted >= commit_every:
+            conn.commit()
+            uncommitted = 0
+
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    return rows_seen - (len(skipped_rows) - skipped_before), elapsed
+
+
+def report_rate(label, rows, seconds):
+    rate = rows / seconds if seconds > 0 else float('inf')
+    print(f"✓ {label}: {rows:,} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
+    return rate
@@ -1,18 +1,104 @@
-import json
-import sqlite3
-import pandas as pd
 import os
+import time
 
+from .db_connection import resolve_path, connect_writer, fetch_all, fetch_one, invalidate
+from .bulk_loader import DEFAULT_BATCH_SIZE, iter_csv_batches, bulk_insert, tune_for_load, report_rate
+from .indication_search import build_indication_index
+from .name_resolver import resolve_name
+from .read_model import active_read_model
+from .tool_registry import tool, param
 
-DB_PATH = 'db/comprehensive_drug.db'
-CSV_PATH = 'dataset/comprehensive_drug_database.csv'
 
-def initialize_comprehensive_drug_db():
+DB_PATH = resolve_path('db/comprehensive_drug.db')
+CSV_PATH = resolve_path('dataset/comprehensive_drug_database.csv')
+
+CSV_COLUMNS = [
+    'Generic Name', 'Drug Class', 'Indications', 'Dosage Form', 'Strength',
+    'Route of Administration', 'Side Effects', 'Contraindications',
+    'Interaction Warnings & Precautions', 'Availability'
+]
+
+INSERT_DRUG_SQL = '''
+    INSERT OR IGNORE INTO drugs (
+        generic_name, drug_class, indications, dosage_form, strength,
+        route_of_administration, side_effects, contraindications,
+        interaction_warnings, availability
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+DRUGS_BY_CLASS_SQL = '''
+    SELECT generic_name, drug_class, indications, side_effects, availability
+    FROM drugs
+    WHERE drug_class = ?
+'''
+
+DRUG_DETAILS_SQL = '''
+    SELECT generic_name, drug_class, indications, dosage_form, strength,
+           route_of_administration, side_effects, contraindications,
+           interaction_warnings, availability
+    FROM drugs
+    WHERE generic_name = ?
+'''
+
+# Placeholders are padded to the next bucket size so the statement cache sees a handful
+# of distinct IN (...) queries instead of one per list length
+IN_LIST_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+DRUG_DETAILS_MANY_SQL = {
+    size: DRUG_DETAILS_SQL.replace('WHERE generic_name = ?', f'WHERE generic_name IN ({", ".join("?" * size)})')
+    for size in IN_LIST_BUCKETS
+}
+
+# Self-join: the queried drug's class and every other drug in it, in one round trip.
+# LEFT JOIN so a drug that is alone in its class still returns its own row.
+THERAPEUTIC_ALTERNATIVES_SQL = '''
+    SELECT q.generic_name, q.drug_class,
+           d.generic_name, d.drug_class, d.indications, d.side_effects, d.availability
+    FROM drugs q
+    LEFT JOIN drugs d ON d.drug_class = q.drug_class AND d.generic_name != q.generic_name
+    WHERE q.generic_name = ?
+'''
+
+DETAIL_FIELDS = [
+    "generic_name", "drug_class", "indications", "dosage_form", "strength",
+    "route_of_administration", "side_effects", "contraindications",
+    "interaction_warnings", "availability"
+]
+
+def create_comprehensive_drug_indexes(conn):
+    """
+    Create lookup indexes and the indication search index.
+    Bulk loaders call this after the data is in place.
+    """
+    cursor = conn.cursor()
+
+    #Drop existing indexes if they exist
+    cursor.execute('DROP INDEX IF EXISTS idx_generic_name')
+    cursor.execute('DROP INDEX IF EXISTS idx_drug_class')
+    cursor.execute('DROP INDEX IF EXISTS idx_availability')
+
+    #-- Index on generic_name for fast lookup
+    cursor.execute('CREATE INDEX idx_generic_name ON drugs(generic_name);')
+
+    #-- Index on drug_class for finding therapeutic alternatives
+    cursor.execute('CREATE INDEX idx_drug_class ON drugs(drug_class);')
+
+    #-- Index on availability (OTC vs Prescription)
+    cursor.execute('CREATE INDEX idx_availability ON drugs(availability);')
+
+    #-- TF-IDF index over indications for search_by_indication
+    build_indication_index(conn, "drugs")
+
+    conn.commit()
+
+
+def initialize_comprehensive_drug_db(create_indexes=True, db_path=None):
     """
     Create SQLite database and schema.
     Drops existing table and creates fresh one.
+    Pass create_indexes=False when indexes are built after a bulk load.
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_writer(db_path or DB_PATH)
     cursor = conn.cursor()
     
     # Drop existing table if it exists
@@ -35,94 +121,67 @@ def initialize_comprehensive_drug_db():
             )
         ''')
     
-    #Drop existing indexes if they exist
-    cursor.execute('DROP INDEX IF EXISTS idx_generic_name')
-    cursor.execute('DROP INDEX IF EXISTS idx_drug_class')
-    cursor.execute('DROP INDEX IF EXISTS idx_availability')
-
-    #-- Index on generic_name for fast lookup
-    cursor.execute('CREATE INDEX idx_generic_name ON drugs(generic_name);')
-
-    #-- Index on drug_class for finding therapeutic alternatives
-    cursor.execute('CREATE INDEX idx_drug_class ON drugs(drug_class);')
+    conn.commit()
 
-    #-- Index on availability (OTC vs Prescription)
-    cursor.execute('CREATE INDEX idx_availability ON drugs(availability);')
+    if create_indexes:
+        create_comprehensive_drug_indexes(conn)
 
-    conn.commit()
     conn.close()
     print("✓ Database schema created successfully!")
         
 
-def insert_comprehensive_drugs_from_csv():
+def insert_comprehensive_drugs_from_csv(csv_path=None, batch_size=DEFAULT_BATCH_SIZE, db_path=None):
     """
-    Read drug data from CSV and insert into database.
+    Stream drug data from CSV into the database.
+    Rows are inserted in batches with executemany; indexes are built after the load.
     """
+    csv_path = csv_path or CSV_PATH
+    db_path = db_path or DB_PATH
 
-    initialize_comprehensive_drug_db()  # Ensure DB is initialized before inserting data
-
-    if not os.path.exists(CSV_PATH):
-        print(f"Error: CSV file not found at {CSV_PATH}")
+    if not os.path.exists(csv_path):
+        print(f"Error: CSV file not found at {csv_path}")
         return
+
+    # Ensure DB is initialized before inserting data (indexes come after the load)
+    initialize_comprehensive_drug_db(create_indexes=False, db_path=db_path)
+    
+    conn = connect_writer(db_path)
+    tune_for_load(conn)
     
     try:
-        df = pd.read_csv(CSV_PATH)
-    except Exception as e:
+        batches = iter_csv_batches(csv_path, CSV_COLUMNS, batch_size=batch_size)
+        rows, seconds = bulk_insert(conn, INSERT_DRUG_SQL, batches)
+    except (ValueError, UnicodeDecodeError) as e:
+        # pandas raises ParserError (a ValueError) for malformed files or missing columns
         print(f"Error reading CSV file: {e}")
+        conn.close()
         return
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    for _, row in df.iterrows():
-        try:
-            cursor.execute('''
-                INSERT OR IGNORE INTO drugs (
-                    generic_name, drug_class, indications, dosage_form, strength,
-                    route_of_administration, side_effects, contraindications,
-                    interaction_warnings, availability
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                row['Generic Name'],
-                row['Drug Class'],
-                row['Indications'],
-                row['Dosage Form'],
-                row['Strength'],
-                row['Route of Administration'],
-                row['Side Effects'],
-                row['Contraindications'],
-                row['Interaction Warnings & Precautions'],
-                row['Availability']
-            ))
-        except Exception as e:
-            print(f"Error inserting row into database: {e}")
-    
-    conn.commit()
+    index_start = time.perf_counter()
+    create_comprehensive_drug_indexes(conn)
+    index_seconds = time.perf_counter() - index_start
     
     # Verify import
-    cursor.execute('SELECT COUNT(*) FROM drugs')
-    count = cursor.fetchone()[0]
+    count = conn.execute('SELECT COUNT(*) FROM drugs').fetchone()[0]
     
     conn.close()
+    invalidate(db_path)
     print(f"✓ Drug data inserted successfully!")
     print(f"✓ Total records inserted: {count}")
+    report_rate("Drug load", rows, seconds)
+    print(f"✓ Indexes built in {index_seconds:.2f}s")
+    return count
 
 
 def get_drugs_by_class(drug_class):
     """
     Retrieve all drugs in a specific drug class (for therapeutic alternatives).
+    The class name is resolved first, so "nsaids" finds "NSAID".
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT generic_name, drug_class, indications, side_effects, availability
-        FROM drugs
-        WHERE drug_class = ?
-    ''', (drug_class,))
-    
-    results = cursor.fetchall()
-    conn.close()
+    resolved = resolve_name(drug_class, "drug_classes")
+    class_name = resolved["name"] if resolved else drug_class
+    model = active_read_model("drugs")
+    results = model.class_rows(class_name) if model else fetch_all(DB_PATH, DRUGS_BY_CLASS_SQL, (class_name,))
     
     if results:
         return [
@@ -140,33 +199,123 @@ def get_drugs_by_class(drug_class):
 def get_drug_details(generic_name):
     """
     Get complete details of a specific drug by generic name.
+    The name is resolved first (case, aliases, typos); match_confidence reports how closely
+    the stored name matched and resolved_from holds the original query when it was corrected.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT generic_name, drug_class, indications, dosage_form, strength,
-               route_of_administration, side_effects, contraindications,
-               interaction_warnings, availability
-        FROM drugs
-        WHERE generic_name = ?
-    ''', (generic_name,))
-    
-    result = cursor.fetchone()
-    conn.close()
+    resolved = resolve_name(generic_name, "drugs")
+    lookup_name = resolved["name"] if resolved else generic_name
+    model = active_read_model("drugs")
+    result = model.drug_row(lookup_name) if model else fetch_one(DB_PATH, DRUG_DETAILS_SQL, (lookup_name,))
     
     if result:
-        return {
-            "generic_name": result[0],
-            "drug_class": result[1],
-            "indications": result[2],
-            "dosage_form": result[3],
-            "strength": result[4],
-            "route_of_administration": result[5],
-            "side_effects": result[6],
-            "contraindications": result[7],
-            "interaction_warnings": result[8],
-            "availability": result[9]
-        }
+        return _details_with_match(result, generic_name, resolved)
     
-    return None
\ No newline at end of file
+    return None
+
+
+def _details_with_match(row, query, resolved):
+    details = dict(zip(DETAIL_FIELDS, row))
+    details["match_confidence"] = resolved["confidence"] if resolved else 1.0
+    if resolved and resolved["method"] != "exact":
+        details["resolved_from"] = query
+    return details
+
+
+def _bucket_size(count):
+    for size in IN_LIST_BUCKETS:
+        if size >= count:
+            return size
+    return None
+
+
+@tool(
+    name="compare_drugs",
+    description="Compare multiple drugs side-by-side. Returns detailed information on each drug including indications, side effects, dosage, route of administration, availability, and contraindications for easy comparison.",
+    params={
+        "drug_list": param("List of drug names to compare (e.g., ['Aspirin', 'Ibuprofen', 'Naproxen'])",
+                           type="array", items="string", maps_to="generic_names"),
+    },
+    datasets=("drugs",),
+    result_key="comparison",
+    paginate=True,
+    rows_key="comparison",
+    keep_fields=("generic_name",),
+)
+def get_drug_details_many(generic_names):
+    """
+    Get complete details for several drugs with one IN (...) query.
+    Results keep the input order; names that are not found come back as
+    {"generic_name": name, "error": "Drug not found"}.
+    """
+    resolutions = [resolve_name(name, "drugs") for name in generic_names]
+    lookup_names = [r["name"] if r else name for name, r in zip(generic_names, resolutions)]
+    unique_names = list(dict.fromkeys(lookup_names))
+
+    rows = {}
+    model = active_read_model("drugs")
+    if model:
+        rows = {row[0]: row for row in model.drug_rows(unique_names)}
+        unique_names = []
+
+    chunk_size = IN_LIST_BUCKETS[-1]
+    for start in range(0, len(unique_names), chunk_size):
+        chunk = unique_names[start:start + chunk_size]
+        size = _bucket_size(len(chunk))
+        params = chunk + [chunk[-1]] * (size - len(chunk))
+        for row in fetch_all(DB_PATH, DRUG_DETAILS_MANY_SQL[size], params):
+            rows[row[0]] = row
+
+    results = []
+    for name, lookup_name, resolved in zip(generic_names, lookup_names, resolutions):
+        row = rows.get(lookup_name)
+        if row:
+            results.append(_details_with_match(row, name, resolved))
+        else:
+            results.append({"generic_name": name, "error": "Drug not found"})
+    return results
+
+
+@tool(
+    description="Find therapeutic alternatives for a given drug. Returns other drugs in the same therapeutic class with their indications, side effects, dosage forms, and availability (OTC/Prescription).",
+    params={
+        "drug_name": param("The drug name to find alternatives for (e.g., 'Aspirin', 'Ibuprofen')", maps_to="generic_name"),
+    },
+    datasets=("drugs",),
+    on_empty={"error": "Drug {drug_name} not found in database"},
+    paginate=True,
+    rows_key="alternatives",
+    default_limit=10,
+    keep_fields=("generic_name",),
+)
+def get_therapeutic_alternatives(generic_name):
+    """
+    Find other drugs in the same class as generic_name with a single self-join query.
+    The queried drug itself is excluded from the alternatives.
+    Returns None if the drug is not found.
+    """
+    resolved = resolve_name(generic_name, "drugs")
+    lookup_name = resolved["name"] if resolved else generic_name
+    model = active_read_model("drugs")
+    if model:
+        results = model.alternative_rows(lookup_name)
+    else:
+        results = fetch_all(DB_PATH, THERAPEUTIC_ALTERNATIVES_SQL, (lookup_name,))
+
+    if not results:
+        return None
+
+    alternatives = [
+        {
+            "generic_name": row[2],
+            "drug_class": row[3],
+            "indications": row[4],
+            "side_effects": row[5],
+            "availability": row[6]
+        } for row in results if row[2] is not None
+    ]
+    return {
+        "drug_name": results[0][0],
+        "drug_class": results[0][1],
+        "alternatives": alternatives,
+        "match_confidence": resolved["confidence"] if resolved else 1.0
+    }
\ No newline at end of file
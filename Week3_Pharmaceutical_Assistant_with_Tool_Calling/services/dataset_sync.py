@@ -0,0 +1,339 @@
+"""
+Dataset Sync
+
+Refreshes the three Week 3 databases without DROP TABLE rebuilds in front of live readers.
+
+Two modes:
+- sync_dataset: incremental. Every source row is hashed and compared against the hashes
+  stored with the database; only inserts, updates and deletes are applied, in a single
+  WAL transaction, so readers keep seeing the previous version until it commits.
+- rebuild_dataset: full rebuild into a side file which is then copied over the live
+  database in one transaction with the SQLite backup API. Readers never see an empty or
+  partially loaded table.
+
+Each applied change is recorded in a dataset_versions table (see get_dataset_version).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from . import medicine_dbutil, interactions_dbutil, comprehensive_drug_dbutil
+from .bulk_loader import DEFAULT_BATCH_SIZE, iter_csv_batches, iter_json_batches
+from .db_connection import connect_writer, fetch_one, invalidate
+from .indication_search import build_indication_index
+
+
+SYNC_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS sync_rows (
+        row_key TEXT PRIMARY KEY,
+        row_hash TEXT NOT NULL,
+        row_id INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS dataset_versions (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        mode TEXT NOT NULL,
+        source_hash TEXT NOT NULL,
+        inserted INTEGER NOT NULL,
+        updated INTEGER NOT NULL,
+        deleted INTEGER NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    ''',
+)
+
+LATEST_VERSION_SQL = '''
+    SELECT version, mode, source_hash, inserted, updated, deleted, applied_at
+    FROM dataset_versions
+    ORDER BY version DESC
+    LIMIT 1
+'''
+
+# key_columns identify a row across refreshes. The medicine dataset has no natural key, so the
+# whole row is the key there: a changed medicine shows up as one delete plus one insert.
+DATASETS = {
+    "medicines": {
+        "module": medicine_dbutil,
+        "table": "medicines",
+        "columns": ["medicine_name", "composition", "manufacturer", "uses", "side_effects"],
+        "key_columns": ["medicine_name", "composition", "manufacturer", "uses", "side_effects"],
+        "unique_key": False,
+        "source_attr": "CSV_PATH",
+        "load": medicine_dbutil.insert_medicines_from_csv,
+        "read_source": lambda path, batch_size: iter_csv_batches(
+            path, medicine_dbutil.CSV_COLUMNS, batch_size=batch_size),
+    },
+    "interactions": {
+        "module": interactions_dbutil,
+        "table": "drug_interactions",
+        "columns": interactions_dbutil.JSON_FIELDS,
+        "key_columns": ["interaction_id"],
+        "unique_key": True,
+        "source_attr": "JSON_PATH",
+        "load": interactions_dbutil.insert_interactions_from_json,
+        "read_source": lambda path, batch_size: iter_json_batches(
+            path, 'ddi_database', interactions_dbutil.JSON_FIELDS, batch_size=batch_size),
+    },
+    "drugs": {
+        "module": comprehensive_drug_dbutil,
+        "table": "drugs",
+        "columns": [
+            "generic_name", "drug_class", "indications", "dosage_form", "strength",
+            "route_of_administration", "side_effects", "contraindications",
+            "interaction_warnings", "availability"
+        ],
+        "key_columns": ["generic_name"],
+        "unique_key": True,
+        "source_attr": "CSV_PATH",
+        "load": comprehensive_drug_dbutil.insert_comprehensive_drugs_from_csv,
+        "read_source": lambda path, batch_size: iter_csv_batches(
+            path, comprehensive_drug_dbutil.CSV_COLUMNS, batch_size=batch_size),
+    },
+}
+
+
+def _get_spec(name):
+    if name not in DATASETS:
+        available = ", ".join(DATASETS.keys())
+        raise ValueError(f"Unknown dataset '{name}'. Available: {available}")
+    return DATASETS[name]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _row_hash(row):
+    payload = json.dumps(row, separators=(',', ':'), default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _keyed_rows(spec, records):
+    """
+    Yield (row_key, row_hash, tag, row) for each (tag, row) record, in order.
+
+    For unique keys only the first occurrence is kept (matching INSERT OR IGNORE).
+    For non-unique keys repeated rows get an occurrence suffix so each copy is tracked.
+    """
+    key_index = [spec["columns"].index(column) for column in spec["key_columns"]]
+    seen = {}
+    for tag, row in records:
+        base_key = json.dumps([row[i] for i in key_index], separators=(',', ':'), default=str)
+        occurrence = seen.get(base_key, 0)
+        seen[base_key] = occurrence + 1
+        if occurrence and spec["unique_key"]:
+            continue
+        row_key = f"{base_key}#{occurrence}" if occurrence else base_key
+        yield row_key, _row_hash(list(row)), tag, row
+
+
+def _record_version(conn, mode, source_hash, inserted, updated, deleted, version=None):
+    conn.execute('''
+        INSERT INTO dataset_versions (version, mode, source_hash, inserted, updated, deleted, applied_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (version, mode, source_hash, inserted, updated, deleted, datetime.now().isoformat()))
+
+
+def _index_table(conn, spec):
+    """
+    Populate sync_rows from the rows currently stored in the table.
+    """
+    for statement in SYNC_SCHEMA:
+        conn.execute(statement)
+    conn.execute('DELETE FROM sync_rows')
+
+    columns = ", ".join(spec["columns"])
+    cursor = conn.execute(f'SELECT rowid, {columns} FROM {spec["table"]} ORDER BY rowid')
+    records = ((row[0], row[1:]) for row in cursor)
+    entries = [(row_key, row_hash, row_id) for row_key, row_hash, row_id, _ in _keyed_rows(spec, records)]
+    conn.executemany('INSERT INTO sync_rows (row_key, row_hash, row_id) VALUES (?, ?, ?)', entries)
+
+
+def get_dataset_version(name):
+    """
+    Return the latest applied version of a dataset as a dict, or None if it was never synced.
+    """
+    spec = _get_spec(name)
+    try:
+        row = fetch_one(spec["module"].DB_PATH, LATEST_VERSION_SQL)
+    except sqlite3.Error:
+        return None
+    if not row:
+        return None
+    return {
+        "version": row[0],
+        "mode": row[1],
+        "source_hash": row[2],
+        "inserted": row[3],
+        "updated": row[4],
+        "deleted": row[5],
+        "applied_at": row[6],
+    }
+
+
+def _has_sync_state(db_path):
+    if not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('sync_rows', 'dataset_versions')"
+        ).fetchone()
+        return row[0] == 2
+    finally:
+        conn.close()
+
+
+def rebuild_dataset(name, source_path=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Full rebuild into a side file, then copy it over the live database in one transaction.
+
+    Read transactions that are already open finish on the old data; later ones see the
+    new data as a whole. Returns the recorded version dict.
+    """
+    spec = _get_spec(name)
+    module = spec["module"]
+    db_path = module.DB_PATH
+    source_path = source_path or getattr(module, spec["source_attr"])
+    side_path = f"{db_path}.building"
+
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(side_path + suffix):
+            os.remove(side_path + suffix)
+
+    # Version numbers keep increasing across rebuilds so they can be used as cache keys
+    previous = get_dataset_version(name)
+    next_version = previous["version"] + 1 if previous else 1
+
+    count = spec["load"](source_path, batch_size=batch_size, db_path=side_path)
+    if count is None:
+        raise RuntimeError(f"Failed to build dataset '{name}' from {source_path}")
+
+    conn = connect_writer(side_path)
+    _index_table(conn, spec)
+    _record_version(conn, "rebuild", file_hash(source_path), count, 0, 0, version=next_version)
+    conn.commit()
+    conn.close()
+
+    _copy_into_place(side_path, db_path)
+    print(f"✓ Rebuilt '{name}' and copied it into place ({count:,} rows)")
+    return get_dataset_version(name)
+
+
+def _copy_into_place(side_path, db_path):
+    """
+    Copy side_path over the live database with the SQLite backup API, then remove it.
+
+    The copy is a single write transaction on db_path, so it goes through the live WAL
+    like any other write instead of replacing the file under the -wal/-shm that every
+    process shares: readers already inside a read transaction finish on the old data, and
+    the next read transaction sees the new data as a whole. A writer holding the lock
+    delays the copy; readers never do.
+    """
+    if not os.path.exists(db_path):
+        os.replace(side_path, db_path)
+        invalidate(db_path)
+        return
+
+    source = sqlite3.connect(side_path)
+    target = connect_writer(db_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    os.remove(side_path)
+    invalidate(db_path)
+
+
+def sync_dataset(name, source_path=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Incrementally apply source changes to the live database.
+
+    Source rows are hashed and compared with the stored hashes; only changed rows are
+    written, inside one transaction. Falls back to rebuild_dataset when the database has
+    never been synced. Returns the latest version dict.
+    """
+    spec = _get_spec(name)
+    module = spec["module"]
+    db_path = module.DB_PATH
+    source_path = source_path or getattr(module, spec["source_attr"])
+
+    if not _has_sync_state(db_path):
+        return rebuild_dataset(name, source_path=source_path, batch_size=batch_size)
+
+    source_hash = file_hash(source_path)
+    latest = get_dataset_version(name)
+    if latest and latest["source_hash"] == source_hash:
+        print(f"✓ '{name}' already at version {latest['version']} (source unchanged)")
+        return latest
+
+    table = spec["table"]
+    columns = spec["columns"]
+    insert_sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})'
+    update_sql = f'UPDATE {table} SET {", ".join(f"{c} = ?" for c in columns)} WHERE rowid = ?'
+
+    conn = connect_writer(db_path)
+    try:
+        state = {row_key: (row_hash, row_id) for row_key, row_hash, row_id
+                 in conn.execute('SELECT row_key, row_hash, row_id FROM sync_rows')}
+        seen = set()
+        inserted = updated = 0
+
+        conn.execute('BEGIN IMMEDIATE')
+        for batch in spec["read_source"](source_path, batch_size):
+            for row_key, row_hash, _, row in _keyed_rows(spec, ((None, row) for row in batch)):
+                seen.add(row_key)
+                current = state.get(row_key)
+                if current is None:
+                    row_id = conn.execute(insert_sql, row).lastrowid
+                    conn.execute('INSERT INTO sync_rows (row_key, row_hash, row_id) VALUES (?, ?, ?)',
+                                 (row_key, row_hash, row_id))
+                    inserted += 1
+                elif current[0] != row_hash:
+                    conn.execute(update_sql, (*row, current[1]))
+                    conn.execute('UPDATE sync_rows SET row_hash = ? WHERE row_key = ?', (row_hash, row_key))
+                    updated += 1
+
+        removed = [(row_key, row_id) for row_key, (_, row_id) in state.items() if row_key not in seen]
+        conn.executemany(f'DELETE FROM {table} WHERE rowid = ?', [(row_id,) for _, row_id in removed])
+        conn.executemany('DELETE FROM sync_rows WHERE row_key = ?', [(row_key,) for row_key, _ in removed])
+
+        # Derived indexes are replaced in the same transaction as the rows they cover
+        build_indication_index(conn, name)
+
+        _record_version(conn, "incremental", source_hash, inserted, updated, len(removed))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    invalidate(db_path)
+    print(f"✓ Synced '{name}': {inserted} inserted, {updated} updated, {len(removed)} deleted")
+    return get_dataset_version(name)
+
+
+def sync_all(mode="incremental", batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Sync or rebuild every dataset whose source file is present.
+    """
+    action = sync_dataset if mode == "incremental" else rebuild_dataset
+    versions = {}
+    for name, spec in DATASETS.items():
+        source_path = getattr(spec["module"], spec["source_attr"])
+        if not os.path.exists(source_path):
+            print(f"Skipping '{name}': source not found at {source_path}")
+            continue
+        versions[name] = action(name, batch_size=batch_size)
+    return versions
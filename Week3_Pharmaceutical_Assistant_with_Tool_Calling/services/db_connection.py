@@ -0,0 +1,160 @@
+"""
+SQLite Connection Manager
+
+Shared connection handling for the medicine, interaction and comprehensive drug databases.
+Lookups reuse one read-only connection per thread (URI mode=ro) instead of opening a new
+connection on every call. Each connection keeps a prepared statement cache, so the SQL text
+used by the service functions should be module-level constants.
+
+Paths are resolved from the package location, so the services work regardless of the
+current working directory.
+
+A database file that is atomically replaced (see dataset_sync.rebuild_dataset) is detected
+by its inode changing, so readers in every thread and process pick up the new file.
+"""
+
+import os
+import sqlite3
+import threading
+
+from .tracing import span
+
+
+# Week 3 project root (parent of the services package)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENT_CACHE_SIZE = 256
+MMAP_SIZE = 256 * 1024 * 1024    # 256 MB - larger than any of the shipped databases
+CACHE_SIZE_KB = 16 * 1024        # 16 MB page cache per connection
+
+READ_PRAGMAS = (
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KB}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA query_only = ON",
+)
+
+WRITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KB}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+_local = threading.local()
+_lock = threading.Lock()
+_generations = {}
+
+
+def resolve_path(relative_path):
+    """
+    Resolve a path relative to the Week 3 project root.
+    Absolute paths are returned unchanged.
+    """
+    if os.path.isabs(relative_path):
+        return relative_path
+    return os.path.join(BASE_DIR, relative_path)
+
+
+def _generation(db_path):
+    return _generations.get(db_path, 0)
+
+
+def invalidate(db_path):
+    """
+    Mark all cached read connections for db_path as stale.
+    Each thread reopens its connection on the next lookup.
+    """
+    with _lock:
+        _generations[db_path] = _generation(db_path) + 1
+
+
+def _file_id(db_path):
+    try:
+        return os.stat(db_path).st_ino
+    except OSError:
+        return None
+
+
+def file_signature(db_path):
+    """
+    Identify the current contents of db_path for in-memory caches built from it.
+    Changes whenever the file is replaced, written, or committed to through WAL.
+    """
+    signature = [_generation(db_path)]
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _open_read_connection(db_path):
+    conn = sqlite3.connect(
+        f"file:{db_path}?mode=ro",
+        uri=True,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_read_connection(db_path):
+    """
+    Return this thread's read-only connection for db_path, opening it on first use.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    cached = connections.get(db_path)
+    generation = _generation(db_path)
+    file_id = _file_id(db_path)
+    if cached is not None:
+        conn, conn_generation, conn_file_id = cached
+        if conn_generation == generation and conn_file_id == file_id:
+            return conn
+        conn.close()
+
+    conn = _open_read_connection(db_path)
+    connections[db_path] = (conn, generation, file_id)
+    return conn
+
+
+def close_read_connections():
+    """
+    Close every read connection owned by the calling thread.
+    """
+    connections = getattr(_local, "connections", None) or {}
+    for conn, _, _ in connections.values():
+        conn.close()
+    connections.clear()
+
+
+def connect_writer(db_path):
+    """
+    Open a read-write connection for schema creation and data loading.
+    Enables WAL so readers are never blocked by a running load.
+    """
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in WRITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def fetch_all(db_path, sql, params=()):
+    with span("sqlite.query", **{"db.name": os.path.basename(db_path)}) as s:
+        rows = get_read_connection(db_path).execute(sql, params).fetchall()
+        s.set("db.rows", len(rows))
+    return rows
+
+
+def fetch_one(db_path, sql, params=()):
+    with span("sqlite.query", **{"db.name": os.path.basename(db_path)}) as s:
+        row = get_read_connection(db_path).execute(sql, params).fetchone()
+        s.set("db.rows", 0 if row is None else 1)
+    return row
@@ -0,0 +1,701 @@
+"""
+Model Gateway
+
+A local process exposing the OpenAI `/v1/chat/completions` API in front of the real model
+endpoints. The Week 1-3 projects already talk to models through `OpenAI(base_url=...)`, so
+pointing that base_url at the gateway puts them all behind one admission policy, one set
+of quotas and one set of metrics:
+
+    python -m services.gateway --port 8080 --upstream http://localhost:11434/v1
+    client = OpenAI(base_url="http://localhost:8080/v1", api_key="week3")
+
+- Routing: a model goes to the first route whose prefix matches its name (for example
+  "gpt-" -> https://api.openai.com/v1), anything else to the default upstream. A route
+  without its own API key forwards the client's Authorization header.
+- Micro-batching: requests for the same model arriving within batch_window_ms of each other
+  (up to max_batch) are released upstream together, so they reach a batching backend
+  (Ollama with OLLAMA_NUM_PARALLEL, vLLM) in the same scheduling step. Identical
+  non-streaming requests at temperature 0 in one batch share a single upstream call.
+- Admission control: at most max_concurrency requests in flight and max_queue waiting;
+  anything beyond that is answered with 503.
+- Per-app quotas: the API key a client sends identifies its app (see load_config); each
+  app has request and token budgets per minute (token buckets). An exhausted budget is
+  answered with 429 and Retry-After. The OpenAI SDK retries both 429 and 503 by itself.
+- Metrics: GET /metrics reports latency, time to first token and token counts per app and
+  per model, plus batch and admission counters.
+
+Quotas, batches and metrics live in the process, so the gateway runs as a single worker.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict, deque
+
+from .asgi import Admission, ServerBusy, end_stream, read_body, request_headers, send_chunk, send_json, start_stream
+
+
+METRICS_WINDOW = 1000            # recent requests kept per app and per model for percentiles
+DEFAULT_APP = "default"
+
+ENV_SETTINGS = {
+    # config key: (environment variable, type, default)
+    "upstream": ("GATEWAY_UPSTREAM", str, "http://localhost:11434/v1"),
+    "upstream_api_key": ("GATEWAY_UPSTREAM_API_KEY", str, None),
+    "routes": ("GATEWAY_ROUTES", json.loads, []),
+    "apps": ("GATEWAY_APPS", json.loads, {}),
+    "default_requests_per_minute": ("GATEWAY_DEFAULT_RPM", int, 0),
+    "default_tokens_per_minute": ("GATEWAY_DEFAULT_TPM", int, 0),
+    "max_concurrency": ("GATEWAY_MAX_CONCURRENCY", int, 64),
+    "max_queue": ("GATEWAY_MAX_QUEUE", int, 256),
+    "batch_window_ms": ("GATEWAY_BATCH_WINDOW_MS", float, 5.0),
+    "max_batch": ("GATEWAY_MAX_BATCH", int, 16),
+    "timeout": ("GATEWAY_TIMEOUT", float, 120.0),
+    "stream_usage": ("GATEWAY_STREAM_USAGE", bool, True),
+}
+
+
+def _parse(kind, value):
+    if kind is bool:
+        return value.lower() in ("1", "true", "yes", "on")
+    return kind(value)
+
+
+def load_config(**overrides):
+    """
+    Gateway settings from the environment, with keyword overrides.
+
+    routes: [{"prefix": "gpt-", "base_url": "https://api.openai.com/v1", "api_key": "..."}]
+    apps:   {"<api key>": {"app": "week3", "requests_per_minute": 120, "tokens_per_minute": 200000}}
+            (a value starting with @ is read from that JSON file). Entries without "app" are
+            named app-<sha256 of the key>. Unknown keys share the "default" app and its
+            default_* limits; 0 means unlimited.
+    """
+    config = {}
+    for key, (variable, kind, default) in ENV_SETTINGS.items():
+        value = os.environ.get(variable)
+        config[key] = _parse(kind, value) if value not in (None, "") else default
+    config.update({key: value for key, value in overrides.items() if value is not None})
+
+    if isinstance(config["apps"], str):
+        with open(config["apps"].lstrip("@"), encoding="utf-8") as f:
+            config["apps"] = json.load(f)
+    return config
+
+
+def app_label(api_key):
+    """
+    The name of an app configured without "app": derived from its key, so the key itself
+    never appears in /metrics or error messages.
+    """
+    return "app-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+def openai_error(message, error_type, code=None):
+    return {"error": {"message": message, "type": error_type, "code": code}}
+
+
+# ----------------------------------------------------------------------
+# Upstreams
+# ----------------------------------------------------------------------
+
+class UpstreamError(Exception):
+    """
+    An error response from an upstream, passed on to the client as it is.
+    """
+
+    def __init__(self, status, payload):
+        super().__init__(f"upstream returned {status}")
+        self.status = status
+        self.payload = payload
+
+
+def _error_payload(content):
+    try:
+        return json.loads(content)
+    except ValueError:
+        return openai_error(content.decode("utf-8", "replace")[:500], "upstream_error")
+
+
+class HttpUpstream:
+    """
+    An OpenAI-compatible endpoint, reached with httpx (installed with the openai package).
+    """
+
+    def __init__(self, base_url, api_key=None, timeout=120.0, max_connections=64):
+        import httpx
+
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def _headers(self, authorization):
+        value = f"Bearer {self.api_key}" if self.api_key else authorization
+        return {"authorization": value} if value else {}
+
+    async def complete(self, body, authorization=None):
+        response = await self.client.post(f"{self.base_url}/chat/completions", json=body,
+                                          headers=self._headers(authorization))
+        if response.status_code >= 400:
+            raise UpstreamError(response.status_code, _error_payload(response.content))
+        return response.json()
+
+    async def stream(self, body, authorization=None):
+        """
+        Yield the raw server-sent event bytes of a streamed completion.
+        """
+        async with self.client.stream("POST", f"{self.base_url}/chat/completions", json=body,
+                                      headers=self._headers(authorization)) as response:
+            if response.status_code >= 400:
+                raise UpstreamError(response.status_code, _error_payload(await response.aread()))
+            async for chunk in response.aiter_raw():
+                yield chunk
+
+    async def models(self, authorization=None):
+        response = await self.client.get(f"{self.base_url}/models", headers=self._headers(authorization))
+        if response.status_code >= 400:
+            raise UpstreamError(response.status_code, _error_payload(response.content))
+        return response.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# ----------------------------------------------------------------------
+# Micro-batching
+# ----------------------------------------------------------------------
+
+class MicroBatcher:
+    """
+    Holds requests per model until the batch window closes or the batch is full, then
+    releases them together. Requests in one batch with the same key (not None) share one call.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = defaultdict(list)
+        self._timers = {}
+        self.stats = defaultdict(lambda: {"batches": 0, "requests": 0, "coalesced": 0, "largest": 0})
+
+    async def submit(self, model, key, call):
+        """
+        Wait for this request's batch to be released, then return the result of call()
+        (a coroutine function), or the result of the identical request it was merged with.
+        """
+        loop = asyncio.get_running_loop()
+        ticket = loop.create_future()
+        pending = self._pending[model]
+        pending.append((key, ticket))
+        if len(pending) >= self.max_batch:
+            self._flush(model)
+        elif model not in self._timers:
+            self._timers[model] = loop.call_later(self.window, self._flush, model)
+
+        leader, shared = await ticket
+        if not leader:
+            return await asyncio.shield(shared)
+        if shared is None:
+            return await call()
+        try:
+            result = await call()
+        except Exception as e:
+            shared.set_exception(e)
+            raise
+        except BaseException:
+            shared.set_exception(RuntimeError("merged request was cancelled"))
+            raise
+        shared.set_result(result)
+        return result
+
+    def _flush(self, model):
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [(key, ticket) for key, ticket in self._pending.pop(model, ()) if not ticket.done()]
+        if not batch:
+            return
+
+        stats = self.stats[model]
+        stats["batches"] += 1
+        stats["requests"] += len(batch)
+        stats["largest"] = max(stats["largest"], len(batch))
+
+        groups = defaultdict(list)
+        for position, (key, ticket) in enumerate(batch):
+            groups[key if key is not None else ("single", position)].append(ticket)
+        for tickets in groups.values():
+            leader, followers = tickets[0], tickets[1:]
+            if not followers:
+                leader.set_result((True, None))
+                continue
+            shared = leader.get_loop().create_future()
+            shared.add_done_callback(lambda f: f.cancelled() or f.exception())   # mark as retrieved
+            leader.set_result((True, shared))
+            for ticket in followers:
+                ticket.set_result((False, shared))
+            stats["coalesced"] += len(followers)
+
+    def get_stats(self):
+        return {
+            model: dict(stats, mean_size=round(stats["requests"] / stats["batches"], 2))
+            for model, stats in self.stats.items() if stats["batches"]
+        }
+
+
+def coalesce_key(request, authorization, base_url):
+    """
+    Requests with equal keys get the same answer, so one upstream call can serve them all.
+    Only deterministic, single-choice, non-streaming requests qualify, and only from the same
+    caller (API key) to the same upstream: the shared call runs with the leader's credentials.
+    """
+    if request.get("stream") or request.get("temperature") != 0 or request.get("n", 1) != 1:
+        return None
+    return json.dumps([authorization, base_url, request], sort_keys=True, separators=(",", ":"))
+
+
+# ----------------------------------------------------------------------
+# Quotas
+# ----------------------------------------------------------------------
+
+class TokenBucket:
+    """
+    Holds up to per_minute units and refills at per_minute per minute. The level may go
+    below zero when usage is charged after the fact.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + max(0.0, now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """
+        Seconds until `amount` is available (0 if it is now).
+        """
+        self._refill(now)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= amount
+
+
+class AppQuota:
+    """
+    Request and token budgets of one app. None or 0 means unlimited.
+    """
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def admit(self, now=None):
+        """
+        Take one request from the budget and return 0, or return the seconds to wait when a
+        budget is exhausted. Tokens are charged after the response (charge()), so a request
+        is admitted while any token budget is left.
+        """
+        now = time.monotonic() if now is None else now
+        wait = max(
+            self.requests.wait_time(1, now) if self.requests else 0.0,
+            self.tokens.wait_time(1, now) if self.tokens else 0.0,
+        )
+        if wait == 0 and self.requests:
+            self.requests.take(1, now)
+        return wait
+
+    def refund(self, now=None):
+        """
+        Give back the request taken by admit() when the request was never run.
+        """
+        if self.requests:
+            self.requests.take(-1, time.monotonic() if now is None else now)
+            self.requests.level = min(self.requests.capacity, self.requests.level)
+
+    def charge(self, tokens, now=None):
+        if self.tokens and tokens:
+            self.tokens.take(tokens, time.monotonic() if now is None else now)
+
+
+# ----------------------------------------------------------------------
+# Metrics
+# ----------------------------------------------------------------------
+
+def _percentiles(values, prefix):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        f"{prefix}_p50": round(values[len(values) // 2], 4),
+        f"{prefix}_p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+        f"{prefix}_p99": round(values[min(len(values) - 1, int(len(values) * 0.99))], 4),
+    }
+
+
+class _Series:
+    def __init__(self):
+        self.counts = {"requests": 0, "errors": 0, "rejected": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self.latency = deque(maxlen=METRICS_WINDOW)
+        self.ttft = deque(maxlen=METRICS_WINDOW)
+
+    def summary(self):
+        return dict(self.counts, **_percentiles(self.latency, "latency"), **_percentiles(self.ttft, "ttft"))
+
+
+class GatewayMetrics:
+    """
+    Request, error, token and latency figures per app and per model (seconds).
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.apps = defaultdict(_Series)
+        self.models = defaultdict(_Series)
+
+    def _series(self, app, model):
+        return (self.apps[app], self.models[model])
+
+    def record(self, app, model, seconds, usage=None, ttft=None, error=False):
+        for series in self._series(app, model):
+            series.counts["requests"] += 1
+            series.counts["errors"] += bool(error)
+            series.latency.append(seconds)
+            if ttft is not None:
+                series.ttft.append(ttft)
+            if usage:
+                series.counts["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                series.counts["completion_tokens"] += usage.get("completion_tokens") or 0
+
+    def reject(self, app, model):
+        for series in self._series(app, model):
+            series.counts["rejected"] += 1
+
+    def summary(self):
+        return {
+            "uptime_s": round(time.time() - self.started),
+            "apps": {app: series.summary() for app, series in self.apps.items()},
+            "models": {model: series.summary() for model, series in self.models.items()},
+        }
+
+
+def _total_tokens(usage):
+    return (usage or {}).get("total_tokens") or sum((usage or {}).get(k) or 0 for k in ("prompt_tokens", "completion_tokens"))
+
+
+def _estimate_usage(request, completion_chunks):
+    """
+    Rough usage for streams whose upstream reports none (about 4 characters per token).
+    """
+    prompt_chars = sum(len(m.get("content") or "") for m in request["messages"] if isinstance(m.get("content"), str))
+    prompt = prompt_chars // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion_chunks,
+            "total_tokens": prompt + completion_chunks, "estimated": True}
+
+
+# ----------------------------------------------------------------------
+# ASGI app
+# ----------------------------------------------------------------------
+
+class ModelGateway:
+    """
+    The ASGI application.
+    """
+
+    def __init__(self, config=None, upstream_factory=None):
+        self.config = config or load_config()
+        self.upstream_factory = upstream_factory or (
+            lambda base_url, api_key: HttpUpstream(base_url, api_key, self.config["timeout"],
+                                                   self.config["max_concurrency"]))
+        self.routes = None
+        self.admission = None
+        self.batcher = None
+        self.metrics = GatewayMetrics()
+        self.quotas = {}
+        self._start_lock = None
+
+    # Lifecycle -------------------------------------------------------------
+
+    async def startup(self):
+        if self.routes is not None:
+            return
+        upstreams = {}
+        routes = []
+        for route in self.config["routes"] + [{"prefix": "", "base_url": self.config["upstream"],
+                                               "api_key": self.config["upstream_api_key"]}]:
+            key = (route["base_url"], route.get("api_key"))
+            if key not in upstreams:
+                upstreams[key] = self.upstream_factory(route["base_url"], route.get("api_key"))
+            routes.append((route["prefix"], route["base_url"], upstreams[key]))
+        self.admission = Admission(self.config["max_concurrency"], self.config["max_queue"])
+        self.batcher = MicroBatcher(self.config["batch_window_ms"] / 1000.0, self.config["max_batch"])
+        self.routes = routes
+        print(f"✓ Gateway ready: {len(upstreams)} upstream(s), default {self.config['upstream']}")
+
+    async def shutdown(self):
+        for upstream in {id(u): u for _, _, u in self.routes or ()}.values():
+            close = getattr(upstream, "aclose", None)
+            if close is not None:
+                await close()
+        self.routes = None
+
+    async def _ensure_started(self):
+        if self.routes is None:
+            self._start_lock = self._start_lock or asyncio.Lock()
+            async with self._start_lock:
+                await self.startup()
+
+    def route_for(self, model):
+        """
+        The (base_url, upstream) serving a model.
+        """
+        for prefix, base_url, upstream in self.routes:
+            if model.startswith(prefix):
+                return base_url, upstream
+
+    def upstream_for(self, model):
+        return self.route_for(model)[1]
+
+    def quota_for(self, authorization):
+        """
+        The app and quota of a request, from its API key.
+        """
+        key = authorization[7:].strip() if authorization and authorization.lower().startswith("bearer ") else None
+        entry = self.config["apps"].get(key) if key else None
+        name = entry.get("app") or app_label(key) if entry else DEFAULT_APP
+        if name not in self.quotas:
+            limits = entry or {}
+            self.quotas[name] = AppQuota(
+                name,
+                limits.get("requests_per_minute", self.config["default_requests_per_minute"]),
+                limits.get("tokens_per_minute", self.config["default_tokens_per_minute"]),
+            )
+        return self.quotas[name]
+
+    # Routing ---------------------------------------------------------------
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._ensure_started()
+            await self._route(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _route(self, scope, receive, send):
+        method, path = scope["method"], scope["path"].rstrip("/")
+        if path == "/v1/chat/completions" and method == "POST":
+            await self._chat_completions(scope, receive, send)
+        elif path == "/v1/models" and method == "GET":
+            await self._models(scope, send)
+        elif path == "/metrics" and method == "GET":
+            await send_json(send, 200, self.get_metrics())
+        elif path == "/healthz" and method == "GET":
+            await send_json(send, 200, {"status": "ok", "active": self.admission.active})
+        else:
+            await send_json(send, 404, openai_error(f"No route for {method} {path}", "invalid_request_error"))
+
+    def get_metrics(self):
+        return dict(self.metrics.summary(), admission=self.admission.get_stats(), batches=self.batcher.get_stats())
+
+    async def _models(self, scope, send):
+        try:
+            payload = await self.upstream_for("").models(request_headers(scope).get("authorization"))
+        except UpstreamError as e:
+            await send_json(send, e.status, e.payload)
+        except Exception as e:
+            await send_json(send, 502, openai_error(f"Upstream unavailable: {e}", "upstream_error"))
+        else:
+            await send_json(send, 200, payload)
+
+    # Chat completions --------------------------------------------------------
+
+    async def _chat_completions(self, scope, receive, send):
+        try:
+            body = await read_body(receive)
+            if body is None:
+                return
+            request = json.loads(body)
+        except ValueError as e:
+            await send_json(send, 400, openai_error(f"Invalid request: {e}", "invalid_request_error"))
+            return
+        if (not isinstance(request, dict) or not isinstance(request.get("model"), str)
+                or not isinstance(request.get("messages"), list)):
+            await send_json(send, 400, openai_error("Expected a JSON object with 'model' and 'messages'",
+                                                    "invalid_request_error"))
+            return
+
+        model = request["model"]
+        authorization = request_headers(scope).get("authorization")
+        quota = self.quota_for(authorization)
+        retry_after = quota.admit()
+        if retry_after:
+            self.metrics.reject(quota.name, model)
+            await send_json(send, 429, openai_error(f"Quota exceeded for app '{quota.name}'", "rate_limit_exceeded"),
+                            headers=[(b"retry-after", str(max(1, round(retry_after))).encode())])
+            return
+
+        base_url, upstream = self.route_for(model)
+        start = time.perf_counter()
+        try:
+            async with self.admission.slot():
+                if request.get("stream"):
+                    await self.batcher.submit(model, None, lambda: self._stream(
+                        send, upstream, request, authorization, quota, start))
+                    return
+                payload = await self.batcher.submit(model, coalesce_key(request, authorization, base_url),
+                                                    lambda: upstream.complete(request, authorization))
+        except ServerBusy as e:
+            # Never admitted, so the request does not count against the app's quota
+            quota.refund()
+            self.metrics.reject(quota.name, model)
+            await send_json(send, 503, openai_error(f"Gateway busy: {e}", "server_busy"))
+            return
+        except UpstreamError as e:
+            self.metrics.record(quota.name, model, time.perf_counter() - start, error=True)
+            await send_json(send, e.status, e.payload)
+            return
+        except Exception as e:
+            self.metrics.record(quota.name, model, time.perf_counter() - start, error=True)
+            await send_json(send, 502, openai_error(f"Upstream unavailable: {type(e).__name__}: {e}", "upstream_error"))
+            return
+
+        usage = payload.get("usage") if isinstance(payload, dict) else None
+        quota.charge(_total_tokens(usage))
+        self.metrics.record(quota.name, model, time.perf_counter() - start, usage=usage)
+        await send_json(send, 200, payload)
+
+    async def _stream(self, send, upstream, request, authorization, quota, start):
+        """
+        Relay an upstream event stream. Usage is requested from the upstream (when enabled)
+        and the usage-only event is dropped again unless the client asked for it.
+        """
+        upstream_request = request
+        added_usage = self.config["stream_usage"] and not (request.get("stream_options") or {}).get("include_usage")
+        if added_usage:
+            upstream_request = dict(request, stream_options=dict(request.get("stream_options") or {}, include_usage=True))
+
+        model = request["model"]
+        started = False
+        ttft = usage = None
+        chunks = 0
+        buffer = b""
+        try:
+            async for data in upstream.stream(upstream_request, authorization):
+                if not started:
+                    await start_stream(send, b"text/event-stream")
+                    started = True
+                buffer += data
+                while b"\n\n" in buffer:
+                    event, buffer = buffer.split(b"\n\n", 1)
+                    payload = _event_payload(event)
+                    if payload is not None:
+                        if payload.get("usage"):
+                            usage = payload["usage"]
+                            if added_usage and not payload.get("choices"):
+                                continue
+                        if payload.get("choices"):
+                            chunks += 1
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                    await send_chunk(send, event + b"\n\n")
+            if buffer:
+                await send_chunk(send, buffer)
+        except Exception as e:
+            self.metrics.record(quota.name, model, time.perf_counter() - start, ttft=ttft, error=True)
+            if started:
+                # Headers are already sent, so the error is reported in the stream
+                error = e.payload if isinstance(e, UpstreamError) else openai_error(str(e), "upstream_error")
+                await send_chunk(send, b"data: " + json.dumps(error).encode() + b"\n\n")
+                await end_stream(send)
+            elif isinstance(e, UpstreamError):
+                await send_json(send, e.status, e.payload)
+            else:
+                await send_json(send, 502, openai_error(f"Upstream unavailable: {type(e).__name__}: {e}",
+                                                        "upstream_error"))
+            return
+
+        if not started:
+            await start_stream(send, b"text/event-stream")
+        await end_stream(send)
+        usage = usage or _estimate_usage(request, chunks)
+        quota.charge(_total_tokens(usage))
+        self.metrics.record(quota.name, model, time.perf_counter() - start, usage=usage, ttft=ttft)
+
+
+def _event_payload(event):
+    """
+    The JSON object of a `data: {...}` server-sent event, or None.
+    """
+    if not event.startswith(b"data:"):
+        return None
+    data = event[5:].strip()
+    if data == b"[DONE]":
+        return None
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+app = ModelGateway()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the OpenAI-compatible model gateway")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--upstream", help="default OpenAI-compatible endpoint (Ollama: http://localhost:11434/v1)")
+    parser.add_argument("--upstream-api-key")
+    parser.add_argument("--apps", help="JSON file mapping API keys to apps and their per-minute quotas")
+    parser.add_argument("--max-concurrency", type=int, help="requests in flight upstream")
+    parser.add_argument("--max-queue", type=int, help="requests waiting before 503")
+    parser.add_argument("--batch-window-ms", type=float, help="how long a batch stays open")
+    parser.add_argument("--max-batch", type=int, help="requests per batch")
+    args = parser.parse_args(argv)
+
+    # uvicorn imports services.gateway:app afresh and reads its settings from here
+    if args.apps:
+        os.environ["GATEWAY_APPS"] = json.dumps("@" + args.apps)
+    for key, (variable, _, _) in ENV_SETTINGS.items():
+        value = getattr(args, key, None)
+        if value is not None and key != "apps":
+            os.environ[variable] = str(value)
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("uvicorn is required to run the gateway: pip install uvicorn")
+        return
+    uvicorn.run("services.gateway:app", host=args.host, port=args.port, workers=1, lifespan="on")
+
+
+if __name__ == "__main__":
+    main()
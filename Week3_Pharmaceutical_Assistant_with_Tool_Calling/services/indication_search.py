@@ -0,0 +1,412 @@
+"""
+Indication Search
+
+Finds drugs and medicines by what they treat ("high blood pressure", "acid reflux") from the
+`indications` column of the drug database and the `uses` column of the medicine database.
+No embedding service or network is involved:
+
+- Text is split into lowercase word unigrams and bigrams (common filler words dropped, plural
+  "s" stripped), hashed into FEATURES buckets with crc32 so no vocabulary has to be stored
+- Rows are TF-IDF vectors (sublinear tf, smoothed idf), L2-normalized, held as a sparse
+  rows x FEATURES matrix in compressed-column NumPy arrays (indptr / postings / weights)
+- A query is scored with one sparse matrix-vector product over the columns of its own
+  features, summed into a per-thread scratch buffer at the touched rows only. Scores are
+  cosine similarities; the top k are picked with argpartition over the touched rows, so the
+  work grows with the number of rows containing the query's words, not with the index size
+
+The index is built when a database is loaded (and after every dataset sync) and stored in
+an indication_index table inside that database, so it is replaced together with the data.
+The shipped db/comprehensive_drug.db includes it. Each process loads it once and reloads it
+when the database changes. Databases created before the index existed are indexed in
+memory on every process start until they are reloaded or synced, or until
+create_comprehensive_drug_indexes / create_medicine_indexes is run on them once.
+"""
+
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from . import db_connection
+from .db_connection import fetch_all
+from .tool_registry import tool, param
+
+
+INDEX_FORMAT = 1
+FEATURES = 1 << 18               # hashed feature buckets (unigrams and bigrams)
+DEFAULT_TOP_K = 10
+MIN_SCORE = 0.05                 # cosine similarity below this is not a match
+STAT_CHECK_INTERVAL = 1.0        # seconds between file stat checks
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset((
+    "a", "an", "and", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or",
+    "such", "the", "to", "with", "other", "used", "use", "treatment", "treat", "treating", "management",
+))
+
+# Lay terms users (and models) type for conditions the datasets name clinically. A query
+# containing a key is also searched for its value; both are normalized lowercase text.
+SYNONYMS = {
+    "high blood pressure": "hypertension",
+    "low blood pressure": "hypotension",
+    "high cholesterol": "hyperlipidemia hypercholesterolemia",
+    "heart attack": "myocardial infarction",
+    "heart failure": "congestive heart failure",
+    "irregular heartbeat": "arrhythmia atrial fibrillation",
+    "blood clot": "thrombosis embolism",
+    "acid reflux": "gerd gastroesophageal reflux",
+    "heartburn": "gerd gastroesophageal reflux",
+    "stomach ulcer": "peptic ulcer",
+    "blood sugar": "diabetes",
+    "underactive thyroid": "hypothyroidism",
+    "overactive thyroid": "hyperthyroidism",
+    "hay fever": "allergic rhinitis",
+    "stroke": "cerebrovascular",
+    "fits": "seizure epilepsy",
+    "sleeplessness": "insomnia",
+}
+
+# Searchable sources: table, indexed text column and the fields returned for a match
+SOURCES = {
+    "drugs": {
+        "table": "drugs",
+        "text_column": "indications",
+        "fields": ("generic_name", "drug_class", "indications", "availability"),
+    },
+    "medicines": {
+        "table": "medicines",
+        "text_column": "uses",
+        "fields": ("medicine_name", "composition", "uses"),
+    },
+}
+
+INDEX_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS indication_index (
+        part TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    )
+'''
+
+ARRAY_PARTS = ("row_ids", "row_indptr", "indptr", "postings", "weights", "df")
+
+
+def _db_path(source):
+    from . import medicine_dbutil, comprehensive_drug_dbutil
+
+    return comprehensive_drug_dbutil.DB_PATH if source == "drugs" else medicine_dbutil.DB_PATH
+
+
+def _tokens(text):
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def expand_query(text):
+    """
+    text plus the clinical terms for any lay terms it contains.
+    """
+    normalized = " ".join(TOKEN_PATTERN.findall(text.lower()))
+    extra = [value for key, value in SYNONYMS.items() if re.search(rf"\b{key}\b", normalized)]
+    return " ".join([text] + extra)
+
+
+def _features(tokens):
+    terms = list(tokens) + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return Counter(zlib.crc32(term.encode("utf-8")) & (FEATURES - 1) for term in terms)
+
+
+def text_features(text):
+    """
+    Hashed unigram and bigram feature counts of text, as a Counter of bucket -> count.
+    """
+    return _features(_tokens(text or ""))
+
+
+def _idf(df, rows):
+    return np.log((1.0 + rows) / (1.0 + df)) + 1.0
+
+
+class IndicationIndex:
+    """
+    TF-IDF matrix over one source. Rows with the same indexed text share one vector, so the
+    matrix has a row per distinct text (catalogs repeat indications heavily); the database
+    rows of vector v are row_ids[row_indptr[v]:row_indptr[v + 1]].
+
+    The matrix is stored by column: the vectors containing feature f are
+    postings[indptr[f]:indptr[f + 1]], with their normalized weights at the same positions
+    in weights. df holds the number of database rows containing each feature.
+    """
+
+    def __init__(self, row_ids, row_indptr, indptr, postings, weights, df):
+        self.row_ids = row_ids
+        self.row_indptr = row_indptr
+        self.indptr = indptr
+        self.postings = postings
+        self.weights = weights
+        self.df = df
+        self.rows = len(row_ids)
+        self.vectors = len(row_indptr) - 1
+        self._local = threading.local()
+
+    @classmethod
+    def build(cls, rows):
+        """
+        Build from (row_id, text) pairs.
+        """
+        vector_of = {}
+        vector_rows = []
+        docs, features, counts = [], [], []
+        for row_id, text in rows:
+            tokens = tuple(_tokens(text or ""))
+            vector = vector_of.get(tokens)
+            if vector is None:
+                vector = vector_of[tokens] = len(vector_rows)
+                vector_rows.append([])
+                for feature, count in _features(tokens).items():
+                    docs.append(vector)
+                    features.append(feature)
+                    counts.append(count)
+            vector_rows[vector].append(row_id)
+
+        sizes = np.array([len(ids) for ids in vector_rows], dtype=np.int64)
+        row_ids = np.array([row_id for ids in vector_rows for row_id in ids], dtype=np.int64)
+        row_indptr = np.zeros(len(vector_rows) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=row_indptr[1:])
+
+        docs = np.array(docs, dtype=np.int32)
+        features = np.array(features, dtype=np.int32)
+        counts = np.array(counts, dtype=np.float32)
+
+        df = np.bincount(features, weights=sizes[docs], minlength=FEATURES).astype(np.int32)
+        weights = (1.0 + np.log(counts)) * _idf(df, len(row_ids))[features]
+        norms = np.sqrt(np.bincount(docs, weights * weights, minlength=len(vector_rows)))
+        if len(docs):
+            weights /= norms[docs]
+
+        order = np.argsort(features, kind="stable")
+        indptr = np.zeros(FEATURES + 1, dtype=np.int32)
+        np.cumsum(np.bincount(features, minlength=FEATURES), out=indptr[1:])
+        return cls(row_ids, row_indptr, indptr, docs[order], weights[order].astype(np.float32), df)
+
+    def _scratch(self):
+        """
+        This thread's score accumulator, one slot per vector, all zero between searches.
+        """
+        sums = getattr(self._local, "sums", None)
+        if sums is None:
+            sums = self._local.sums = np.zeros(self.vectors, dtype=np.float64)
+        return sums
+
+    def search(self, text, top_k=DEFAULT_TOP_K, min_score=MIN_SCORE):
+        """
+        Return [(row_id, cosine score)] for the top_k rows most similar to text, best first.
+        """
+        query = text_features(expand_query(text))
+        if not query or not self.vectors:
+            return []
+        features = np.fromiter(query.keys(), dtype=np.int64, count=len(query))
+        counts = np.fromiter(query.values(), dtype=np.float64, count=len(query))
+
+        query_weights = (1.0 + np.log(counts)) * _idf(self.df[features], self.rows)
+        query_weights /= np.sqrt(query_weights @ query_weights)
+
+        starts, ends = self.indptr[features], self.indptr[features + 1]
+        present = np.flatnonzero(ends > starts)
+        if not len(present):
+            return []
+        # Sparse matrix-vector product over the query's columns only
+        postings = np.concatenate([self.postings[starts[i]:ends[i]] for i in present]).astype(np.intp)
+        values = np.concatenate([self.weights[starts[i]:ends[i]] * query_weights[i] for i in present])
+        # Accumulate into this thread's scratch buffer, touching only the vectors that hold
+        # a query feature (all others score 0), then read the sums back and zero them again.
+        # Zeroing the whole buffer is a memset, faster than a scatter over many postings
+        sums = self._scratch()
+        np.add.at(sums, postings, values)
+        scores = sums[postings]
+        if len(postings) < self.vectors // 8:
+            sums[postings] = 0.0
+        else:
+            sums.fill(0.0)
+
+        # A vector is repeated once per query feature it holds, so the best top_k * features
+        # postings cover the best top_k vectors; only those few are deduplicated and sorted
+        keep = top_k * len(present)
+        if len(postings) > keep:
+            best = np.argpartition(-scores, keep)[:keep]
+            postings, scores = postings[best], scores[best]
+        vectors, slots = np.unique(postings, return_index=True)
+        scores = scores[slots]
+        best = np.argsort(-scores, kind="stable")
+
+        matches = []
+        for slot in best:
+            vector, score = vectors[slot], float(scores[slot])
+            if score < min_score or len(matches) >= top_k:
+                break
+            row_ids = self.row_ids[self.row_indptr[vector]:self.row_indptr[vector + 1]]
+            matches.extend((int(row_id), round(score, 4)) for row_id in row_ids[:top_k - len(matches)])
+        return matches
+
+    # Persistence ---------------------------------------------------------
+
+    def to_parts(self):
+        parts = {"meta": json.dumps({"format": INDEX_FORMAT, "features": FEATURES, "rows": self.rows,
+                                       "vectors": self.vectors}).encode()}
+        for name in ARRAY_PARTS:
+            buffer = io.BytesIO()
+            np.save(buffer, getattr(self, name), allow_pickle=False)
+            parts[name] = buffer.getvalue()
+        return parts
+
+    @classmethod
+    def from_parts(cls, parts):
+        """
+        Load from stored parts, or return None if they are missing or from another format.
+        """
+        try:
+            meta = json.loads(parts["meta"])
+            if meta["format"] != INDEX_FORMAT or meta["features"] != FEATURES:
+                return None
+            arrays = [np.load(io.BytesIO(parts[name]), allow_pickle=False) for name in ARRAY_PARTS]
+        except (KeyError, ValueError):
+            return None
+        return cls(*arrays)
+
+
+def _source_rows(conn_or_path, source):
+    spec = SOURCES[source]
+    sql = f'SELECT id, {spec["text_column"]} FROM {spec["table"]} ORDER BY id'
+    if isinstance(conn_or_path, str):
+        return fetch_all(conn_or_path, sql)
+    return conn_or_path.execute(sql).fetchall()
+
+
+def build_indication_index(conn, source):
+    """
+    Build the index for `source` from the rows visible to conn and store it in the
+    database. Part of the caller's transaction: the caller commits.
+    """
+    if source not in SOURCES:
+        return None
+    index = IndicationIndex.build(_source_rows(conn, source))
+    conn.execute(INDEX_SCHEMA)
+    conn.execute('DELETE FROM indication_index')
+    conn.executemany('INSERT INTO indication_index (part, data) VALUES (?, ?)', index.to_parts().items())
+    return index
+
+
+def load_indication_index(source):
+    """
+    The stored index for `source`, or one built in memory when the database has none.
+    None when the database does not exist.
+    """
+    db_path = _db_path(source)
+    if not os.path.exists(db_path):
+        return None
+    try:
+        index = IndicationIndex.from_parts(dict(fetch_all(db_path, 'SELECT part, data FROM indication_index')))
+    except sqlite3.OperationalError:
+        index = None
+    if index is None:
+        try:
+            index = IndicationIndex.build(_source_rows(db_path, source))
+        except sqlite3.Error as e:
+            print(f"Indication index unavailable for {source}: {e}")
+            return None
+        print(f"✓ Indexed {index.rows:,} {source} in memory (reload the database to store the index)")
+    return index
+
+
+# Loaded indexes, reloaded when their database changes: this process's changes are seen
+# through the db_connection generation, other processes' through file stats (checked at
+# most once per STAT_CHECK_INTERVAL), as in name_resolver
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_indication_index(source):
+    db_path = _db_path(source)
+    entry = _indexes.get(source)
+    now = time.monotonic()
+    if entry is not None and entry["path"] == db_path and entry["generation"] == db_connection._generation(db_path):
+        if now < entry["next_check"]:
+            return entry["index"]
+        entry["next_check"] = now + STAT_CHECK_INTERVAL
+        if db_connection.file_signature(db_path) == entry["signature"]:
+            return entry["index"]
+
+    with _indexes_lock:
+        signature = db_connection.file_signature(db_path)
+        entry = _indexes.get(source)
+        if entry is None or entry["path"] != db_path or entry["signature"] != signature:
+            entry = {
+                "index": load_indication_index(source),
+                "path": db_path,
+                "generation": signature[0],
+                "signature": signature,
+                "next_check": time.monotonic() + STAT_CHECK_INTERVAL,
+            }
+            _indexes[source] = entry
+    return entry["index"]
+
+
+def _match_rows(source, matches):
+    spec = SOURCES[source]
+    scores = dict(matches)
+    placeholders = ", ".join("?" for _ in scores)
+    rows = fetch_all(
+        _db_path(source),
+        f'SELECT id, {", ".join(spec["fields"])} FROM {spec["table"]} WHERE id IN ({placeholders})',
+        tuple(scores),
+    )
+    return [dict(zip(("source",) + spec["fields"], (source,) + row[1:]), score=scores[row[0]]) for row in rows]
+
+
+@tool(
+    description="Find drugs and medicines used for a condition or symptom (e.g., 'hypertension', 'migraine', 'acid reflux'). Searches the indications in the drug database and the uses in the medicine database and returns the closest matches with a relevance score between 0 and 1.",
+    params={
+        "indication": param("The condition, symptom or use to search for (e.g., 'high blood pressure', 'fungal skin infection')"),
+    },
+    datasets=("drugs", "medicines"),
+    paginate=True,
+    rows_key="matches",
+    keep_fields=("source", "generic_name", "medicine_name", "score"),
+    on_empty={"message": "No drugs or medicines found for {indication}"},
+)
+def search_by_indication(indication, top_k=DEFAULT_TOP_K):
+    """
+    Search both sources by indication and return {"indication", "matches"}, best matches
+    first across sources, or None when nothing matches.
+    """
+    if not indication or not isinstance(indication, str):
+        return None
+
+    matches = []
+    for source in SOURCES:
+        index = get_indication_index(source)
+        if index is None:
+            continue
+        found = index.search(indication, top_k)
+        if found:
+            try:
+                matches.extend(_match_rows(source, found))
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+
+    if not matches:
+        return None
+    matches.sort(key=lambda match: -match["score"])
+    return {"indication": indication, "matches": matches[:top_k]}
@@ -1,18 +1,80 @@
-import json
-import sqlite3
-import pandas as pd
 import os
+import re
+import threading
+import time
+from collections import defaultdict
+from itertools import combinations
 
+from .db_connection import resolve_path, connect_writer, fetch_all, fetch_one, invalidate, file_signature
+from .bulk_loader import DEFAULT_BATCH_SIZE, iter_json_batches, bulk_insert, tune_for_load, report_rate
+from .name_resolver import resolve_name, normalize_name
+from .read_model import active_read_model
+from .tool_registry import tool, param
 
-DB_PATH = 'db/drug_interactions.db'
-JSON_PATH = 'dataset/drug_interactions_dataset.json'
 
-def initialize_interaction_db():
+DB_PATH = resolve_path('db/drug_interactions.db')
+JSON_PATH = resolve_path('dataset/drug_interactions_dataset.json')
+
+JSON_FIELDS = [
+    'interaction_id', 'drug_a', 'drug_b', 'severity', 'mechanism', 'clinical_effect',
+    'safer_alternative', 'clinical_management', 'reference'
+]
+
+INSERT_INTERACTION_SQL = '''
+    INSERT INTO drug_interactions (
+        interaction_id, drug_a, drug_b, severity, mechanism, clinical_effect, safer_alternative, clinical_management, reference
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# NOCASE matches the dataset's case variants of one name ("Alpha-Blockers" / "Alpha-blockers")
+INTERACTION_PAIR_SQL = '''
+    SELECT * FROM drug_interactions
+    WHERE (drug_a = ? COLLATE NOCASE AND drug_b = ? COLLATE NOCASE)
+       OR (drug_a = ? COLLATE NOCASE AND drug_b = ? COLLATE NOCASE)
+'''
+
+ALL_INTERACTIONS_SQL = 'SELECT * FROM drug_interactions'
+
+SEVERITY_ORDER = {"Major": 0, "Moderate": 1, "Minor": 2}
+
+# "ACE Inhibitors (e.g., Lisinopril)" -> "Lisinopril" is a member of that entry
+_EXAMPLES = re.compile(r"\(e\.g\.,?\s*([^)]*)\)", re.IGNORECASE)
+
+
+def create_interaction_indexes(conn):
+    """
+    Create lookup indexes. Bulk loaders call this after the data is in place.
+    """
+    cursor = conn.cursor()
+
+    #Drop existing indexes if they exist
+    cursor.execute('DROP INDEX IF EXISTS idx_drug_a')
+    cursor.execute('DROP INDEX IF EXISTS idx_drug_b')
+    cursor.execute('DROP INDEX IF EXISTS idx_severity')
+    cursor.execute('DROP INDEX IF EXISTS idx_drug_pair')
+    
+    # -- Index on drug_a for fast lookup
+    cursor.execute('CREATE INDEX idx_drug_a ON drug_interactions(drug_a);')
+    
+    # -- Index on drug_b for fast lookup
+    cursor.execute('CREATE INDEX idx_drug_b ON drug_interactions(drug_b);')
+
+    # -- Index on severity for filtering by severity level
+    cursor.execute('CREATE INDEX idx_severity ON drug_interactions(severity);')
+
+    # -- Composite index for checking interactions between two drugs
+    cursor.execute('CREATE INDEX idx_drug_pair ON drug_interactions(drug_a COLLATE NOCASE, drug_b COLLATE NOCASE);')
+
+    conn.commit()
+
+
+def initialize_interaction_db(create_indexes=True, db_path=None):
     """
     Create SQLite database and schema.
     Drops existing table and creates fresh one.
+    Pass create_indexes=False when indexes are built after a bulk load.
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_writer(db_path or DB_PATH)
     cursor = conn.cursor()
     
     # Drop existing table if it exists
@@ -33,103 +95,202 @@ def initialize_interaction_db():
             )
         ''')
     
+    conn.commit()
 
-    #Drop existing indexes if they exist
-    cursor.execute('DROP INDEX IF EXISTS idx_drug_a')
-    cursor.execute('DROP INDEX IF EXISTS idx_drug_b')
-    cursor.execute('DROP INDEX IF EXISTS idx_severity')
-    cursor.execute('DROP INDEX IF EXISTS idx_drug_pair')
-    
-    # -- Index on drug_a for fast lookup
-    cursor.execute('CREATE INDEX idx_drug_a ON drug_interactions(drug_a);')
-    
-    # -- Index on drug_b for fast lookup
-    cursor.execute('CREATE INDEX idx_drug_b ON drug_interactions(drug_b);')
-
-    # -- Index on severity for filtering by severity level
-    cursor.execute('CREATE INDEX idx_severity ON drug_interactions(severity);')
+    if create_indexes:
+        create_interaction_indexes(conn)
 
-    # -- Composite index for checking interactions between two drugs
-    cursor.execute('CREATE INDEX idx_drug_pair ON drug_interactions(drug_a, drug_b);')
-
-    conn.commit()
     conn.close()
     print("✓ Database schema created successfully!")
 
 
-def insert_interactions_from_json():
+def insert_interactions_from_json(json_path=None, batch_size=DEFAULT_BATCH_SIZE, db_path=None):
     """
-    Initialize database schema and read JSON file to insert drug interaction data into database.
+    Initialize database schema and stream the JSON file into the database.
+    Rows are inserted in batches with executemany; indexes are built after the load.
     """
-    
-    # Initialize database schema first
-    initialize_interaction_db()
+    json_path = json_path or JSON_PATH
+    db_path = db_path or DB_PATH
     
     # Check if JSON exists
-    if not os.path.exists(JSON_PATH):
-        print(f"Error: JSON file not found at {JSON_PATH}")
+    if not os.path.exists(json_path):
+        print(f"Error: JSON file not found at {json_path}")
         return
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    with open(JSON_PATH, 'r') as f:
-        data = json.load(f)
-        interactions = data['ddi_database']
-        for interaction in interactions:
-            cursor.execute('''
-                INSERT INTO drug_interactions (
-                    interaction_id, drug_a, drug_b, severity, mechanism, clinical_effect, safer_alternative, clinical_management, reference
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                interaction.get('interaction_id'),
-                interaction.get('drug_a'),
-                interaction.get('drug_b'),
-                interaction.get('severity'),
-                interaction.get('mechanism'),
-                interaction.get('clinical_effect'),
-                interaction.get('safer_alternative'),
-                interaction.get('clinical_management'),
-                interaction.get('reference')
-            ))
-    conn.commit()
+    # Initialize database schema first (indexes come after the load)
+    initialize_interaction_db(create_indexes=False, db_path=db_path)
+    
+    conn = connect_writer(db_path)
+    tune_for_load(conn)
+    
+    batches = iter_json_batches(json_path, 'ddi_database', JSON_FIELDS, batch_size=batch_size)
+    rows, seconds = bulk_insert(conn, INSERT_INTERACTION_SQL, batches)
+    
+    index_start = time.perf_counter()
+    create_interaction_indexes(conn)
+    index_seconds = time.perf_counter() - index_start
     
     # Verify import
-    cursor.execute('SELECT COUNT(*) FROM drug_interactions')
-    count = cursor.fetchone()[0]
+    count = conn.execute('SELECT COUNT(*) FROM drug_interactions').fetchone()[0]
     
     conn.close()
+    invalidate(db_path)
     print(f"✓ Drug interaction data inserted successfully!")
     print(f"✓ Total interactions inserted: {count}")
+    report_rate("Interaction load", rows, seconds)
+    print(f"✓ Indexes built in {index_seconds:.2f}s")
+    return count
+
+
+def _row_to_interaction(result):
+    return {
+        "interaction_id": result[0],
+        "drug_a": result[1],
+        "drug_b": result[2],
+        "severity": result[3],
+        "mechanism": result[4],
+        "clinical_effect": result[5],
+        "safer_alternative": result[6],
+        "clinical_management": result[7],
+        "reference": result[8]
+    }
+
+
+def _pair_key(key_a, key_b):
+    # Unordered: (a, b) and (b, a) hash to the same key
+    return frozenset((key_a, key_b))
+
+
+def build_pair_index(db_path=None):
+    """
+    Load every interaction into a symmetric pair index.
+    Returns (pairs, members): pairs maps an unordered pair of normalized names to its
+    interactions; members maps an example drug to the class entries that name it.
+    """
+    pairs = defaultdict(list)
+    members = defaultdict(set)
+    for row in fetch_all(db_path or DB_PATH, ALL_INTERACTIONS_SQL):
+        key_a, key_b = normalize_name(row[1]), normalize_name(row[2])
+        pairs[_pair_key(key_a, key_b)].append(_row_to_interaction(row))
+        for name, key in ((row[1], key_a), (row[2], key_b)):
+            for examples in _EXAMPLES.findall(name):
+                for example in examples.split(","):
+                    members[normalize_name(example)].add(key)
+    return dict(pairs), dict(members)
+
+
+_pair_index = None
+_pair_index_signature = None
+_pair_index_lock = threading.Lock()
+
+
+def get_pair_index():
+    """
+    Return the shared pair index, rebuilding it when the database has changed.
+    """
+    global _pair_index, _pair_index_signature
+    signature = (DB_PATH, file_signature(DB_PATH))
+    if _pair_index is None or signature != _pair_index_signature:
+        with _pair_index_lock:
+            if _pair_index is None or signature != _pair_index_signature:
+                _pair_index = build_pair_index()
+                _pair_index_signature = signature
+    return _pair_index
+
+
+@tool(
+    name="check_interaction_matrix",
+    description="Check every pair in a list of medications for known drug-drug interactions in a single call. Use this instead of repeated check_drug_interactions calls when a patient takes three or more drugs. Returns all interactions found, sorted by severity (Major first), and the drugs not present in the interaction database.",
+    params={
+        "drug_list": param("All medications the patient takes (e.g., ['Warfarin', 'Aspirin', 'Omeprazole', 'Clopidogrel'])",
+                           type="array", items="string"),
+    },
+    datasets=("interactions",),
+    paginate=True,
+    rows_key="interactions",
+    keep_fields=("drug_a", "drug_b", "severity"),
+)
+def check_interactions_matrix(drug_list):
+    """
+    Check every pair in drug_list for known interactions in one pass over the pair index.
+    Each drug also matches class entries that list it as an example
+    ("Lisinopril" matches "ACE Inhibitors (e.g., Lisinopril)").
+    Returns the interactions sorted by severity (Major first), plus the names that
+    are not in the interaction database at all.
+    """
+    pairs, members = get_pair_index()
 
+    drugs = []
+    seen = set()
+    for drug in drug_list:
+        if not drug or not isinstance(drug, str):
+            continue
+        resolved = resolve_name(drug, "interactions")
+        key = normalize_name(resolved["name"] if resolved else drug)
+        if key in seen:
+            continue
+        seen.add(key)
+        keys = {key} | members.get(key, set()) | members.get(normalize_name(drug), set())
+        confidence = resolved["confidence"] if resolved else None
+        drugs.append((drug, keys, confidence, bool(resolved) or len(keys) > 1))
 
+    interactions = {}
+    for (drug_a, keys_a, confidence_a, _), (drug_b, keys_b, confidence_b, _) in combinations(drugs, 2):
+        for key_a in keys_a:
+            for key_b in keys_b:
+                for interaction in pairs.get(_pair_key(key_a, key_b), ()):
+                    if interaction["interaction_id"] in interactions:
+                        continue
+                    interactions[interaction["interaction_id"]] = dict(
+                        interaction,
+                        queried_drugs=[drug_a, drug_b],
+                        match_confidence=min(confidence_a or 1.0, confidence_b or 1.0)
+                    )
+
+    found = sorted(
+        interactions.values(),
+        key=lambda i: (SEVERITY_ORDER.get(i["severity"], len(SEVERITY_ORDER)), i["interaction_id"])
+    )
+    return {
+        "drugs": [drug for drug, _, _, _ in drugs],
+        "pairs_checked": len(drugs) * (len(drugs) - 1) // 2,
+        "interactions": found,
+        "not_in_database": [drug for drug, _, _, known in drugs if not known]
+    }
+
+
+@tool(
+    name="check_drug_interactions",
+    description="Check for known drug-drug interactions between two medications. Returns interaction severity (Major/Moderate/Minor), mechanism, clinical effects, safer alternatives, and management recommendations.",
+    params={
+        "drug_a": param("The first drug name (e.g., 'Warfarin', 'Aspirin')"),
+        "drug_b": param("The second drug name (e.g., 'Ibuprofen', 'Naproxen')"),
+    },
+    datasets=("interactions",),
+    on_empty={"message": "No known interaction between {drug_a} and {drug_b}"},
+)
 def check_drug_interaction(drug_a, drug_b):
     """
     Check if there is a known interaction between drug_a and drug_b.
-    Returns interaction details if found, else returns None.
+    Names are resolved first (aliases, typos), so "Paracetamol" finds "Acetaminophen".
+    Returns interaction details with match_confidence if found, else returns None.
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    resolved_a = resolve_name(drug_a, "interactions")
+    resolved_b = resolve_name(drug_b, "interactions")
+    name_a = resolved_a["name"] if resolved_a else drug_a
+    name_b = resolved_b["name"] if resolved_b else drug_b
+
     # Check for interaction in both directions (drug_a, drug_b) and (drug_b, drug_a)
-    cursor.execute('''
-        SELECT * FROM drug_interactions 
-        WHERE (drug_a = ? AND drug_b = ?) OR (drug_a = ? AND drug_b = ?)
-    ''', (drug_a, drug_b, drug_b, drug_a))
-    
-    result = cursor.fetchone()
-    conn.close()
+    model = active_read_model("interactions")
+    if model:
+        result = model.interaction_row(name_a, name_b)
+    else:
+        result = fetch_one(DB_PATH, INTERACTION_PAIR_SQL, (name_a, name_b, name_b, name_a))
     
     if result:
-        return {
-            "interaction_id": result[0],
-            "drug_a": result[1],
-            "drug_b": result[2],
-            "severity": result[3],
-            "mechanism": result[4],
-            "clinical_effect": result[5],
-            "safer_alternative": result[6],
-            "clinical_management": result[7],
-            "reference": result[8]
-        }
+        confidences = [r["confidence"] for r in (resolved_a, resolved_b) if r]
+        interaction = _row_to_interaction(result)
+        interaction["match_confidence"] = min(confidences, default=1.0)
+        return interaction
     else:
         return None
\ No newline at end of file
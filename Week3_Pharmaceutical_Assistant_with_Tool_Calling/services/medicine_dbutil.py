@@ -1,20 +1,223 @@
 import sqlite3
-import pandas as pd
 import os
+import time
 
-DB_PATH = 'db/medicine_info.db'
-CSV_PATH = 'dataset/medicine_info_dataset.csv'
+from .db_connection import resolve_path, connect_writer, fetch_all, invalidate
+from .bulk_loader import DEFAULT_BATCH_SIZE, iter_csv_batches, bulk_insert, tune_for_load, report_rate
+from .indication_search import build_indication_index
+from .name_resolver import resolve_name
+from .read_model import active_read_model
+from .tool_registry import tool, param
 
+DB_PATH = resolve_path('db/medicine_info.db')
+CSV_PATH = resolve_path('dataset/medicine_info_dataset.csv')
 
-def initialize_db():
+CSV_COLUMNS = ['Medicine Name', 'Composition', 'Manufacturer', 'Uses', 'Side_effects']
+
+INSERT_MEDICINE_SQL = '''
+    INSERT INTO medicines (medicine_name, composition, manufacturer, uses, side_effects)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+# Trigram FTS5 indexes over the searchable columns, one per column: a column filter on a
+# shared index has to walk every match in the other columns too. They are external-content
+# tables, so the text is stored only once (in medicines) and triggers keep the indexes in
+# sync with every insert, update and delete, including those applied by dataset_sync.
+FTS_COLUMNS = ("medicine_name", "composition")
+FTS_TRIGGERS = ("medicines_fts_insert", "medicines_fts_delete", "medicines_fts_update")
+LEGACY_FTS_TABLES = ("medicines_fts",)
+
+FTS_SCHEMA = (
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS medicines_medicine_name_fts USING fts5(
+        medicine_name, content='medicines', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS medicines_composition_fts USING fts5(
+        composition, content='medicines', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE TRIGGER medicines_fts_insert AFTER INSERT ON medicines BEGIN
+        INSERT INTO medicines_medicine_name_fts(rowid, medicine_name) VALUES (new.id, new.medicine_name);
+        INSERT INTO medicines_composition_fts(rowid, composition) VALUES (new.id, new.composition);
+    END
+    ''',
+    '''
+    CREATE TRIGGER medicines_fts_delete AFTER DELETE ON medicines BEGIN
+        INSERT INTO medicines_medicine_name_fts(medicines_medicine_name_fts, rowid, medicine_name)
+        VALUES ('delete', old.id, old.medicine_name);
+        INSERT INTO medicines_composition_fts(medicines_composition_fts, rowid, composition)
+        VALUES ('delete', old.id, old.composition);
+    END
+    ''',
+    '''
+    CREATE TRIGGER medicines_fts_update AFTER UPDATE ON medicines BEGIN
+        INSERT INTO medicines_medicine_name_fts(medicines_medicine_name_fts, rowid, medicine_name)
+        VALUES ('delete', old.id, old.medicine_name);
+        INSERT INTO medicines_composition_fts(medicines_composition_fts, rowid, composition)
+        VALUES ('delete', old.id, old.composition);
+        INSERT INTO medicines_medicine_name_fts(rowid, medicine_name) VALUES (new.id, new.medicine_name);
+        INSERT INTO medicines_composition_fts(rowid, composition) VALUES (new.id, new.composition);
+    END
+    ''',
+)
+
+
+def _fts_table(column):
+    return f"medicines_{column}_fts"
+
+
+# The trigram tokenizer needs at least 3 characters to match anything
+FTS_MIN_TERM_LENGTH = 3
+
+# Candidates are capped before ranking so latency does not grow with the number of rows
+# a common term matches. The FTS leg takes the first FTS_CANDIDATE_LIMIT matches in rowid
+# order without sorting them; the prefix leg adds the first prefix matches from the NOCASE
+# index (a range seek), so a prefix match is never lost to the cap. Only those rows are
+# ranked: prefix matches first, then the shortest value (the closest match for a single
+# phrase; bm25 would need the phrase's frequency across every matching row), then id.
+# read_model.search_medicines applies the same candidates and order.
+# Parameters: (match expression, prefix pattern, prefix pattern)
+FTS_CANDIDATE_LIMIT = 200
+PREFIX_CANDIDATE_LIMIT = 5
+
+
+def _fts_search_sql(column):
+    return f'''
+    WITH candidates AS (
+        SELECT rowid FROM (
+            SELECT rowid FROM {_fts_table(column)}
+            WHERE {_fts_table(column)} MATCH ?
+            LIMIT {FTS_CANDIDATE_LIMIT}
+        )
+        UNION
+        SELECT id FROM (
+            SELECT id FROM medicines
+            WHERE {column} LIKE ?
+            LIMIT {PREFIX_CANDIDATE_LIMIT}
+        )
+    )
+    SELECT m.medicine_name, m.composition, m.manufacturer, m.uses, m.side_effects
+    FROM candidates c
+    JOIN medicines m ON m.id = c.rowid
+    ORDER BY m.{column} LIKE ? DESC, length(m.{column}), m.id
+    LIMIT 5
+'''
+
+
+MEDICINE_BY_NAME_FTS_SQL = _fts_search_sql("medicine_name")
+MEDICINE_BY_COMPOSITION_FTS_SQL = _fts_search_sql("composition")
+
+# Terms shorter than the trigram minimum fall back to a prefix match, which the
+# NOCASE indexes serve as a range seek
+MEDICINE_BY_NAME_SQL = '''
+    SELECT medicine_name, composition, manufacturer, uses, side_effects
+    FROM medicines
+    WHERE medicine_name LIKE ?
+    LIMIT 5
+'''
+
+MEDICINE_BY_COMPOSITION_SQL = '''
+    SELECT medicine_name, composition, manufacturer, uses, side_effects
+    FROM medicines
+    WHERE composition LIKE ?
+    LIMIT 5
+'''
+
+SEARCH_SQL = {
+    "medicine_name": (MEDICINE_BY_NAME_FTS_SQL, MEDICINE_BY_NAME_SQL),
+    "composition": (MEDICINE_BY_COMPOSITION_FTS_SQL, MEDICINE_BY_COMPOSITION_SQL),
+}
+
+
+def _rows_to_medicines(results):
+    return [
+        {
+            "medicine_name": result[0],
+            "composition": result[1],
+            "manufacturer": result[2],
+            "uses": result[3],
+            "side_effects": result[4]
+        } for result in results
+    ]
+
+
+def _fts_phrase(term):
+    # Quote the term as an FTS5 string so punctuation is matched literally
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _search_medicines(column, term):
+    """
+    Case-insensitive substring search on one column, served from the trigram index.
+    Terms shorter than 3 characters are matched as a prefix instead.
+    Answered from memory when the read model is enabled.
+    """
+    model = active_read_model("medicines")
+    if model:
+        return model.search_medicines(column, term, FTS_MIN_TERM_LENGTH)
+
+    fts_sql, scan_sql = SEARCH_SQL[column]
+    term = term.strip()
+    if len(term) >= FTS_MIN_TERM_LENGTH:
+        return fetch_all(DB_PATH, fts_sql, (_fts_phrase(term), f'{term}%', f'{term}%'))
+    return fetch_all(DB_PATH, scan_sql, (f'{term}%',))
+
+
+def create_medicine_fts(conn):
+    """
+    Create the trigram FTS5 indexes and their sync triggers, then index existing rows.
+    Replaces the triggers and the single two-column index of older databases.
+    """
+    cursor = conn.cursor()
+    for trigger in FTS_TRIGGERS:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    for table in LEGACY_FTS_TABLES:
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    for statement in FTS_SCHEMA:
+        cursor.execute(statement)
+    for column in FTS_COLUMNS:
+        cursor.execute(f"INSERT INTO {_fts_table(column)}({_fts_table(column)}) VALUES ('rebuild')")
+    conn.commit()
+
+
+def create_medicine_indexes(conn):
+    """
+    Create lookup indexes, the trigram search index and the indication search index.
+    Bulk loaders call this after the data is in place.
+    """
+    cursor = conn.cursor()
+
+    # Drop existing indexes if they exist
+    cursor.execute('DROP INDEX IF EXISTS idx_medicine_name')
+    cursor.execute('DROP INDEX IF EXISTS idx_composition')
+    
+    # Create indexes for faster queries (NOCASE so LIKE 'term%' can use them)
+    cursor.execute('CREATE INDEX idx_medicine_name ON medicines(medicine_name COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX idx_composition ON medicines(composition COLLATE NOCASE)')
+
+    # TF-IDF index over uses for search_by_indication
+    build_indication_index(conn, "medicines")
+
+    conn.commit()
+
+    create_medicine_fts(conn)
+
+
+def initialize_db(create_indexes=True, db_path=None):
     """
     Create SQLite database and schema.
     Drops existing table and creates fresh one.
+    Pass create_indexes=False when indexes are built after a bulk load.
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_writer(db_path or DB_PATH)
     cursor = conn.cursor()
     
-    # Drop existing table if it exists
+    # Drop existing tables if they exist (triggers are dropped with medicines)
+    for table in LEGACY_FTS_TABLES + tuple(_fts_table(column) for column in FTS_COLUMNS):
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
     cursor.execute('DROP TABLE IF EXISTS medicines')
     
     # Create medicines table
@@ -29,64 +232,49 @@ def initialize_db():
         )
     ''')
     
-    # Drop existing indexes if they exist
-    cursor.execute('DROP INDEX IF EXISTS idx_medicine_name')
-    cursor.execute('DROP INDEX IF EXISTS idx_composition')
-    
-    # Create indexes for faster queries
-    cursor.execute('CREATE INDEX idx_medicine_name ON medicines(medicine_name)')
-    cursor.execute('CREATE INDEX idx_composition ON medicines(composition)')
-
     conn.commit()
+
+    if create_indexes:
+        create_medicine_indexes(conn)
+
     conn.close()
     print("✓ Database schema created successfully!")
 
 
-def insert_medicines_from_csv():
+def insert_medicines_from_csv(csv_path=None, batch_size=DEFAULT_BATCH_SIZE, db_path=None):
     """
-    Initialize database schema and read CSV file to insert medicine data into database.
+    Initialize database schema and stream the CSV file into the database.
+    Rows are inserted in batches with executemany; indexes are built after the load.
     """
-    
-    # Initialize database schema first
-    initialize_db()
+    csv_path = csv_path or CSV_PATH
+    db_path = db_path or DB_PATH
     
     # Check if CSV exists
-    if not os.path.exists(CSV_PATH):
-        print(f"Error: CSV file not found at {CSV_PATH}")
+    if not os.path.exists(csv_path):
+        print(f"Error: CSV file not found at {csv_path}")
         return
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    # Initialize database schema first (indexes come after the load)
+    initialize_db(create_indexes=False, db_path=db_path)
     
-    # Read CSV file
-    df = pd.read_csv(CSV_PATH)
+    conn = connect_writer(db_path)
+    tune_for_load(conn)
     
     skipped_rows = []
+    batches = iter_csv_batches(csv_path, CSV_COLUMNS, batch_size=batch_size)
+    rows, seconds = bulk_insert(conn, INSERT_MEDICINE_SQL, batches, skipped_rows=skipped_rows)
     
-    # Insert data row by row
-    for idx, row in df.iterrows():
-        try:
-            cursor.execute('''
-                INSERT INTO medicines (medicine_name, composition, manufacturer, uses, side_effects)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                row['Medicine Name'],
-                row['Composition'],
-                row['Manufacturer'],
-                row['Uses'],        
-                row['Side_effects'] 
-            ))
-        except Exception as e:
-            skipped_rows.append((idx, row['Medicine Name'], str(e)))
-    
-    conn.commit()
+    index_start = time.perf_counter()
+    create_medicine_indexes(conn)
+    index_seconds = time.perf_counter() - index_start
     
     # Verify import
-    cursor.execute('SELECT COUNT(*) FROM medicines')
-    count = cursor.fetchone()[0]
+    count = conn.execute('SELECT COUNT(*) FROM medicines').fetchone()[0]
     
     print(f"✓ Data imported successfully!")
     print(f"✓ Total medicines inserted: {count}")
+    report_rate("Medicine load", rows, seconds)
+    print(f"✓ Indexes built in {index_seconds:.2f}s")
     
     if skipped_rows:
         print(f"\n⚠️  Skipped {len(skipped_rows)} rows:")
@@ -94,41 +282,24 @@ def insert_medicines_from_csv():
             print(f"  Row {idx}: {medicine}")
     
     conn.close()
+    invalidate(db_path)
+    return count
 
 
 def get_medicine_by_name(medicine_name):
     """
     Query medicine by brand name (case-insensitive partial match).
-    Returns up to 5 results for LLM to choose from.
+    Returns up to 5 results for LLM to choose from, prefix matches and best matches first.
     """
     if not medicine_name or not isinstance(medicine_name, str):
         return None
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT medicine_name, composition, manufacturer, uses, side_effects
-            FROM medicines 
-            WHERE LOWER(medicine_name) LIKE LOWER(?)
-            LIMIT 5
-        ''', (f'%{medicine_name}%',))
-        
-        results = cursor.fetchall()
-        conn.close()
+        results = _search_medicines("medicine_name", medicine_name)
         
         if results:
             # Return list of results (max 5)
-            return [
-                {
-                    "medicine_name": result[0],
-                    "composition": result[1],
-                    "manufacturer": result[2],
-                    "uses": result[3],
-                    "side_effects": result[4]
-                } for result in results
-            ]
+            return _rows_to_medicines(results)
         
         return None
     
@@ -139,35 +310,16 @@ def get_medicine_by_name(medicine_name):
 def get_medicine_by_composition(composition):
     """
     Query medicine by generic name/composition (case-insensitive partial match).
-    Returns up to 5 results for LLM to choose from.
+    Returns up to 5 results for LLM to choose from, prefix matches and best matches first.
     """
     if not composition or not isinstance(composition, str):
         return None
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT medicine_name, composition, manufacturer, uses, side_effects
-            FROM medicines 
-            WHERE LOWER(composition) LIKE LOWER(?)
-            LIMIT 5
-        ''', (f'%{composition}%',))
-        
-        results = cursor.fetchall()
-        conn.close()
+        results = _search_medicines("composition", composition)
         
         if results:
-            return [
-                {
-                    "medicine_name": result[0],
-                    "composition": result[1],
-                    "manufacturer": result[2],
-                    "uses": result[3],
-                    "side_effects": result[4]
-                } for result in results
-            ]
+            return _rows_to_medicines(results)
         
         return None
     
@@ -175,51 +327,46 @@ def get_medicine_by_composition(composition):
         print(f"Database error: {e}")
         return None
 
+@tool(
+    description="Find medicine information by brand name or generic name from local database. Returns up to 5 matching results with manufacturer, uses, and side effects.",
+    params={
+        "search_term": param("The medicine brand name or generic name to search for (e.g., 'Aspirin', 'Ibuprofen')"),
+    },
+    datasets=("medicines",),
+    paginate=True,
+    keep_fields=("medicine_name",),
+)
 def get_medicine_info(search_term):
     """
     Search for medicine by brand name OR generic name (composition).
     Returns up to 5 results. Tries brand name first, then generic name.
+    A term that matches nothing is resolved (aliases, typos) and searched again; those
+    results carry match_confidence and the term that was actually searched.
     """
     if not search_term or not isinstance(search_term, str):
         return None
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
         # First try searching by medicine name (brand)
-        cursor.execute('''
-            SELECT medicine_name, composition, manufacturer, uses, side_effects
-            FROM medicines 
-            WHERE LOWER(medicine_name) LIKE LOWER(?)
-            LIMIT 5
-        ''', (f'%{search_term}%',))
-        
-        results = cursor.fetchall()
+        results = _search_medicines("medicine_name", search_term)
         
         # If no results, try searching by composition (generic name)
         if not results:
-            cursor.execute('''
-                SELECT medicine_name, composition, manufacturer, uses, side_effects
-                FROM medicines 
-                WHERE LOWER(composition) LIKE LOWER(?)
-                LIMIT 5
-            ''', (f'%{search_term}%',))
-            
-            results = cursor.fetchall()
-        
-        conn.close()
+            results = _search_medicines("composition", search_term)
         
         if results:
-            return [
-                {
-                    "medicine_name": result[0],
-                    "composition": result[1],
-                    "manufacturer": result[2],
-                    "uses": result[3],
-                    "side_effects": result[4]
-                } for result in results
-            ]
+            return _rows_to_medicines(results)
+        
+        resolved = resolve_name(search_term, "medicines")
+        if resolved:
+            term = resolved["name"]
+            results = _search_medicines("medicine_name", term) or _search_medicines("composition", term)
+            if results:
+                medicines = _rows_to_medicines(results)
+                for medicine in medicines:
+                    medicine["match_confidence"] = resolved["confidence"]
+                    medicine["matched_term"] = term
+                return medicines
         
         return None
     
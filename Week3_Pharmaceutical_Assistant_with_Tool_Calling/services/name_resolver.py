@@ -0,0 +1,354 @@
+"""
+Drug Name Resolver
+
+Maps the names an LLM produces ("aspirin", "Acetylsalicylic acid", "ibuprofin") to the exact
+names stored in each database, so lookups hit on the first tool call instead of the model
+retrying with different spellings.
+
+The resolver is built once from all three databases and combines:
+- a hash map of normalized names (case, punctuation and dosage text removed)
+- aliases: common international/brand names plus brand -> generic pairs mined from medicines
+- a SymSpell-style deletion index for typo-tolerant (edit distance <= 2) matching
+
+Every resolution carries a confidence between 0 and 1.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from . import db_connection
+from .db_connection import fetch_all
+
+
+# Names the datasets spell one way and users (or models) spell another.
+# Keys and values are normalized names.
+BUILTIN_ALIASES = {
+    "acetylsalicylic acid": "aspirin",
+    "asa": "aspirin",
+    "paracetamol": "acetaminophen",
+    "apap": "acetaminophen",
+    "salbutamol": "albuterol",
+    "adrenaline": "epinephrine",
+    "noradrenaline": "norepinephrine",
+    "frusemide": "furosemide",
+    "lignocaine": "lidocaine",
+    "rifampicin": "rifampin",
+    "glibenclamide": "glyburide",
+    "amoxycillin": "amoxicillin",
+    "co trimoxazole": "trimethoprim sulfamethoxazole",
+    "cotrimoxazole": "trimethoprim sulfamethoxazole",
+    "tylenol": "acetaminophen",
+    "advil": "ibuprofen",
+    "motrin": "ibuprofen",
+    "aleve": "naproxen",
+    "coumadin": "warfarin",
+    "plavix": "clopidogrel",
+    "lipitor": "atorvastatin",
+    "zocor": "simvastatin",
+    "prozac": "fluoxetine",
+    "zoloft": "sertraline",
+    "glucophage": "metformin",
+    "synthroid": "levothyroxine",
+    "lasix": "furosemide",
+    "prilosec": "omeprazole",
+    "viagra": "sildenafil",
+}
+
+SOURCES = ("drugs", "drug_classes", "interactions", "medicines")
+
+MAX_EDIT_DISTANCE = 2
+MAX_INDEXED_LENGTH = 40      # longer names are only matched exactly
+MIN_CONFIDENCE = 0.75        # fuzzy matches below this are not returned
+RESOLUTION_CACHE_SIZE = 4096 # fuzzy results are cached per resolver
+
+CONFIDENCE_EXACT = 1.0
+CONFIDENCE_ALIAS = 0.95
+
+_PARENTHETICAL = re.compile(r"\([^)]*\)")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_DOSAGE = re.compile(r"\b\d+(\.\d+)?\s*(mg|mcg|g|ml|iu|%)\b")
+
+
+def normalize_name(name):
+    """
+    Normalize a drug name for matching: lowercase, dosage text and punctuation removed.
+    "Amoxicillin-Clavulanate" -> "amoxicillin clavulanate", "Paracetamol (500mg)" -> "paracetamol"
+    """
+    if not name or not isinstance(name, str):
+        return ""
+    key = name.lower()
+    key = _DOSAGE.sub(" ", key)
+    key = _NON_ALNUM.sub(" ", key)
+    return " ".join(key.split())
+
+
+def _short_name(name):
+    # "Proton Pump Inhibitors (e.g., Omeprazole)" -> "proton pump inhibitors"
+    return normalize_name(_PARENTHETICAL.sub(" ", name))
+
+
+def _deletes(word, distance):
+    """
+    All strings reachable from word by deleting up to `distance` characters.
+    """
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        next_frontier = set()
+        for item in frontier:
+            for i in range(len(item)):
+                next_frontier.add(item[:i] + item[i + 1:])
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+
+def edit_distance(a, b, limit=MAX_EDIT_DISTANCE):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions).
+    Returns limit + 1 as soon as the distance is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _max_distance(key):
+    # One typo in short names is already a large fraction of the word
+    return 1 if len(key) <= 5 else MAX_EDIT_DISTANCE
+
+
+class DrugNameResolver:
+    """
+    In-memory name index. Build with add_name/add_alias, then call resolve().
+    """
+
+    def __init__(self):
+        self._names = {source: {} for source in SOURCES}
+        self._aliases = {}
+        self._deletes = defaultdict(set)
+        self._indexed = set()
+        self._fuzzy_cache = {}
+
+    def add_name(self, source, surface):
+        """
+        Register a name exactly as stored in a source database.
+        The first surface form seen for a normalized key wins.
+        """
+        names = self._names[source]
+        for key in {normalize_name(surface), _short_name(surface)}:
+            if key:
+                names.setdefault(key, surface)
+                self._index(key)
+
+    def add_alias(self, alias, target):
+        alias_key, target_key = normalize_name(alias), normalize_name(target)
+        if alias_key and target_key and alias_key != target_key:
+            self._aliases.setdefault(alias_key, target_key)
+            self._index(alias_key)
+
+    def _index(self, key):
+        if key in self._indexed or len(key) > MAX_INDEXED_LENGTH:
+            return
+        self._indexed.add(key)
+        for deleted in _deletes(key, _max_distance(key)):
+            self._deletes[deleted].add(key)
+
+    def _lookup(self, key, source):
+        """
+        Resolve a normalized key in a source via exact match, then alias.
+        Returns (surface, method) or None.
+        """
+        names = self._names[source]
+        if key in names:
+            return names[key], "exact"
+        target = self._aliases.get(key)
+        if target and target in names:
+            return names[target], "alias"
+        return None
+
+    def _fuzzy_candidates(self, key):
+        candidates = set()
+        for deleted in _deletes(key, _max_distance(key)):
+            candidates |= self._deletes.get(deleted, set())
+        return candidates
+
+    def resolve(self, name, source, min_confidence=MIN_CONFIDENCE):
+        """
+        Resolve `name` to the spelling stored in `source`.
+
+        Returns {"query", "name", "confidence", "method"} or None when nothing matches
+        with at least min_confidence. method is one of "exact", "alias", "fuzzy".
+        """
+        if source not in self._names:
+            raise ValueError(f"Unknown source '{source}'. Available: {', '.join(SOURCES)}")
+
+        key = normalize_name(name)
+        if not key:
+            return None
+
+        for candidate_key in (key, _short_name(name)):
+            found = self._lookup(candidate_key, source)
+            if found:
+                surface, method = found
+                confidence = CONFIDENCE_EXACT if method == "exact" else CONFIDENCE_ALIAS
+                return {"query": name, "name": surface, "confidence": confidence, "method": method}
+
+        cache_key = (key, source, min_confidence)
+        if cache_key in self._fuzzy_cache:
+            cached = self._fuzzy_cache[cache_key]
+            return dict(cached, query=name) if cached else None
+
+        best = self._best_fuzzy(name, key, source)
+        if not best or best["confidence"] < min_confidence:
+            best = None
+        if len(self._fuzzy_cache) >= RESOLUTION_CACHE_SIZE:
+            self._fuzzy_cache.clear()
+        self._fuzzy_cache[cache_key] = best
+        return dict(best) if best else None
+
+    def _best_fuzzy(self, name, key, source):
+        best = None
+        for candidate in self._fuzzy_candidates(key):
+            found = self._lookup(candidate, source)
+            if not found:
+                continue
+            distance = edit_distance(key, candidate)
+            if distance > MAX_EDIT_DISTANCE:
+                continue
+            confidence = 1.0 - distance / max(len(key), len(candidate))
+            if found[1] == "alias":
+                confidence *= CONFIDENCE_ALIAS
+            confidence = round(confidence, 3)
+            # Ties go to the alphabetically first name so results do not depend on set order
+            if best is None or (-confidence, found[0]) < (-best["confidence"], best["name"]):
+                best = {"query": name, "name": found[0], "confidence": confidence, "method": "fuzzy"}
+        return best
+
+
+def _brand_key(medicine_name):
+    # "Calpol 500mg Tablet" -> "calpol"
+    words = normalize_name(medicine_name).split()
+    return words[0] if words and len(words[0]) >= 4 and not words[0].isdigit() else None
+
+
+def _single_ingredient(composition):
+    if not composition or "+" in composition:
+        return None
+    return _short_name(composition) or None
+
+
+def _safe_fetch(db_path, sql):
+    if not os.path.exists(db_path):
+        return []
+    try:
+        return fetch_all(db_path, sql)
+    except Exception as e:
+        print(f"Name resolver skipped {os.path.basename(db_path)}: {e}")
+        return []
+
+
+def build_resolver():
+    """
+    Build a resolver from whichever of the three databases exist.
+    """
+    medicine_db, interactions_db, drugs_db = _database_paths()
+    resolver = DrugNameResolver()
+
+    for generic_name, drug_class in _safe_fetch(
+            drugs_db, 'SELECT generic_name, drug_class FROM drugs'):
+        resolver.add_name("drugs", generic_name)
+        resolver.add_name("drug_classes", drug_class)
+
+    for drug_a, drug_b in _safe_fetch(
+            interactions_db, 'SELECT drug_a, drug_b FROM drug_interactions'):
+        resolver.add_name("interactions", drug_a)
+        resolver.add_name("interactions", drug_b)
+
+    # Brands map to their most common single-ingredient composition
+    brand_votes = defaultdict(Counter)
+    for medicine_name, composition in _safe_fetch(
+            medicine_db, 'SELECT medicine_name, composition FROM medicines'):
+        ingredient = _single_ingredient(composition)
+        if ingredient:
+            resolver.add_name("medicines", ingredient)
+        brand = _brand_key(medicine_name)
+        if brand:
+            resolver.add_name("medicines", brand)
+            if ingredient:
+                brand_votes[brand][ingredient] += 1
+
+    for brand, votes in brand_votes.items():
+        resolver.add_alias(brand, votes.most_common(1)[0][0])
+
+    for alias, target in BUILTIN_ALIASES.items():
+        resolver.add_alias(alias, target)
+
+    return resolver
+
+
+# Changes made in this process are seen immediately through db_connection.invalidate();
+# changes made by other processes are picked up from file stats, checked at most this often
+STAT_CHECK_INTERVAL = 1.0
+
+_resolver = None
+_resolver_key = None
+_resolver_stats = None
+_next_stat_check = 0.0
+_resolver_lock = threading.Lock()
+
+
+def _database_paths():
+    from . import medicine_dbutil, interactions_dbutil, comprehensive_drug_dbutil
+
+    return (medicine_dbutil.DB_PATH, interactions_dbutil.DB_PATH, comprehensive_drug_dbutil.DB_PATH)
+
+
+def _database_stats(paths):
+    return tuple(db_connection.file_signature(path) for path in paths)
+
+
+def get_resolver():
+    """
+    Return the shared resolver, rebuilding it when any database has changed.
+    """
+    global _resolver, _resolver_key, _resolver_stats, _next_stat_check
+    paths = _database_paths()
+    key = (paths, tuple(db_connection._generation(path) for path in paths))
+    now = time.monotonic()
+    if _resolver is not None and key == _resolver_key:
+        if now < _next_stat_check:
+            return _resolver
+        _next_stat_check = now + STAT_CHECK_INTERVAL
+        if _database_stats(paths) == _resolver_stats:
+            return _resolver
+
+    with _resolver_lock:
+        stats = _database_stats(paths)
+        if _resolver is None or key != _resolver_key or stats != _resolver_stats:
+            _resolver = build_resolver()
+            _resolver_key, _resolver_stats = key, stats
+            _next_stat_check = time.monotonic() + STAT_CHECK_INTERVAL
+    return _resolver
+
+
+def resolve_name(name, source, min_confidence=MIN_CONFIDENCE):
+    """
+    Resolve a name against one source ("drugs", "drug_classes", "interactions", "medicines").
+    """
+    return get_resolver().resolve(name, source, min_confidence=min_confidence)
@@ -1,70 +1,96 @@
-import requests
-import json
+import asyncio
 from typing import Dict
 
+from .openfda_client import get_client, OpenFDAError
+from .medicine_dbutil import get_medicine_info
+from .tool_registry import tool, param
 
+
+def _label_to_dict(label):
+    """
+    Extract the fields the assistant uses from one OpenFDA label result.
+    """
+    return {
+        "brand_name": label.get("openfda", {}).get("brand_name", ["N/A"])[0],
+        "generic_name": label.get("openfda", {}).get("generic_name", ["N/A"])[0],
+        "active_ingredients": label.get("active_ingredient", []),
+        "purpose": label.get("purpose", ["N/A"])[0],
+        "indications": label.get("indications_and_usage", ["N/A"])[0],
+        "warnings": label.get("warnings", ["N/A"])[0]
+    }
+
+
+def normalize_generic_name(generic_name):
+    """
+    The form a generic name is queried and cached under. OpenFDA matches generic names
+    case-insensitively, so "Ibuprofen" and " ibuprofen" are the same lookup.
+    """
+    return " ".join(generic_name.split()).lower()
+
+
+def _drug_lookup_fallback(args, reason):
+    # The local database usually has the same drug when the FDA API is slow or down
+    return {
+        "error": f"OpenFDA lookup unavailable ({reason}).",
+        "local_database_results": get_medicine_info(args.get("generic_name") or ""),
+    }
+
+
+@tool(
+    description="Query the OpenFDA API for drug label information including warnings, indications, active ingredients, and side effects using the generic drug name.",
+    params={
+        "generic_name": param("The generic name of the drug to look up (e.g., 'Aspirin', 'acetylsalicylic acid')"),
+    },
+    ttl=3600,
+    timeout=20.0,
+    fallback=_drug_lookup_fallback,
+)
 def drug_lookup(generic_name: str):
     """
     Query the OpenFDA API to retrieve drug label information by generic name.
     Returns a dictionary with status, brand_name, generic_name, active_ingredients,
     purpose, indications, and warnings.
+    Responses are cached on disk and requests are retried with backoff (see openfda_client).
     """
 
-    print("Inside the drug_lookup function")
-    BASE_URL = "https://api.fda.gov/drug/label.json"
-
-    # Clean and format the generic name for the query
+    # Clean and format the generic name for the query; the normalized name keeps the
+    # response cache and in-flight lookups shared between spellings
     input_generic_name = generic_name.strip()
-    query = f'openfda.generic_name:"{input_generic_name}"'
-
-    params = {
-        "search": query,
-        "limit": 2
-    }
+    query = f'openfda.generic_name:"{normalize_generic_name(input_generic_name)}"'
     
     # Make the API request
     print(f"Querying OpenFDA API for generic name: {input_generic_name}")
     
     try:
-        response = requests.get(BASE_URL, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            print("Successfully retrieved data from OpenFDA API")
-            
-            try:
-                results_info = response.json().get("results", [])
-            except requests.exceptions.JSONDecodeError:
-                print("Error parsing JSON response from OpenFDA API")
-                return {"error": "Failed to parse API response"}
-            
-            if not results_info:
-                return {"error": f"No results found for generic name: {input_generic_name}"}
-            else:
-                active_ingredients = results_info[0].get("active_ingredient", [])
-                extracted_brand_name = results_info[0].get("openfda", {}).get("brand_name", ["N/A"])[0]
-                generic_name = results_info[0].get("openfda", {}).get("generic_name", ["N/A"])[0]
-                purpose = results_info[0].get("purpose", ["N/A"])[0]
-                indications = results_info[0].get("indications_and_usage", ["N/A"])[0]
-                warnings = results_info[0].get("warnings", ["N/A"])[0]
-                response_dict = {
-                    "brand_name": extracted_brand_name,
-                    "generic_name": generic_name,
-                    "active_ingredients": active_ingredients,
-                    "purpose": purpose,
-                    "indications": indications,
-                    "warnings": warnings
-                }
-            return response_dict
-        else:
-            print(f"Failed to retrieve data from OpenFDA API. Status code: {response.status_code}")
-            return {"error": f"API request failed with status code: {response.status_code}"}
-        
-    except requests.exceptions.Timeout:
-        print("Request to OpenFDA API timed out")
-        return {"error": f"Request timeout while querying for generic name: {input_generic_name}"}
-    except requests.exceptions.ConnectionError:
-        print("Connection error while querying OpenFDA API")
-        return {"error": f"Connection error while querying for generic name: {input_generic_name}"}
-    except requests.exceptions.RequestException as e:
+        results_info = get_client().search_labels(query, limit=2)
+    except OpenFDAError as e:
         print(f"Error querying OpenFDA API: {e}")
-        return {"error": f"Failed to retrieve data for generic name: {input_generic_name}"}
\ No newline at end of file
+        if e.status is not None:
+            return {"error": f"API request failed with status code: {e.status}"}
+        return {"error": f"Failed to retrieve data for generic name: {input_generic_name}"}
+    
+    if not results_info:
+        return {"error": f"No results found for generic name: {input_generic_name}"}
+    return _label_to_dict(results_info[0])
+
+
+async def drug_lookup_many(generic_names):
+    """
+    Look up several generic names concurrently; the caller waits about one round trip
+    instead of one per drug. Names that differ only in case or spacing are fetched once.
+    Upstream requests share the client's rate limiter, and lookups already in flight
+    (from this or any other session) are joined instead of repeated.
+    Returns {generic_name: drug_lookup result} keyed by the caller's (stripped) spellings,
+    in input order.
+
+    This is for code calling the service directly: the tool loop already runs the
+    drug_lookup calls of one assistant message concurrently (see tool_calling).
+    """
+    spellings = {}
+    for name in generic_names:
+        if isinstance(name, str) and name.strip():
+            spellings.setdefault(name.strip(), normalize_generic_name(name))
+    lookups = list(dict.fromkeys(spellings.values()))
+    results = await asyncio.gather(*(asyncio.to_thread(drug_lookup, name) for name in lookups))
+    by_name = dict(zip(lookups, results))
+    return {name: by_name[key] for name, key in spellings.items()}
@@ -0,0 +1,364 @@
+"""
+OpenFDA Client
+
+A pooled, cached HTTP client for the OpenFDA drug label API.
+
+- One requests.Session with keep-alive, so repeat lookups skip the TCP/TLS handshake
+- Persistent on-disk response cache (SQLite). Fresh entries are served without a request;
+  stale entries are served immediately while a background refresh runs
+  (stale-while-revalidate); expired entries are still served if the API is failing
+- Bounded exponential backoff with jitter on 429 and 5xx responses, honouring Retry-After
+- A token bucket keeps upstream requests under OpenFDA's per-minute quota
+- Single-flight: concurrent lookups of the same query (from any thread or session)
+  share one upstream request
+
+The base URL is configurable, so tests can point the client at a local stub server.
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .db_connection import resolve_path
+from .tracing import current_span, span
+
+
+BASE_URL = "https://api.fda.gov/drug/label.json"
+CACHE_PATH = resolve_path('db/openfda_cache.db')
+
+REQUEST_TIMEOUT = 10             # seconds per attempt
+POOL_SIZE = 10                   # keep-alive connections per host
+
+FRESH_TTL = 7 * 24 * 3600        # label data changes rarely
+STALE_TTL = 30 * 24 * 3600       # served while a refresh runs in the background
+NOT_FOUND_TTL = 24 * 3600        # "no results" answers are cached for less time
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5               # seconds; doubles on each retry
+BACKOFF_MAX = 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+RATE_LIMIT_PER_MINUTE = 240      # OpenFDA limit without an API key
+RATE_LIMIT_BURST = 10
+
+CACHE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS responses (
+        cache_key TEXT PRIMARY KEY,
+        status INTEGER NOT NULL,
+        body TEXT NOT NULL,
+        fetched_at REAL NOT NULL
+    )
+'''
+CACHE_GET_SQL = 'SELECT status, body, fetched_at FROM responses WHERE cache_key = ?'
+CACHE_PUT_SQL = 'INSERT OR REPLACE INTO responses (cache_key, status, body, fetched_at) VALUES (?, ?, ?, ?)'
+
+
+class OpenFDAError(Exception):
+    """
+    Raised when the API cannot be reached and no cached response is available.
+    `status` is the last HTTP status code, or None for timeouts and connection errors.
+    """
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """
+        Take `tokens`, sleeping as long as needed. Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+    Callers that arrive while a call is running wait for and share its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0              # calls answered by another caller's execution
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return future.result()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses keyed by request URL, shared by all threads.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(CACHE_SCHEMA)
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        Return (status, payload, age_seconds) or None.
+        """
+        with self._lock:
+            row = self._conn.execute(CACHE_GET_SQL, (key,)).fetchone()
+        if row is None:
+            return None
+        status, body, fetched_at = row
+        return status, json.loads(body), time.time() - fetched_at
+
+    def put(self, key, status, payload):
+        with self._lock:
+            self._conn.execute(CACHE_PUT_SQL, (key, status, json.dumps(payload), time.time()))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class OpenFDAClient:
+    """
+    Cached OpenFDA client. Use get_client() for the shared instance.
+    """
+
+    def __init__(self, base_url=BASE_URL, cache_path=CACHE_PATH, fresh_ttl=FRESH_TTL,
+                 stale_ttl=STALE_TTL, not_found_ttl=NOT_FOUND_TTL, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX, timeout=REQUEST_TIMEOUT,
+                 pool_size=POOL_SIZE, rate_limit_per_minute=RATE_LIMIT_PER_MINUTE,
+                 rate_limit_burst=RATE_LIMIT_BURST):
+        self.base_url = base_url
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.not_found_ttl = not_found_ttl
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self.rate_limiter = TokenBucket(rate_limit_per_minute / 60.0, rate_limit_burst)
+        self._flight = SingleFlight()
+        self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="openfda-refresh")
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "cache_hits": 0, "stale_hits": 0,
+                      "rate_limited_seconds": 0.0}
+
+    def cache_key(self, params):
+        return f"{self.base_url}?{urlencode(sorted(params.items()))}"
+
+    def _ttl(self, status):
+        return self.not_found_ttl if status == 404 else self.fresh_ttl
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _request(self, params):
+        """
+        GET with bounded exponential backoff. Returns (status, payload) for 200 and 404.
+        """
+        last_status = None
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            response = None
+            self.stats["rate_limited_seconds"] += self.rate_limiter.acquire()
+            try:
+                self.stats["requests"] += 1
+                with span("http.request", **{"http.method": "GET", "http.url": self.base_url,
+                                             "http.attempt": attempt}) as s:
+                    response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+                    s.set("http.status_code", response.status_code)
+                    s.set("http.response_bytes", len(response.content))
+                last_status = response.status_code
+                if response.status_code == 200:
+                    return 200, response.json()
+                if response.status_code == 404:
+                    # OpenFDA answers "no matches" with 404
+                    return 404, {"results": []}
+                if response.status_code not in RETRY_STATUSES:
+                    raise OpenFDAError(f"API request failed with status code: {response.status_code}",
+                                       response.status_code)
+                last_error = f"API request failed with status code: {response.status_code}"
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                last_status = None
+                last_error = f"{type(e).__name__}: {e}"
+            except ValueError:
+                raise OpenFDAError("Failed to parse API response", last_status)
+
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                time.sleep(self._backoff(attempt, response))
+
+        raise OpenFDAError(last_error, last_status)
+
+    def _fetch_and_store(self, key, params):
+        """
+        Fetch once per key at a time: concurrent callers share the leader's result.
+        """
+        def fetch():
+            status, payload = self._request(params)
+            if self.cache:
+                self.cache.put(key, status, payload)
+            return status, payload
+
+        return self._flight.do(key, fetch)
+
+    def get_stats(self):
+        return dict(self.stats, shared_requests=self._flight.shared)
+
+    def _refresh(self, key, params):
+        try:
+            self._fetch_and_store(key, params)
+        except OpenFDAError as e:
+            print(f"Background refresh failed for {key}: {e}")
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key, params):
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._refresh_pool.submit(self._refresh, key, params)
+
+    def get(self, params):
+        """
+        Return (status, payload) for a label query, from the cache when possible.
+        Raises OpenFDAError if the API fails and nothing is cached.
+        """
+        key = self.cache_key(params)
+        cached = self.cache.get(key) if self.cache else None
+
+        if cached:
+            status, payload, age = cached
+            ttl = self._ttl(status)
+            if age < ttl:
+                self.stats["cache_hits"] += 1
+                current_span().set("openfda.cache", "fresh")
+                return status, payload
+            if age < ttl + self.stale_ttl:
+                self.stats["stale_hits"] += 1
+                current_span().set("openfda.cache", "stale")
+                self._refresh_in_background(key, params)
+                return status, payload
+
+        current_span().set("openfda.cache", "miss")
+        try:
+            return self._fetch_and_store(key, params)
+        except OpenFDAError:
+            if cached:
+                # Serve an expired answer rather than nothing while the API is down
+                print(f"OpenFDA unavailable, serving cached response for {key}")
+                return cached[0], cached[1]
+            raise
+
+    def search_labels(self, search, limit=2):
+        status, payload = self.get({"search": search, "limit": limit})
+        return payload.get("results", [])
+
+    def close(self):
+        self._refresh_pool.shutdown(wait=True)
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the shared client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenFDAClient()
+    return _client
+
+
+def set_client(client):
+    """
+    Replace the shared client (e.g. with one pointed at a stub server).
+    """
+    global _client
+    _client = client
@@ -4,99 +4,51 @@ LLM Tool Definitions in JSON Schema Format
 Comprehensive tool definitions for Phase 2 and Phase 3.
 Includes tools for medicine info, drug lookups, interactions, alternatives, and comparisons.
 Compatible with Claude, ChatGPT, and other LLM APIs.
+
+The schemas are generated by the tool registry from the @tool declarations on the
+service functions (see tool_registry.py); this module selects the Phase 3 tool set and
+holds the Phase 3 system prompt (the same prompt as the notebook) for non-notebook callers.
 """
 
-MEDICINE_TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "get_medicine_info",
-            "description": "Find medicine information by brand name or generic name from local database. Returns up to 5 matching results with manufacturer, uses, and side effects.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "search_term": {
-                        "type": "string",
-                        "description": "The medicine brand name or generic name to search for (e.g., 'Aspirin', 'Ibuprofen')"
-                    }
-                },
-                "required": ["search_term"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "drug_lookup",
-            "description": "Query the OpenFDA API for drug label information including warnings, indications, active ingredients, and side effects using the generic drug name.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "generic_name": {
-                        "type": "string",
-                        "description": "The generic name of the drug to look up (e.g., 'Aspirin', 'acetylsalicylic acid')"
-                    }
-                },
-                "required": ["generic_name"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "check_drug_interactions",
-            "description": "Check for known drug-drug interactions between two medications. Returns interaction severity (Major/Moderate/Minor), mechanism, clinical effects, safer alternatives, and management recommendations.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "drug_a": {
-                        "type": "string",
-                        "description": "The first drug name (e.g., 'Warfarin', 'Aspirin')"
-                    },
-                    "drug_b": {
-                        "type": "string",
-                        "description": "The second drug name (e.g., 'Ibuprofen', 'Naproxen')"
-                    }
-                },
-                "required": ["drug_a", "drug_b"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_therapeutic_alternatives",
-            "description": "Find therapeutic alternatives for a given drug. Returns other drugs in the same therapeutic class with their indications, side effects, dosage forms, and availability (OTC/Prescription).",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "drug_name": {
-                        "type": "string",
-                        "description": "The drug name to find alternatives for (e.g., 'Aspirin', 'Ibuprofen')"
-                    }
-                },
-                "required": ["drug_name"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "compare_drugs",
-            "description": "Compare multiple drugs side-by-side. Returns detailed information on each drug including indications, side effects, dosage, route of administration, availability, and contraindications for easy comparison.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "drug_list": {
-                        "type": "array",
-                        "items": {
-                            "type": "string"
-                        },
-                        "description": "List of drug names to compare (e.g., ['Aspirin', 'Ibuprofen', 'Naproxen'])"
-                    }
-                },
-                "required": ["drug_list"]
-            }
-        }
-    }
-]
\ No newline at end of file
+from . import openfda_api, medicine_dbutil, interactions_dbutil, comprehensive_drug_dbutil, indication_search  # registers the tools
+from .tool_registry import registry
+
+PHASE3_TOOL_NAMES = [
+    "get_medicine_info",
+    "drug_lookup",
+    "check_drug_interactions",
+    "check_interaction_matrix",
+    "get_therapeutic_alternatives",
+    "compare_drugs",
+    "search_by_indication",
+]
+
+MEDICINE_TOOLS = registry.schemas(PHASE3_TOOL_NAMES)
+
+
+PHASE3_SYSTEM_PROMPT = """
+You are a comprehensive pharmaceutical information assistant. Your role is to help users find accurate and reliable information about medications.
+
+You have access to seven tools:
+1. get_medicine_info: Search a local database of medicines by brand or generic name. Returns medicine details including manufacturer, uses, and side effects.
+2. drug_lookup: Query the OpenFDA API for official FDA drug label information including warnings, indications, and safety data.
+3. check_drug_interactions: Check for drug-drug interactions between two medications. Returns severity, mechanism, clinical effects, safer alternatives, and management recommendations.
+4. get_therapeutic_alternatives: Find alternative drugs in the same therapeutic class. Returns comparable medications with indications, side effects, and availability.
+5. compare_drugs: Compare multiple drugs side-by-side with detailed information on indications, side effects, dosage, route of administration, availability, and contraindications.
+6. check_interaction_matrix: Check all pairs in a list of medications for interactions in one call. Returns every interaction found, most severe first.
+7. search_by_indication: Find drugs and medicines used for a condition or symptom. Returns the closest matches from both local databases with a relevance score.
+
+When a user asks about medications:
+1. Use the appropriate tool(s) based on their question
+2. For single drug info → get_medicine_info + drug_lookup
+3. For interactions → check_drug_interactions (two drugs) or check_interaction_matrix (three or more drugs)
+4. For alternatives → get_therapeutic_alternatives
+5. For comparisons → compare_drugs
+6. For "what is used for <condition>" → search_by_indication
+7. Present information clearly and organized
+8. Always emphasize warnings and safety information
+9. Never provide medical advice—only factual information
+10. Remind users to consult healthcare professionals before taking medications
+
+Always prioritize accuracy and user safety.
+"""
@@ -0,0 +1,425 @@
+"""
+In-Process Read Model
+
+The three Week 3 datasets are small enough to keep in memory. When the read model is
+enabled, the service functions answer from it instead of SQLite: every lookup is a dict
+access on prebuilt indexes, with no query, no file access and no row parsing.
+
+- Records are __slots__ objects (one per row), in database row order
+- Hash indexes: drug generic name, drug class, unordered interaction pair (case-insensitive,
+  like the NOCASE SQL) and medicine name/composition trigrams for substring search
+- A snapshot of the rows is written next to the databases, so a new process loads it
+  instead of querying SQLite: a JSON header (with the source file signatures it was built
+  from) followed by plain NumPy column arrays, memory-mapped when loaded. Nothing in it is
+  executed, unlike a pickle
+- The model is rebuilt when any source database changes, checked the same way as the
+  name resolver (process generation immediately, file stats at most once per second)
+
+Enable it once at startup:
+
+    from services.read_model import enable_read_model
+    enable_read_model()
+
+Results match the SQLite path, including the medicine search candidates and ranking.
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from . import db_connection
+from .db_connection import fetch_all, resolve_path
+
+
+SNAPSHOT_PATH = resolve_path('db/read_model.snapshot')
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_ALIGNMENT = 8
+
+STAT_CHECK_INTERVAL = 1.0        # seconds between file stat checks
+MEDICINE_RESULT_LIMIT = 5        # same as the SQL LIMIT
+MEDICINE_CANDIDATE_LIMIT = 200   # same as the SQL candidate caps in medicine_dbutil
+MEDICINE_PREFIX_LIMIT = 5
+TRIGRAM = 3
+
+DRUG_FIELDS = (
+    "generic_name", "drug_class", "indications", "dosage_form", "strength",
+    "route_of_administration", "side_effects", "contraindications",
+    "interaction_warnings", "availability"
+)
+INTERACTION_FIELDS = (
+    "interaction_id", "drug_a", "drug_b", "severity", "mechanism", "clinical_effect",
+    "safer_alternative", "clinical_management", "reference"
+)
+MEDICINE_FIELDS = ("medicine_name", "composition", "manufacturer", "uses", "side_effects")
+
+SOURCE_SQL = {
+    "drugs": f'SELECT {", ".join(DRUG_FIELDS)} FROM drugs ORDER BY id',
+    "interactions": f'SELECT {", ".join(INTERACTION_FIELDS)} FROM drug_interactions ORDER BY interaction_id',
+    "medicines": f'SELECT {", ".join(MEDICINE_FIELDS)} FROM medicines ORDER BY id',
+}
+
+
+class DrugRecord:
+    __slots__ = DRUG_FIELDS
+
+    def __init__(self, row):
+        for field, value in zip(DRUG_FIELDS, row):
+            setattr(self, field, value)
+
+    def row(self):
+        return tuple(getattr(self, field) for field in DRUG_FIELDS)
+
+
+class InteractionRecord:
+    __slots__ = INTERACTION_FIELDS
+
+    def __init__(self, row):
+        for field, value in zip(INTERACTION_FIELDS, row):
+            setattr(self, field, value)
+
+    def row(self):
+        return tuple(getattr(self, field) for field in INTERACTION_FIELDS)
+
+
+class MedicineRecord:
+    __slots__ = MEDICINE_FIELDS + ("name_key", "composition_key")
+
+    def __init__(self, row):
+        for field, value in zip(MEDICINE_FIELDS, row):
+            setattr(self, field, value)
+        self.name_key = (self.medicine_name or "").lower()
+        self.composition_key = (self.composition or "").lower()
+
+    def row(self):
+        return tuple(getattr(self, field) for field in MEDICINE_FIELDS)
+
+
+def _trigrams(text):
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+
+def _pair_key(drug_a, drug_b):
+    return frozenset((drug_a.lower(), drug_b.lower()))
+
+
+class ReadModel:
+    """
+    Records and hash indexes for whichever sources were loaded.
+    Query methods return rows shaped like the corresponding SQL statements.
+    """
+
+    def __init__(self, rows):
+        self.sources = frozenset(rows)
+
+        self.drugs = [DrugRecord(row) for row in rows.get("drugs", ())]
+        self.drugs_by_name = {}
+        self.drugs_by_class = defaultdict(list)
+        for drug in self.drugs:
+            self.drugs_by_name.setdefault(drug.generic_name, drug)
+            self.drugs_by_class[drug.drug_class].append(drug)
+
+        self.interactions = [InteractionRecord(row) for row in rows.get("interactions", ())]
+        self.interactions_by_pair = defaultdict(list)
+        for interaction in self.interactions:
+            self.interactions_by_pair[_pair_key(interaction.drug_a, interaction.drug_b)].append(interaction)
+
+        self.medicines = [MedicineRecord(row) for row in rows.get("medicines", ())]
+        self.medicine_trigrams = {"medicine_name": defaultdict(set), "composition": defaultdict(set)}
+        for position, medicine in enumerate(self.medicines):
+            for gram in _trigrams(medicine.name_key):
+                self.medicine_trigrams["medicine_name"][gram].add(position)
+            for gram in _trigrams(medicine.composition_key):
+                self.medicine_trigrams["composition"][gram].add(position)
+
+    # Drugs ---------------------------------------------------------------
+
+    def drug_row(self, generic_name):
+        """
+        The DRUG_DETAILS_SQL row for generic_name, or None.
+        """
+        drug = self.drugs_by_name.get(generic_name)
+        return drug.row() if drug else None
+
+    def drug_rows(self, generic_names):
+        return [self.drugs_by_name[name].row() for name in generic_names if name in self.drugs_by_name]
+
+    def class_rows(self, drug_class):
+        """
+        DRUGS_BY_CLASS_SQL rows: generic_name, drug_class, indications, side_effects, availability.
+        """
+        return [
+            (d.generic_name, d.drug_class, d.indications, d.side_effects, d.availability)
+            for d in self.drugs_by_class.get(drug_class, ())
+        ]
+
+    def alternative_rows(self, generic_name):
+        """
+        THERAPEUTIC_ALTERNATIVES_SQL rows: the queried drug's name and class, then one
+        alternative per row (all None when the drug is alone in its class).
+        """
+        drug = self.drugs_by_name.get(generic_name)
+        if drug is None:
+            return []
+        head = (drug.generic_name, drug.drug_class)
+        rows = [
+            head + (d.generic_name, d.drug_class, d.indications, d.side_effects, d.availability)
+            for d in self.drugs_by_class[drug.drug_class] if d.generic_name != drug.generic_name
+        ]
+        return rows or [head + (None,) * 5]
+
+    # Interactions ----------------------------------------------------------
+
+    def interaction_row(self, drug_a, drug_b):
+        """
+        The first INTERACTION_PAIR_SQL row for the pair (either order, case-insensitive), or None.
+        """
+        found = self.interactions_by_pair.get(_pair_key(drug_a, drug_b))
+        return found[0].row() if found else None
+
+    # Medicines -----------------------------------------------------------
+
+    def search_medicines(self, column, term, min_term_length=TRIGRAM):
+        """
+        Case-insensitive substring search on medicine_name or composition, with the same
+        candidates and order as the SQL: the first MEDICINE_CANDIDATE_LIMIT matches by id
+        plus the first prefix matches in index order, ranked prefix matches first, then
+        shortest value, then id. Terms shorter than min_term_length are matched as a
+        prefix, like the SQL path.
+        """
+        key_attr = "name_key" if column == "medicine_name" else "composition_key"
+        term = term.strip().lower()
+
+        def prefix_matches(positions, limit):
+            # The NOCASE index yields prefix matches by value, then id
+            found = (p for p in positions if getattr(self.medicines[p], key_attr).startswith(term))
+            return heapq.nsmallest(limit, found, key=lambda p: (getattr(self.medicines[p], key_attr), p))
+
+        if len(term) < min_term_length:
+            positions = prefix_matches(range(len(self.medicines)), MEDICINE_RESULT_LIMIT)
+            return [self.medicines[position].row() for position in positions]
+
+        postings = [self.medicine_trigrams[column].get(gram) for gram in _trigrams(term)]
+        if not all(postings):
+            return []
+        matches = sorted(p for p in set.intersection(*sorted(postings, key=len))
+                         if term in getattr(self.medicines[p], key_attr))
+        candidates = set(matches[:MEDICINE_CANDIDATE_LIMIT]) | set(prefix_matches(matches, MEDICINE_PREFIX_LIMIT))
+
+        def rank(position):
+            medicine = self.medicines[position]
+            return (not getattr(medicine, key_attr).startswith(term), len(getattr(medicine, column)), position)
+
+        best = heapq.nsmallest(MEDICINE_RESULT_LIMIT, candidates, key=rank)
+        return [self.medicines[position].row() for position in best]
+
+
+def _source_paths():
+    from . import medicine_dbutil, interactions_dbutil, comprehensive_drug_dbutil
+
+    return {
+        "drugs": comprehensive_drug_dbutil.DB_PATH,
+        "interactions": interactions_dbutil.DB_PATH,
+        "medicines": medicine_dbutil.DB_PATH,
+    }
+
+
+def _file_stats(paths):
+    """
+    File stats of each source. The process-local generation is left out so a snapshot is
+    valid in other processes, and an empty WAL (created by the first reader) counts as none.
+    """
+    stats = {}
+    for source, path in paths.items():
+        _, db_stat, wal_stat = db_connection.file_signature(path)
+        stats[source] = (db_stat, wal_stat if wal_stat and wal_stat[2] else None)
+    return stats
+
+
+def _load_rows(paths):
+    rows = {}
+    for source, path in paths.items():
+        if not os.path.exists(path):
+            continue
+        try:
+            rows[source] = fetch_all(path, SOURCE_SQL[source])
+        except Exception as e:
+            print(f"Read model skipped {source}: {e}")
+    return rows
+
+
+def _aligned(size):
+    return -(-size // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+def _column_arrays(values):
+    """
+    Encode one column as NumPy arrays: INTEGER columns as int64 values, TEXT columns as
+    one UTF-8 blob with character offsets; both with a null mask.
+    """
+    nulls = np.array([value is None for value in values], dtype=np.bool_)
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, int) for value in present):
+        return "int", {"values": np.array([value or 0 for value in values], dtype=np.int64), "nulls": nulls}
+    if not all(isinstance(value, str) for value in present):
+        raise TypeError("only INTEGER and TEXT columns can be stored in a snapshot")
+    texts = [value or "" for value in values]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    data = np.frombuffer("".join(texts).encode("utf-8"), dtype=np.uint8)
+    return "text", {"data": data, "offsets": offsets, "nulls": nulls}
+
+
+def _column_values(kind, arrays):
+    nulls = arrays["nulls"].tolist()
+    if kind == "int":
+        return [None if null else value for value, null in zip(arrays["values"].tolist(), nulls)]
+    text = arrays["data"].tobytes().decode("utf-8")
+    offsets = arrays["offsets"].tolist()
+    return [None if null else text[start:end] for start, end, null in zip(offsets, offsets[1:], nulls)]
+
+
+def load_snapshot(snapshot_path, paths, stats):
+    """
+    Return the rows stored in a snapshot, or None if it is missing or out of date.
+
+    The file is memory-mapped; only the header is parsed before the signatures are checked.
+    """
+    try:
+        buffer = np.memmap(snapshot_path, dtype=np.uint8, mode="r")
+        header_size = int.from_bytes(buffer[:8].tobytes(), "little")
+        header = json.loads(buffer[8:8 + header_size].tobytes())
+        if (header.get("format") != SNAPSHOT_FORMAT or header.get("paths") != paths
+                or header.get("stats") != json.loads(json.dumps(stats))):
+            return None
+        start = _aligned(8 + header_size)
+        rows = {}
+        for source, columns in header["sources"].items():
+            values = []
+            for kind, layout in columns:
+                arrays = {name: buffer[start + offset:start + offset + size].view(dtype)
+                          for name, (dtype, offset, size) in layout.items()}
+                values.append(_column_values(kind, arrays))
+            rows[source] = list(zip(*values))
+        return rows
+    except (OSError, ValueError, KeyError, TypeError, IndexError):
+        return None
+
+
+def save_snapshot(snapshot_path, paths, stats, rows):
+    """
+    Write the snapshot to a side file and rename it into place.
+
+    Layout: the header size (8 bytes, little-endian), the JSON header, then the column
+    arrays from the next SNAPSHOT_ALIGNMENT boundary on. The header records each array's
+    dtype, offset (from the start of the arrays) and size.
+    """
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        sources, arrays, offsets, size = {}, [], [], 0
+        for source, source_rows in rows.items():
+            columns = []
+            for values in zip(*source_rows):
+                kind, parts = _column_arrays(values)
+                layout = {}
+                for name, array in parts.items():
+                    layout[name] = (array.dtype.str, size, array.nbytes)
+                    arrays.append(array)
+                    offsets.append(size)
+                    size = _aligned(size + array.nbytes)
+                columns.append((kind, layout))
+            sources[source] = columns
+        header = json.dumps({"format": SNAPSHOT_FORMAT, "paths": paths, "stats": stats,
+                             "sources": sources}).encode()
+
+        with open(tmp_path, "wb") as f:
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            start = _aligned(f.tell())
+            for array, offset in zip(arrays, offsets):
+                f.write(b"\0" * (start + offset - f.tell()))
+                f.write(array.tobytes())
+        os.replace(tmp_path, snapshot_path)
+    except (OSError, TypeError) as e:
+        print(f"Could not write read model snapshot: {e}")
+
+
+def build_read_model(snapshot_path=None):
+    """
+    Build a ReadModel from the snapshot when it matches the databases, else from SQLite
+    (refreshing the snapshot). snapshot_path=None skips the snapshot entirely.
+    """
+    paths = _source_paths()
+    stats = _file_stats(paths)
+    rows = load_snapshot(snapshot_path, paths, stats) if snapshot_path else None
+    if rows is None:
+        rows = _load_rows(paths)
+        if snapshot_path:
+            save_snapshot(snapshot_path, paths, stats, rows)
+    return ReadModel(rows)
+
+
+_enabled = False
+_snapshot_path = SNAPSHOT_PATH
+_model = None
+_model_key = None
+_model_stats = None
+_next_stat_check = 0.0
+_model_lock = threading.Lock()
+
+
+def enable_read_model(snapshot_path=SNAPSHOT_PATH):
+    """
+    Serve lookups from memory from now on. Builds (or loads) the model immediately.
+    """
+    global _enabled, _snapshot_path
+    _snapshot_path = snapshot_path
+    _enabled = True
+    return get_read_model()
+
+
+def disable_read_model():
+    global _enabled, _model
+    _enabled = False
+    _model = None
+
+
+def get_read_model():
+    """
+    Return the shared read model, rebuilding it when a source database has changed.
+    None when the read model is disabled.
+    """
+    global _model, _model_key, _model_stats, _next_stat_check
+    if not _enabled:
+        return None
+
+    paths = _source_paths()
+    key = tuple((path, db_connection._generation(path)) for path in paths.values())
+    now = time.monotonic()
+    if _model is not None and key == _model_key:
+        if now < _next_stat_check:
+            return _model
+        _next_stat_check = now + STAT_CHECK_INTERVAL
+        if _file_stats(paths) == _model_stats:
+            return _model
+
+    with _model_lock:
+        stats = _file_stats(paths)
+        if _model is None or key != _model_key or stats != _model_stats:
+            _model = build_read_model(_snapshot_path)
+            _model_key, _model_stats = key, stats
+            _next_stat_check = time.monotonic() + STAT_CHECK_INTERVAL
+    return _model
+
+
+def active_read_model(source):
+    """
+    The read model if it is enabled and holds `source` ("drugs", "interactions",
+    "medicines"), else None - callers then query SQLite.
+    """
+    model = get_read_model()
+    return model if model is not None and source in model.sources else None
@@ -0,0 +1,294 @@
+"""
+ASGI Server
+
+Serves the Phase 3 assistant over HTTP, outside the notebook, with several worker processes:
+
+    python -m services.server --workers 4 --port 8000 --max-concurrency 256
+    uvicorn services.server:app --workers 4          # same app, settings from the environment
+
+Endpoints:
+    POST /v1/chat   {"message": "...", "history": [...]} -> NDJSON stream of chat events
+                    (tool_start / tool_end / text / done, see tool_calling.stream_tool_loop)
+    GET  /healthz   worker status
+    GET  /metrics   admission, client pool and TTFVO stats for this worker
+
+Each worker process:
+- warms the name resolver and interaction pair index at startup (and the read model when
+  enabled). The SQLite files are opened read-only and memory-mapped, so all workers share
+  the OS page cache instead of each holding its own copy
+- sends model requests through a pool of AsyncOpenAI clients (each keeps its own HTTP
+  connection pool); tools run on the tool thread pool without blocking the event loop
+- runs at most max_concurrency chats at once; up to max_queue more wait for a slot and
+  anything beyond that is answered with 503
+
+Settings are read from environment variables (see load_config), which is also how main()
+hands its command-line options to the worker processes uvicorn starts.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+
+from .asgi import Admission, ServerBusy, end_stream, encode_json, read_body, send_chunk, send_json, start_stream
+from .phase3_medicine_llm_schema import MEDICINE_TOOLS, PHASE3_SYSTEM_PROMPT
+from .tool_calling import MAX_ITERATIONS, astream_tool_loop, build_messages, set_tool_workers, stream_metrics
+
+
+ENV_SETTINGS = {
+    # config key: (environment variable, type, default)
+    "model": ("MEDPROFILE_MODEL", str, "gpt-4o-mini"),
+    "base_url": ("OPENAI_BASE_URL", str, None),
+    "api_key": ("OPENAI_API_KEY", str, None),
+    "client_pool_size": ("MEDPROFILE_CLIENT_POOL_SIZE", int, 4),
+    "max_concurrency": ("MEDPROFILE_MAX_CONCURRENCY", int, 256),
+    "max_queue": ("MEDPROFILE_MAX_QUEUE", int, 512),
+    "tool_workers": ("MEDPROFILE_TOOL_WORKERS", int, 32),
+    "max_iterations": ("MEDPROFILE_MAX_ITERATIONS", int, MAX_ITERATIONS),
+    "read_model": ("MEDPROFILE_READ_MODEL", bool, False),
+}
+
+
+def _parse(kind, value):
+    if kind is bool:
+        return value.lower() in ("1", "true", "yes", "on")
+    return kind(value)
+
+
+def load_config(**overrides):
+    """
+    Server settings from the environment (after .env, when python-dotenv is installed),
+    with keyword overrides.
+    """
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+
+    config = {}
+    for key, (variable, kind, default) in ENV_SETTINGS.items():
+        value = os.environ.get(variable)
+        config[key] = _parse(kind, value) if value not in (None, "") else default
+    config["system_prompt"] = PHASE3_SYSTEM_PROMPT
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+
+def openai_client_factory(config):
+    def create():
+        from openai import AsyncOpenAI
+
+        # Local servers (Ollama) need some API key, but ignore its value
+        return AsyncOpenAI(api_key=config["api_key"] or "not-needed", base_url=config["base_url"])
+
+    return create
+
+
+class AsyncClientPool:
+    """
+    A fixed set of async model clients plus admission control for the chats using them.
+    session() waits for a free chat slot and hands out the least busy client.
+    """
+
+    def __init__(self, create_client, size, max_concurrency, max_queue):
+        self.clients = [create_client() for _ in range(size)]
+        self.admission = Admission(max_concurrency, max_queue)
+        self._active = [0] * size
+
+    @property
+    def active(self):
+        return sum(self._active)
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        async with self.admission.slot():
+            index = min(range(len(self.clients)), key=self._active.__getitem__)
+            self._active[index] += 1
+            try:
+                yield self.clients[index]
+            finally:
+                self._active[index] -= 1
+
+    def get_stats(self):
+        return dict(self.admission.get_stats(), clients=len(self.clients))
+
+    async def close(self):
+        for client in self.clients:
+            close = getattr(client, "close", None)
+            if close is not None:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+
+
+def warm_up(config):
+    """
+    Load this worker's in-memory indexes before the first request.
+    """
+    from .interactions_dbutil import get_pair_index
+    from .name_resolver import get_resolver
+    from .read_model import enable_read_model
+
+    set_tool_workers(config["tool_workers"])
+    get_resolver()
+    try:
+        get_pair_index()
+    except Exception as e:
+        print(f"Interaction index not loaded: {e}")
+    if config["read_model"]:
+        enable_read_model()
+    print(f"✓ Worker {os.getpid()} ready")
+
+
+HISTORY_ROLES = ("user", "assistant")
+
+
+def _valid_history_item(item):
+    """
+    True if item is a Gradio-style message build_messages can convert.
+    """
+    if not isinstance(item, dict) or item.get("role") not in HISTORY_ROLES:
+        return False
+    content = item.get("content")
+    if isinstance(content, list):
+        return not content or (isinstance(content[0], dict) and isinstance(content[0].get("text"), str))
+    return isinstance(content, str)
+
+
+class ChatServer:
+    """
+    The ASGI application. One instance per worker process.
+    """
+
+    def __init__(self, config=None, create_client=None):
+        self.config = config or load_config()
+        self.create_client = create_client
+        self.pool = None
+        self._start_lock = None
+
+    async def startup(self):
+        if self.pool is not None:
+            return
+        await asyncio.to_thread(warm_up, self.config)
+        create_client = self.create_client or openai_client_factory(self.config)
+        self.pool = AsyncClientPool(create_client, self.config["client_pool_size"],
+                                    self.config["max_concurrency"], self.config["max_queue"])
+
+    async def shutdown(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _ensure_started(self):
+        # For servers that do not send lifespan events
+        if self.pool is None:
+            self._start_lock = self._start_lock or asyncio.Lock()
+            async with self._start_lock:
+                await self.startup()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._ensure_started()
+            await self._route(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _route(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+        if path == "/healthz" and method == "GET":
+            await send_json(send, 200, {"status": "ok", "worker": os.getpid(), "active": self.pool.active})
+        elif path == "/metrics" and method == "GET":
+            await send_json(send, 200, {"worker": os.getpid(), "pool": self.pool.get_stats(),
+                                         "stream": stream_metrics()})
+        elif path == "/v1/chat" and method == "POST":
+            await self._chat(receive, send)
+        else:
+            await send_json(send, 404, {"error": f"No route for {method} {path}"})
+
+    async def _chat(self, receive, send):
+        try:
+            body = await read_body(receive)
+            if body is None:
+                return
+            request = json.loads(body or b"{}")
+        except ValueError as e:
+            await send_json(send, 400, {"error": f"Invalid request: {e}"})
+            return
+
+        message = request.get("message") if isinstance(request, dict) else None
+        history = request.get("history") or [] if isinstance(request, dict) else []
+        if not isinstance(message, str) or not message.strip() or not isinstance(history, list):
+            await send_json(send, 400, {"error": "Expected {\"message\": str, \"history\": list}"})
+            return
+        if not all(_valid_history_item(h) for h in history):
+            await send_json(send, 400, {"error": "Each history item must be {\"role\": \"user\" or \"assistant\", "
+                                                 "\"content\": str or [{\"text\": str}]}"})
+            return
+
+        messages = build_messages(self.config["system_prompt"], message, history)
+        try:
+            async with self.pool.session() as client:
+                await start_stream(send, b"application/x-ndjson")
+                try:
+                    async for event in astream_tool_loop(client, self.config["model"], messages, tools=MEDICINE_TOOLS,
+                                                         max_iterations=self.config["max_iterations"]):
+                        await send_chunk(send, encode_json(event))
+                except Exception as e:
+                    # Headers are already sent, so the error is reported in the stream
+                    print(f"Chat failed: {e}")
+                    await send_chunk(send, encode_json({"type": "error", "error": f"{type(e).__name__}: {e}"}))
+                await end_stream(send)
+        except ServerBusy as e:
+            await send_json(send, 503, {"error": f"Server busy: {e}"})
+
+
+app = ChatServer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the pharmaceutical assistant ASGI server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--model")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. http://localhost:11434/v1 for Ollama")
+    parser.add_argument("--max-concurrency", type=int, help="chats running at once per worker")
+    parser.add_argument("--max-queue", type=int, help="chats waiting for a slot per worker before 503")
+    parser.add_argument("--client-pool-size", type=int, help="async model clients per worker")
+    parser.add_argument("--tool-workers", type=int, help="tool threads per worker")
+    parser.add_argument("--read-model", action="store_true", help="answer lookups from the in-process read model")
+    args = parser.parse_args(argv)
+
+    # Worker processes import services.server:app afresh and read their settings from here
+    for key, (variable, _, _) in ENV_SETTINGS.items():
+        value = getattr(args, key, None)
+        if value not in (None, False):
+            os.environ[variable] = str(value)
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("uvicorn is required to run the server: pip install uvicorn")
+        return
+    uvicorn.run("services.server:app", host=args.host, port=args.port, workers=args.workers, lifespan="on")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,616 @@
+"""
+Tool Calling Loop
+
+The Phase 3 tool handlers and chat loop as an importable module.
+
+Tools are dispatched through the tool registry (see tool_registry.py), which validates
+arguments and memoizes results. Tool calls from one assistant message are independent,
+so they run at the same time on a thread pool: a turn waits for the slowest tool instead
+of the sum of all of them. Each tool has a timeout, counted from when the call starts
+running; a tool that times out or raises is answered with its fallback (or an error message)
+so the model can still respond.
+Results are returned in the original tool_call_id order.
+
+stream_tool_loop is the streaming version of the loop for chat UIs: it yields an event as
+each tool call starts and finishes and the answer text as it is generated, assembling
+streamed tool-call deltas along the way. Time to first visible output (TTFVO) is recorded
+for every turn. astream_tool_loop is the same loop for async clients (the ASGI server).
+
+Each turn is traced (see tracing.py) as chat.turn -> llm.iteration -> llm.completion and
+tool.<name> spans, the tools' SQLite and HTTP spans nested below them.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .phase3_medicine_llm_schema import MEDICINE_TOOLS
+from .tool_registry import registry as default_registry
+from .tool_results import to_json
+from .tracing import context_runner, span, tracer
+
+
+MAX_WORKERS = 8
+DEFAULT_TOOL_TIMEOUT = 10.0      # seconds, for tools without a declared timeout
+QUEUE_TIMEOUT = 30.0             # seconds a call may wait for a free worker before it is given up
+QUEUE_POLL_INTERVAL = 0.05       # how often queued calls are checked for having started
+MAX_STUCK_THREADS = 64           # cap on worker threads left running by timed-out calls
+
+MAX_ITERATIONS = 5
+STREAM_METRICS_WINDOW = 200      # recent streamed turns kept for stream_metrics()
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="tool")
+_pool_size = MAX_WORKERS
+_stuck = {"pool": 0, "total": 0}     # timed-out calls still running: in the shared pool, overall
+_stuck_lock = threading.Lock()
+
+
+def set_tool_workers(max_workers):
+    """
+    Replace the shared tool thread pool with one of max_workers threads (e.g. for a server
+    handling many sessions at once). Calls already running finish on the old pool.
+    """
+    global _executor, _pool_size
+    with _stuck_lock:
+        old, _executor = _executor, ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        _pool_size = max_workers
+        _stuck["pool"] = 0
+    old.shutdown(wait=False)
+
+
+def _release_stuck(executor):
+    with _stuck_lock:
+        _stuck["total"] -= 1
+        if executor is _executor:
+            _stuck["pool"] -= 1
+
+
+def _abandon(future, executor):
+    """
+    Account for a timed-out call whose worker thread keeps running: threads cannot be
+    interrupted, so it holds its worker until the tool returns. Once half of the shared pool
+    is held this way, the pool is replaced so later turns are not starved; the held threads
+    exit when their calls return. No more than MAX_STUCK_THREADS are left behind like this.
+    """
+    if executor is not _executor:
+        return
+    with _stuck_lock:
+        _stuck["pool"] += 1
+        _stuck["total"] += 1
+        replace = _stuck["pool"] * 2 >= _pool_size
+        room = _stuck["total"] <= MAX_STUCK_THREADS
+    future.add_done_callback(lambda _: _release_stuck(executor))
+    if replace and room:
+        print(f"Tool pool: {_stuck['pool']} of {_pool_size} workers held by timed-out calls, starting a new pool")
+        set_tool_workers(_pool_size)
+    elif replace:
+        print(f"Tool pool: {_stuck['total']} threads held by timed-out calls, not replacing the pool again")
+
+
+def tool_call_parts(tool_call):
+    """
+    Return (id, name, arguments) for an OpenAI tool call object or an equivalent dict.
+    """
+    if isinstance(tool_call, dict):
+        function = tool_call.get("function", {})
+        return tool_call.get("id"), function.get("name"), function.get("arguments")
+    return tool_call.id, tool_call.function.name, tool_call.function.arguments
+
+
+def parse_arguments(arguments):
+    try:
+        args = json.loads(arguments or "{}")
+    except json.JSONDecodeError as e:
+        print("Error parsing tool call arguments:", e)
+        return {}
+    return args if isinstance(args, dict) else {}
+
+
+def run_tool(name, args, registry=None, token_budget=None):
+    """
+    Run one tool synchronously through the registry (validation, memoization,
+    projection/pagination and the token budget).
+    """
+    with span(f"tool.{name}", **{"tool.name": name}) as s:
+        result = (registry or default_registry).run(name, args, token_budget=token_budget)
+        if s.recording:
+            s.set("tool.result_bytes", len(to_json(result).encode("utf-8")))
+    return result
+
+
+def _record_usage(s, usage):
+    if usage is not None and s.recording:
+        s.set("gen_ai.usage.input_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        s.set("gen_ai.usage.output_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+def _completion(client, iteration, **kwargs):
+    with span("llm.completion", **{"gen_ai.request.model": kwargs["model"], "llm.iteration": iteration}) as s:
+        response = client.chat.completions.create(**kwargs)
+        _record_usage(s, getattr(response, "usage", None))
+    return response
+
+
+def _fallback(registry, name, args, reason):
+    print(f"Tool '{name}' failed: {reason}")
+    tool = registry.get(name)
+    if tool and tool.fallback:
+        try:
+            return tool.fallback(args, reason)
+        except Exception as e:
+            print(f"Fallback for '{name}' failed: {e}")
+    return {"error": f"Tool {name} failed: {reason}"}
+
+
+def _timeout(registry, name, timeouts):
+    if timeouts and name in timeouts:
+        return timeouts[name]
+    tool = registry.get(name)
+    return tool.timeout if tool else DEFAULT_TOOL_TIMEOUT
+
+
+def _track_start(fn, run):
+    def tracked(*args):
+        run["started"] = time.monotonic()
+        return fn(*args)
+    return tracked
+
+
+def _submit_tool_calls(tool_calls, executor, timeouts, registry, token_budget, parent_span):
+    """
+    Submit every call to the executor. Returns (started, {future: call info}, tool_start events).
+    """
+    started = time.monotonic()
+    pending = {}
+    events = []
+    for index, tool_call in enumerate(tool_calls):
+        call_id, name, arguments = tool_call_parts(tool_call)
+        args = parse_arguments(arguments)
+        run = {"started": None, "executor": executor}
+        future = executor.submit(_track_start(context_runner(run_tool, parent_span), run),
+                                 name, args, registry, token_budget)
+        pending[future] = (index, call_id, name, args, _timeout(registry, name, timeouts), started, run)
+        events.append({"type": "tool_start", "index": index, "id": call_id, "name": name, "arguments": args})
+    return started, pending, events
+
+
+def _deadline(info):
+    # A call's timeout runs from when a worker picks it up; queued calls wait up to QUEUE_TIMEOUT
+    timeout, submitted, run = info[4:]
+    if run["started"] is not None:
+        return run["started"] + timeout
+    return submitted + QUEUE_TIMEOUT
+
+
+def _wait_time(pending, now):
+    nearest = min(_deadline(info) for info in pending.values())
+    if any(info[6]["started"] is None for info in pending.values()):
+        nearest = min(nearest, now + QUEUE_POLL_INTERVAL)
+    return max(0.0, nearest - now)
+
+
+def _tool_end_event(registry, info, future, timed_out, seconds):
+    index, call_id, name, args, timeout, _, run = info
+    ok = False
+    if timed_out:
+        if future.cancel():
+            reason = f"not started within {QUEUE_TIMEOUT:g}s, every tool worker was busy"
+        else:
+            # A running worker thread cannot be interrupted; its late result is discarded
+            _abandon(future, run["executor"])
+            reason = f"timed out after {timeout:g}s"
+        result = _fallback(registry, name, args, reason)
+    else:
+        try:
+            result = future.result()
+            ok = True
+        except Exception as e:
+            result = _fallback(registry, name, args, f"{type(e).__name__}: {e}")
+    return {"type": "tool_end", "index": index, "id": call_id, "name": name,
+            "seconds": round(seconds, 3), "ok": ok, "result": result}
+
+
+def _finished(pending, done, now):
+    # Completed calls, then calls whose deadline has passed
+    finished = [(future, False) for future in done]
+    finished += [(future, True) for future, info in pending.items() if future not in done and _deadline(info) <= now]
+    return finished
+
+
+def iter_tool_calls(tool_calls, executor=None, timeouts=None, registry=None, token_budget=None,
+                    parent_span=None):
+    """
+    Run tool calls concurrently, yielding progress events:
+    {"type": "tool_start", ...} for every call as it is submitted, then
+    {"type": "tool_end", ..., "seconds", "ok", "result"} for each call as it finishes.
+    Each call gets its tool's timeout (overridable per name via `timeouts`), measured
+    from when a worker starts it; a call still queued after QUEUE_TIMEOUT is given up. token_budget caps each result (see tool_results).
+    parent_span: the span tool spans nest under (default: the current span).
+    """
+    registry = registry or default_registry
+    started, pending, events = _submit_tool_calls(tool_calls, executor or _executor, timeouts, registry,
+                                                  token_budget, parent_span)
+    yield from events
+
+    while pending:
+        done, _ = wait(pending, timeout=_wait_time(pending, time.monotonic()), return_when=FIRST_COMPLETED)
+        now = time.monotonic()
+        for future, timed_out in _finished(pending, done, now):
+            yield _tool_end_event(registry, pending.pop(future), future, timed_out, now - started)
+
+
+async def aiter_tool_calls(tool_calls, executor=None, timeouts=None, registry=None, token_budget=None,
+                           parent_span=None):
+    """
+    iter_tool_calls for asyncio: the tools still run on the thread pool, but waiting for
+    them does not block the event loop.
+    """
+    registry = registry or default_registry
+    started, pending, events = _submit_tool_calls(tool_calls, executor or _executor, timeouts, registry,
+                                                  token_budget, parent_span)
+    for event in events:
+        yield event
+
+    waiting = {asyncio.wrap_future(future): future for future in pending}
+    while waiting:
+        done, _ = await asyncio.wait(waiting, timeout=_wait_time(pending, time.monotonic()),
+                                     return_when=asyncio.FIRST_COMPLETED)
+        now = time.monotonic()
+        done_futures = {waiting[wrapper] for wrapper in done}
+        for future, timed_out in _finished(pending, done_futures, now):
+            wrapper = next(w for w, f in waiting.items() if f is future)
+            del waiting[wrapper]
+            if timed_out:
+                wrapper.cancel()
+            yield _tool_end_event(registry, pending.pop(future), future, timed_out, now - started)
+
+
+def execute_tool_calls(tool_calls, executor=None, timeouts=None, registry=None, token_budget=None):
+    """
+    Run tool calls concurrently and return [(tool_call_id, name, result)] in input order.
+    See iter_tool_calls for timeouts and fallbacks.
+    """
+    results = {}
+    for event in iter_tool_calls(tool_calls, executor, timeouts, registry, token_budget):
+        if event["type"] == "tool_end":
+            results[event["index"]] = (event["id"], event["name"], event["result"])
+    return [results[index] for index in sorted(results)]
+
+
+def handle_tool_calls(message, executor=None, timeouts=None, registry=None, token_budget=None):
+    """
+    Execute the tool calls of an assistant message.
+    Returns tool messages ready to append to the conversation, in tool_call_id order.
+    """
+    return [
+        {
+            "role": "tool",
+            "tool_call_id": call_id,
+            "content": to_json(result)
+        }
+        for call_id, _, result in execute_tool_calls(message.tool_calls, executor, timeouts, registry, token_budget)
+    ]
+
+
+def build_messages(system_prompt, message, history):
+    """
+    Convert a Gradio message and history into OpenAI chat messages.
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    for h in history:
+        content = h["content"]
+        if isinstance(content, list):
+            content = content[0]["text"] if content else ""
+        messages.append({"role": h["role"], "content": content})
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def run_tool_loop(client, model, messages, tools=MEDICINE_TOOLS, max_iterations=MAX_ITERATIONS, temperature=0,
+                  token_budget=None):
+    """
+    Call the model, execute any requested tools, and repeat until it answers
+    (or max_iterations rounds of tool calls have run). Returns the final answer text.
+    Pass a smaller token_budget for small-context local models.
+    """
+    with tracer.span("chat.turn", root=True, **{"gen_ai.request.model": model}) as turn:
+        iteration = 0
+        while True:
+            with span("llm.iteration", **{"llm.iteration": iteration}):
+                response = _completion(client, iteration, model=model, messages=messages,
+                                       temperature=temperature, tools=tools)
+                assistant_message = response.choices[0].message
+                if not assistant_message.tool_calls:
+                    break
+                if iteration >= max_iterations:
+                    print("Max iterations reached while processing tool calls. Some tool calls may not have been handled.")
+                    break
+
+                messages.append({
+                    "role": "assistant",
+                    "content": assistant_message.content or "",
+                    "tool_calls": assistant_message.tool_calls
+                })
+                messages.extend(handle_tool_calls(assistant_message, token_budget=token_budget))
+            iteration += 1
+        turn.set("llm.iterations", iteration)
+
+    return assistant_message.content or ""
+
+
+# ----------------------------------------------------------------------
+# Streaming
+# ----------------------------------------------------------------------
+
+_stream_metrics = deque(maxlen=STREAM_METRICS_WINDOW)
+
+
+def _merge_tool_call_deltas(assembled, deltas):
+    """
+    Add streamed tool-call fragments to `assembled` (index -> tool call dict).
+    The id and name arrive in the first fragment of each call; arguments arrive in pieces.
+    """
+    for delta in deltas:
+        call = assembled.setdefault(delta.index, {
+            "id": None, "type": "function", "function": {"name": "", "arguments": ""}
+        })
+        if delta.id:
+            call["id"] = delta.id
+        function = delta.function
+        if function is not None:
+            if function.name:
+                call["function"]["name"] += function.name
+            if function.arguments:
+                call["function"]["arguments"] += function.arguments
+
+
+def _stream_completion(client, model, messages, tools, temperature):
+    """
+    One streamed model call. Yields ("text", delta) as content arrives and finally
+    ("message", content, tool_calls, usage) with the assembled tool calls (a list of
+    dicts) and the usage if the server sent it.
+    """
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        tools=tools,
+        stream=True
+    )
+    content = []
+    assembled = {}
+    usage = None
+    for chunk in stream:
+        usage = getattr(chunk, "usage", None) or usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+            yield ("text", delta.content)
+        if delta.tool_calls:
+            _merge_tool_call_deltas(assembled, delta.tool_calls)
+    yield ("message", "".join(content), [assembled[index] for index in sorted(assembled)], usage)
+
+
+class _StreamingTurn:
+    """
+    Bookkeeping shared by stream_tool_loop and astream_tool_loop: TTFVO metrics, spans
+    and the messages appended for each round of tool calls.
+    """
+
+    def __init__(self, model, messages):
+        self.messages = messages
+        self.started = time.perf_counter()
+        self.metrics = {"ttfvo": None, "first_token": None, "total": None, "iterations": 0, "tool_calls": 0}
+        self.iteration = 0
+        self.content = ""
+        self.model = model
+        # Spans are started and finished explicitly: a generator cannot hold the current
+        # span across yields, since the caller may resume it from another thread
+        self.turn = tracer.start_span("chat.turn", root=True, **{"gen_ai.request.model": model, "llm.stream": True})
+        self.step = None
+        self.completion = None
+        self.tool_results = {}
+
+    def _elapsed(self):
+        return round(time.perf_counter() - self.started, 4)
+
+    def visible(self, event):
+        if self.metrics["ttfvo"] is None:
+            self.metrics["ttfvo"] = self._elapsed()
+        return event
+
+    def begin_completion(self):
+        self.step = tracer.start_span("llm.iteration", parent=self.turn, **{"llm.iteration": self.iteration})
+        self.completion = tracer.start_span("llm.completion", parent=self.step,
+                                            **{"gen_ai.request.model": self.model, "llm.iteration": self.iteration})
+
+    def text(self, delta):
+        if self.metrics["first_token"] is None:
+            self.metrics["first_token"] = self._elapsed()
+        return self.visible({"type": "text", "delta": delta})
+
+    def end_completion(self, content, tool_calls, usage, max_iterations):
+        """
+        Record a finished model call. Returns True when its tool calls should be run.
+        """
+        _record_usage(self.completion, usage)
+        tracer.finish(self.completion)
+        self.completion = None
+        self.content = content
+
+        if not tool_calls or self.iteration >= max_iterations:
+            if tool_calls:
+                print("Max iterations reached while processing tool calls. Some tool calls may not have been handled.")
+            tracer.finish(self.step)
+            self.step = None
+            return False
+
+        self.iteration += 1
+        self.messages.append({"role": "assistant", "content": content, "tool_calls": tool_calls})
+        self.tool_results = {}
+        self.metrics["tool_calls"] += len(tool_calls)
+        return True
+
+    def tool_event(self, event):
+        if event["type"] == "tool_end":
+            self.tool_results[event["index"]] = event
+            event = dict(event)
+            del event["result"]
+        return self.visible(event)
+
+    def end_tools(self):
+        self.messages.extend(
+            {"role": "tool", "tool_call_id": self.tool_results[index]["id"],
+             "content": to_json(self.tool_results[index]["result"])}
+            for index in sorted(self.tool_results)
+        )
+        tracer.finish(self.step)
+        self.step = None
+
+    def fail(self, error):
+        message = f"{type(error).__name__}: {error}"
+        for open_span in (self.completion, self.step, self.turn):
+            if open_span is not None:
+                tracer.finish(open_span, message)
+
+    def done(self):
+        metrics = self.metrics
+        metrics["iterations"] = self.iteration
+        metrics["total"] = self._elapsed()
+        _stream_metrics.append(metrics)
+        for key in ("ttfvo", "first_token"):
+            if metrics[key] is not None:
+                self.turn.set(f"chat.{key}_ms", round(metrics[key] * 1000, 1))
+        self.turn.set("llm.iterations", self.iteration)
+        tracer.finish(self.turn)
+        return {"type": "done", "content": self.content, "metrics": metrics}
+
+
+def stream_tool_loop(client, model, messages, tools=MEDICINE_TOOLS, max_iterations=MAX_ITERATIONS, temperature=0,
+                     token_budget=None):
+    """
+    Streaming run_tool_loop. Yields events as they happen:
+
+        {"type": "tool_start", "name", "arguments", ...}   a tool call was sent
+        {"type": "tool_end", "name", "seconds", "ok", ...}  a tool call finished
+        {"type": "text", "delta"}                            answer text
+        {"type": "done", "content", "metrics"}               the turn is complete
+
+    metrics holds ttfvo (seconds until the first event a user can see), first_token,
+    total, iterations and tool_calls; it is also recorded for stream_metrics().
+    """
+    turn = _StreamingTurn(model, messages)
+    try:
+        while True:
+            turn.begin_completion()
+            for part in _stream_completion(client, model, messages, tools, temperature):
+                if part[0] == "text":
+                    yield turn.text(part[1])
+                else:
+                    _, content, tool_calls, usage = part
+            if not turn.end_completion(content, tool_calls, usage, max_iterations):
+                break
+            for event in iter_tool_calls(tool_calls, token_budget=token_budget, parent_span=turn.step):
+                yield turn.tool_event(event)
+            turn.end_tools()
+    except BaseException as e:
+        # Includes GeneratorExit when the UI stops reading mid-turn
+        turn.fail(e)
+        raise
+    yield turn.done()
+
+
+async def _astream_completion(client, model, messages, tools, temperature):
+    """
+    _stream_completion for an async client (openai.AsyncOpenAI).
+    """
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        tools=tools,
+        stream=True
+    )
+    content = []
+    assembled = {}
+    usage = None
+    async for chunk in stream:
+        usage = getattr(chunk, "usage", None) or usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+            yield ("text", delta.content)
+        if delta.tool_calls:
+            _merge_tool_call_deltas(assembled, delta.tool_calls)
+    yield ("message", "".join(content), [assembled[index] for index in sorted(assembled)], usage)
+
+
+async def astream_tool_loop(client, model, messages, tools=MEDICINE_TOOLS, max_iterations=MAX_ITERATIONS,
+                            temperature=0, token_budget=None):
+    """
+    stream_tool_loop for an async client, as an async generator with the same events.
+    """
+    turn = _StreamingTurn(model, messages)
+    try:
+        while True:
+            turn.begin_completion()
+            async for part in _astream_completion(client, model, messages, tools, temperature):
+                if part[0] == "text":
+                    yield turn.text(part[1])
+                else:
+                    _, content, tool_calls, usage = part
+            if not turn.end_completion(content, tool_calls, usage, max_iterations):
+                break
+            async for event in aiter_tool_calls(tool_calls, token_budget=token_budget, parent_span=turn.step):
+                yield turn.tool_event(event)
+            turn.end_tools()
+    except BaseException as e:
+        turn.fail(e)
+        raise
+    yield turn.done()
+
+
+def stream_chat_text(client, model, messages, **kwargs):
+    """
+    Adapt stream_tool_loop for gr.ChatInterface: yields the message to display so far,
+    a progress line per tool call followed by the answer as it streams.
+    """
+    lines = []
+    positions = {}
+    answer = ""
+
+    for event in stream_tool_loop(client, model, messages, **kwargs):
+        kind = event["type"]
+        if kind == "tool_start":
+            positions[event["id"] or event["index"]] = len(lines)
+            lines.append(f"🔧 Calling {event['name']}…")
+        elif kind == "tool_end":
+            mark = "✓" if event["ok"] else "⚠"
+            lines[positions[event["id"] or event["index"]]] = f"{mark} {event['name']} ({event['seconds']:.1f}s)"
+        elif kind == "text":
+            answer += event["delta"]
+        else:
+            continue
+        progress = "\n".join(lines)
+        yield f"{progress}\n\n{answer}" if progress and answer else progress or answer
+
+
+def stream_metrics():
+    """
+    Summary of recent streamed turns: count and p50/p95 of ttfvo and total seconds.
+    """
+    turns = list(_stream_metrics)
+    summary = {"turns": len(turns)}
+    for key in ("ttfvo", "total"):
+        values = sorted(m[key] for m in turns if m[key] is not None)
+        if values:
+            summary[f"{key}_p50"] = values[len(values) // 2]
+            summary[f"{key}_p95"] = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return summary
@@ -0,0 +1,339 @@
+"""
+Tool Registry
+
+Service functions become LLM tools by decorating them with @tool. The registry builds the
+JSON schema for each tool from the decorator, dispatches calls by name with one dict lookup,
+validates arguments with checks compiled once at registration, and memoizes results.
+
+    @tool(
+        description="Find medicine information by brand or generic name.",
+        params={"search_term": param("The medicine name to search for")},
+        datasets=("medicines",),
+    )
+    def get_medicine_info(search_term):
+        ...
+
+Memoized results are keyed by the tool, its arguments and the version of the datasets it
+reads, so a reload or sync of a database invalidates them immediately; a TTL bounds how
+long results from the network (which has no version) are reused.
+
+Tools that return rows can be declared with paginate=True: their schema gains optional
+fields/limit/cursor arguments, applied by tool_results.shape_result in run().
+"""
+
+import copy
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .db_connection import file_signature
+from .tracing import current_span
+from .tool_results import PAGE_ARGS, shape_result
+
+
+DEFAULT_TTL = 600                # seconds
+DEFAULT_TIMEOUT = 10.0           # seconds, used by the tool-calling loop
+CACHE_MAX_ENTRIES = 2048
+
+_MISS = object()
+
+_JSON_TYPES = {"string": str, "integer": int, "number": (int, float), "boolean": bool, "array": list, "object": dict}
+
+
+def param(description, type="string", items=None, maps_to=None, required=None, default=None):
+    """
+    Describe one tool argument.
+    items: element type for arrays. maps_to: the service function's parameter name when it
+    differs from the name the model sees. required defaults to "the function has no default".
+    """
+    return {
+        "description": description,
+        "type": type,
+        "items": items,
+        "maps_to": maps_to,
+        "required": required,
+        "default": default,
+    }
+
+
+def _dataset_db_path(dataset):
+    from . import dataset_sync
+
+    spec = dataset_sync.DATASETS[dataset]
+    return spec["module"].DB_PATH
+
+
+def dataset_version_key(datasets):
+    """
+    A key that changes whenever any of the datasets' database files changes.
+    """
+    return tuple((path, file_signature(path)) for path in map(_dataset_db_path, datasets))
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, (str, list)) and not value)
+
+
+def _compile_validator(name, spec):
+    """
+    Build the check for one argument: value -> error message or None.
+    Missing values are handled by the caller.
+    """
+    expected = _JSON_TYPES[spec["type"]]
+    item_type = _JSON_TYPES.get(spec["items"]) if spec["items"] else None
+    type_error = f"Argument '{name}' must be of type {spec['type']}."
+    item_error = f"Every item in '{name}' must be of type {spec['items']}."
+    reject_bool = expected is not bool
+
+    def validate(value):
+        if not isinstance(value, expected) or (reject_bool and isinstance(value, bool)):
+            return type_error
+        if item_type and not all(isinstance(item, item_type) for item in value):
+            return item_error
+        return None
+
+    return validate
+
+
+class Tool:
+    """
+    One registered tool: its schema, compiled validators and call options.
+    """
+
+    def __init__(self, fn, name, description, params, datasets, ttl, timeout, on_empty, result_key, fallback,
+                 paginate=False, rows_key=None, default_limit=None, keep_fields=(), token_budget=None):
+        self.fn = fn
+        self.name = name
+        self.description = description
+        self.datasets = tuple(datasets)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.on_empty = on_empty
+        self.result_key = result_key
+        self.fallback = fallback
+        self.paginate = paginate
+        self.rows_key = rows_key
+        self.default_limit = default_limit
+        self.keep_fields = tuple(keep_fields)
+        self.token_budget = token_budget
+
+        signature = inspect.signature(fn)
+        self.params = {}
+        for arg_name, spec in params.items():
+            spec = dict(spec)
+            spec["maps_to"] = spec["maps_to"] or arg_name
+            if spec["maps_to"] not in signature.parameters:
+                raise ValueError(f"Tool '{name}': {fn.__name__}() has no parameter '{spec['maps_to']}'")
+            if spec["required"] is None:
+                spec["required"] = signature.parameters[spec["maps_to"]].default is inspect.Parameter.empty
+            self.params[arg_name] = spec
+
+        self.validators = [
+            (arg_name, spec, _compile_validator(arg_name, spec)) for arg_name, spec in self.params.items()
+        ]
+        self.schema = self._build_schema()
+
+    def _build_schema(self):
+        properties = {}
+        for arg_name, spec in self.params.items():
+            prop = {"type": spec["type"]}
+            if spec["items"]:
+                prop["items"] = {"type": spec["items"]}
+            prop["description"] = spec["description"]
+            properties[arg_name] = prop
+        if self.paginate:
+            properties.update(self._page_properties())
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": [arg_name for arg_name, spec in self.params.items() if spec["required"]]
+                }
+            }
+        }
+
+    def _page_properties(self):
+        limit = f"Maximum number of rows to return (default {self.default_limit})" if self.default_limit \
+            else "Maximum number of rows to return"
+        return {
+            "fields": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Only return these fields of each row (e.g., ['generic_name', 'availability'])"
+            },
+            "limit": {"type": "integer", "description": limit},
+            "cursor": {
+                "type": "string",
+                "description": "next_cursor from a previous call with the same arguments, to get the next rows"
+            },
+        }
+
+    def bind(self, args):
+        """
+        Validate model-supplied args. Returns (kwargs for the service function, error or None).
+        """
+        kwargs = {}
+        for arg_name, spec, validate in self.validators:
+            value = args.get(arg_name)
+            if _is_missing(value):
+                if spec["required"]:
+                    return None, f"Missing required argument '{arg_name}'."
+                if spec["default"] is not None:
+                    kwargs[spec["maps_to"]] = spec["default"]
+                continue
+            error = validate(value)
+            if error:
+                return None, error
+            kwargs[spec["maps_to"]] = value
+        return kwargs, None
+
+    def finish(self, result, args):
+        """
+        Apply on_empty and result_key to a raw service result.
+        """
+        if not result and self.on_empty:
+            return {key: text.format(**args) for key, text in self.on_empty.items()}
+        if self.result_key:
+            return {self.result_key: result}
+        return result
+
+
+class ToolRegistry:
+    """
+    Name -> Tool map with per-tool result memoization.
+    """
+
+    def __init__(self, cache_max_entries=CACHE_MAX_ENTRIES):
+        self.tools = {}
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_max_entries = cache_max_entries
+        self.stats = {"calls": 0, "cache_hits": 0}
+
+    def tool(self, name=None, description="", params=None, datasets=(), ttl=DEFAULT_TTL,
+             timeout=DEFAULT_TIMEOUT, on_empty=None, result_key=None, fallback=None,
+             paginate=False, rows_key=None, default_limit=None, keep_fields=(), token_budget=None):
+        """
+        Decorator registering a service function as a tool. The function is returned unchanged.
+
+        on_empty: dict returned when the function returns nothing, e.g.
+                  {"error": "Drug {drug_name} not found"}; formatted with the tool arguments.
+        result_key: wrap the result as {result_key: result}.
+        fallback: fn(args, reason) used by the tool loop when the tool times out or fails.
+        ttl: seconds to memoize results (0 disables); datasets: names from
+             dataset_sync.DATASETS whose changes invalidate memoized results.
+        paginate: accept fields/limit/cursor for the rows at result[rows_key] (rows_key=None:
+                  the result is the row list). keep_fields survive any projection.
+        token_budget: per-tool override of tool_results.DEFAULT_TOKEN_BUDGET.
+        """
+        def decorator(fn):
+            tool_name = name or fn.__name__
+            self.tools[tool_name] = Tool(
+                fn, tool_name, description, params or {}, datasets, ttl, timeout, on_empty, result_key, fallback,
+                paginate, rows_key, default_limit, keep_fields, token_budget
+            )
+            return fn
+        return decorator
+
+    def get(self, name):
+        return self.tools.get(name)
+
+    def schemas(self, names=None):
+        """
+        JSON schemas for the named tools (all tools when names is None), in the given order.
+        """
+        names = list(self.tools) if names is None else names
+        return [self.tools[name].schema for name in names]
+
+    def _cache_key(self, tool, args):
+        version = dataset_version_key(tool.datasets) if tool.datasets else None
+        return (tool.name, json.dumps(args, sort_keys=True, default=str), version)
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return _MISS
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return _MISS
+            self._cache.move_to_end(key)
+            return copy.deepcopy(result)
+
+    def _cache_put(self, key, ttl, result):
+        with self._cache_lock:
+            self._cache[key] = (time.monotonic() + ttl, copy.deepcopy(result))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def call(self, name, args):
+        """
+        Validate args and run a tool, serving repeat calls from the memo cache.
+        Returns the tool result (a JSON-serializable value); problems are returned as {"error": ...}.
+        """
+        tool = self.tools.get(name)
+        if tool is None:
+            print(f"Unknown tool called: {name}")
+            return {"error": f"Unknown tool called: {name}"}
+
+        kwargs, error = tool.bind(args)
+        if error:
+            return {"error": error}
+
+        self.stats["calls"] += 1
+        key = self._cache_key(tool, kwargs) if tool.ttl else None
+        if key is not None:
+            cached = self._cache_get(key)
+            if cached is not _MISS:
+                self.stats["cache_hits"] += 1
+                current_span().set("tool.cache_hit", True)
+                return cached
+        current_span().set("tool.cache_hit", False)
+
+        print(f"Calling function '{name}' with argument(s) {kwargs}")
+        result = tool.finish(tool.fn(**kwargs), args)
+
+        # Errors (API down, bad input) are not memoized so the next call tries again
+        if key is not None and not (isinstance(result, dict) and "error" in result):
+            self._cache_put(key, tool.ttl, result)
+        return result
+
+    def run(self, name, args, token_budget=None):
+        """
+        call() plus result shaping for a tool message: projection, pagination and the
+        token budget (the tool's own budget, else token_budget, else the default).
+        Continuation pages are served from the memoized full result.
+        """
+        result = self.call(name, args)
+        tool = self.tools.get(name)
+        if tool is None:
+            return result
+
+        page = {key: args[key] for key in PAGE_ARGS if args.get(key) is not None}
+        if "limit" in page and (not isinstance(page["limit"], int) or isinstance(page["limit"], bool)):
+            return {"error": "Argument 'limit' must be of type integer."}
+        if "fields" in page and not (isinstance(page["fields"], list) and all(isinstance(f, str) for f in page["fields"])):
+            return {"error": "Every item in 'fields' must be of type string."}
+
+        budget = tool.token_budget or token_budget
+        options = {"token_budget": budget} if budget else {}
+        return shape_result(
+            result, page, rows_key=tool.rows_key, paginate=tool.paginate,
+            default_limit=tool.default_limit, keep_fields=tool.keep_fields, **options
+        )
+
+
+registry = ToolRegistry()
+tool = registry.tool
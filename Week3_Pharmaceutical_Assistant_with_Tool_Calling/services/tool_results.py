@@ -0,0 +1,183 @@
+"""
+Tool Result Shaping
+
+Tool results are sent back to the model on every later iteration of the tool loop, so
+their size is paid for again and again. Before a result goes into a tool message it is:
+
+- projected: row-returning tools accept `fields` to keep only the columns the model needs
+- paginated: `limit` rows per call, with a `next_cursor` the model passes back for more
+- budgeted: the JSON is measured in tokens (tiktoken, or bytes / 4 when tiktoken or its
+  encoding files are unavailable). Over budget, long text fields are shortened first,
+  then trailing rows are moved to the next page.
+"""
+
+import base64
+import json
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+DEFAULT_TOKEN_BUDGET = 2000      # tokens per tool message
+ENCODING_NAME = "o200k_base"
+BYTES_PER_TOKEN = 4              # estimate used without tiktoken
+
+# Long strings are cut to these lengths in turn until the result fits
+TEXT_CAPS = (2000, 1000, 500, 250, 120)
+TRUNCATION_MARKER = "… [truncated]"
+
+# Tool arguments handled here rather than by the service function
+PAGE_ARGS = ("fields", "limit", "cursor")
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        except Exception as e:
+            # The encoding is downloaded on first use; offline, fall back to the estimate
+            print(f"tiktoken unavailable ({type(e).__name__}), estimating tokens from bytes")
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text.encode("utf-8")) + BYTES_PER_TOKEN - 1) // BYTES_PER_TOKEN
+
+
+def to_json(result):
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Return the row offset stored in a cursor, or None if it is not valid.
+    """
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    return offset if isinstance(offset, int) and offset >= 0 else None
+
+
+def _cap_strings(value, cap):
+    if isinstance(value, str):
+        if len(value) > cap:
+            return value[:cap].rstrip() + TRUNCATION_MARKER
+        return value
+    if isinstance(value, list):
+        return [_cap_strings(item, cap) for item in value]
+    if isinstance(value, dict):
+        return {key: _cap_strings(item, cap) for key, item in value.items()}
+    return value
+
+
+def _project(rows, fields, keep_fields):
+    keep = set(fields) | set(keep_fields) | {"error"}
+    return [
+        {key: value for key, value in row.items() if key in keep} if isinstance(row, dict) else row
+        for row in rows
+    ]
+
+
+def _get_rows(result, rows_key):
+    if rows_key is None:
+        return result if isinstance(result, list) else None
+    if isinstance(result, dict) and isinstance(result.get(rows_key), list):
+        return result[rows_key]
+    return None
+
+
+def _with_rows(result, rows_key, rows, page_info):
+    if rows_key is None:
+        if not page_info:
+            return rows
+        return dict({"results": rows}, **page_info)
+    shaped = dict(result)
+    shaped[rows_key] = rows
+    shaped.update(page_info)
+    return shaped
+
+
+def shape_result(result, page=None, rows_key=None, paginate=False, default_limit=None,
+                 keep_fields=(), token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Apply projection, pagination and the token budget to a tool result.
+
+    page: the model's fields/limit/cursor arguments. rows_key: where the rows are
+    (None = the result is the list of rows). Returns a JSON-serializable value.
+    """
+    page = page or {}
+    rows = _get_rows(result, rows_key) if paginate else None
+
+    if rows is None:
+        return _fit_text(result, token_budget)
+
+    offset = 0
+    if page.get("cursor"):
+        offset = decode_cursor(page["cursor"])
+        if offset is None:
+            return {"error": "Invalid cursor. Repeat the call without a cursor to start over."}
+
+    limit = page.get("limit") or default_limit
+    if isinstance(limit, int) and limit > 0:
+        page_rows = rows[offset:offset + limit]
+    else:
+        page_rows = rows[offset:]
+
+    fields = page.get("fields")
+    if fields:
+        page_rows = _project(page_rows, fields, keep_fields)
+
+    def build(count, text_cap=None):
+        shown = page_rows[:count]
+        if text_cap:
+            shown = _cap_strings(shown, text_cap)
+        info = {}
+        end = offset + count
+        if end < len(rows):
+            info = {"total_rows": len(rows), "next_cursor": encode_cursor(end)}
+        elif offset:
+            info = {"total_rows": len(rows)}
+        return _with_rows(result, rows_key, shown, info)
+
+    shaped = build(len(page_rows))
+    if token_budget is None or count_tokens(to_json(shaped)) <= token_budget:
+        return shaped
+
+    # Shorten long text fields first, then move trailing rows to the next page
+    for cap in TEXT_CAPS:
+        shaped = build(len(page_rows), cap)
+        if count_tokens(to_json(shaped)) <= token_budget:
+            return shaped
+
+    count = len(page_rows)
+    while count > 1:
+        count -= 1
+        shaped = build(count, TEXT_CAPS[-1])
+        if count_tokens(to_json(shaped)) <= token_budget:
+            break
+    return shaped
+
+
+def _fit_text(result, token_budget):
+    if token_budget is None or count_tokens(to_json(result)) <= token_budget:
+        return result
+    for cap in TEXT_CAPS:
+        shaped = _cap_strings(result, cap)
+        if count_tokens(to_json(shaped)) <= token_budget:
+            return shaped
+    return shaped
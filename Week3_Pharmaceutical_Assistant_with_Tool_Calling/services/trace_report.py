@@ -0,0 +1,104 @@
+"""
+Trace Report
+
+Reads the span file written by tracing.py and prints the slowest turns, each with its
+critical path: the chain of spans that determined how long the turn took.
+
+    python -m services.trace_report                    # traces/spans.jsonl
+    python -m services.trace_report path/to/spans.jsonl --top 10
+"""
+
+import argparse
+import json
+import os
+
+from .tracing import TRACE_PATH
+
+
+def _from_otlp_value(value):
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()))
+
+
+def load_traces(path):
+    """
+    Read a span file. Returns a list of traces, each a list of span dicts with
+    name, span_id, parent_id, start/end (ns), duration_ms, attributes and error.
+    """
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            spans = []
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for s in scope["spans"]:
+                        start, end = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+                        spans.append({
+                            "name": s["name"],
+                            "span_id": s["spanId"],
+                            "parent_id": s.get("parentSpanId") or None,
+                            "start": start,
+                            "end": end,
+                            "duration_ms": (end - start) / 1e6,
+                            "attributes": {a["key"]: _from_otlp_value(a["value"]) for a in s.get("attributes", [])},
+                            "error": s.get("status", {}).get("message"),
+                        })
+            traces.append(spans)
+    return traces
+
+
+def critical_path(spans):
+    """
+    The chain of spans that determined the turn's duration: from the root, repeatedly
+    follow the child that finished last.
+    """
+    children = {}
+    root = None
+    for s in spans:
+        if s["parent_id"] is None:
+            root = s
+        else:
+            children.setdefault(s["parent_id"], []).append(s)
+    path = []
+    node = root
+    while node is not None:
+        path.append(node)
+        node = max(children.get(node["span_id"], ()), key=lambda s: s["end"], default=None)
+    return path
+
+
+def _describe(s):
+    keys = ("tool.cache_hit", "tool.result_bytes", "gen_ai.usage.input_tokens", "gen_ai.usage.output_tokens",
+            "db.rows", "http.status_code", "openfda.cache")
+    details = [f"{k.split('.')[-1]}={s['attributes'][k]}" for k in keys if k in s["attributes"]]
+    if s["error"]:
+        details.append(f"error={s['error']}")
+    return f"{s['name']} {s['duration_ms']:.1f} ms" + (f" ({', '.join(details)})" if details else "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the slowest traced turns and their critical path")
+    parser.add_argument("path", nargs="?", default=TRACE_PATH)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"No traces at {args.path}. Enable tracing with configure_tracing(sample_rate=...).")
+        return
+
+    traces = [t for t in load_traces(args.path) if any(s["parent_id"] is None for s in t)]
+    traces.sort(key=lambda t: -max(s["duration_ms"] for s in t if s["parent_id"] is None))
+    print(f"{len(traces)} traced turns in {args.path}")
+    for spans in traces[:args.top]:
+        path = critical_path(spans)
+        root = path[0]
+        print(f"\n{root['duration_ms']:.1f} ms  {root['name']}  ({len(spans)} spans)")
+        for depth, s in enumerate(path):
+            print(f"  {'  ' * depth}{_describe(s)}")
+
+
+if __name__ == "__main__":
+    main()
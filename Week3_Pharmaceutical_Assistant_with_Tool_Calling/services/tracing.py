@@ -0,0 +1,265 @@
+"""
+Span Tracing
+
+Nested spans for a chat turn:
+
+    chat.turn
+      llm.completion          (one per model call; token usage)
+      tool.<name>             (cache hits, result size)
+        sqlite.query          (database, rows)
+        http.request          (status, attempt)
+
+Sampling is decided once per turn: an unsampled turn records nothing and its spans cost
+one context variable lookup each. Finished turns are appended to a JSON Lines file, one
+OpenTelemetry OTLP/JSON `resourceSpans` document per line, so they can also be loaded into
+any OTLP-compatible viewer.
+
+    from services.tracing import configure_tracing
+    configure_tracing(sample_rate=0.1)          # trace 10% of turns
+
+Print the slowest turns and their critical path with services/trace_report.py:
+
+    python -m services.trace_report traces/spans.jsonl --top 5
+"""
+
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+
+# Week 3 project root (parent of the services package)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TRACE_PATH = os.path.join(BASE_DIR, 'traces', 'spans.jsonl')
+SERVICE_NAME = "medprofile-assistant"
+DEFAULT_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))   # off unless configured
+
+STATUS_OK = 1                    # OTLP status codes
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation in a sampled trace. Created by Tracer.span() / start_span().
+    """
+
+    recording = True
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def add(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+
+class _NoopSpan:
+    """
+    Stands in for a span when the turn is not sampled or tracing is off.
+    """
+
+    __slots__ = ()
+    recording = False
+
+    def set(self, key, value):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self.finished = False
+        self.lock = threading.Lock()
+
+
+class _SpanContext:
+    """
+    Context manager returned by Tracer.span(): makes the span current for the block.
+    """
+
+    __slots__ = ("tracer", "name", "attributes", "root", "span", "token")
+
+    def __init__(self, tracer, name, attributes, root):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.root = root
+        self.span = NOOP_SPAN
+        self.token = None
+
+    def __enter__(self):
+        self.span = self.tracer.start_span(self.name, root=self.root, **self.attributes)
+        if self.span is not NOOP_SPAN:
+            self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is not None:
+            _current.reset(self.token)
+        self.tracer.finish(self.span, f"{exc_type.__name__}: {exc}" if exc is not None else None)
+        return False
+
+
+class _NoopContext:
+    __slots__ = ()
+
+    def __enter__(self):
+        return NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_CONTEXT = _NoopContext()
+
+
+class Tracer:
+    """
+    Creates spans and writes finished, sampled turns to `path`.
+    """
+
+    def __init__(self, path=TRACE_PATH, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def span(self, name, root=False, **attributes):
+        """
+        Context manager for a span that is current inside the block.
+        It is a child of the current span; root=True starts a new trace (subject to
+        sampling) when there is none. Outside a sampled trace nothing is recorded.
+        """
+        if not root and not isinstance(_current.get(), Span):
+            return _NOOP_CONTEXT
+        return _SpanContext(self, name, attributes, root)
+
+    def start_span(self, name, parent=None, root=False, **attributes):
+        """
+        Start a span without making it current; end it with finish(). For code that
+        yields between start and end (generators), where a context variable cannot
+        be held. parent defaults to the current span.
+        """
+        parent = parent if parent is not None else _current.get()
+        if isinstance(parent, Span):
+            return Span(parent.trace, name, parent.span_id, attributes)
+        if root and parent is None and random.random() < self.sample_rate:
+            return Span(_Trace(), name, None, attributes)
+        return NOOP_SPAN
+
+    def finish(self, span, error=None):
+        if span is NOOP_SPAN:
+            return
+        span.end_ns = time.time_ns()
+        span.error = error
+        trace = span.trace
+        with trace.lock:
+            if trace.finished:
+                return                # e.g. a timed-out tool finishing after its turn
+            trace.spans.append(span)
+            if span.parent_id is None:
+                trace.finished = True
+        if span.parent_id is None:
+            self.export(trace)
+
+    def export(self, trace):
+        line = json.dumps(to_otlp(trace), separators=(",", ":"))
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+tracer = Tracer()
+
+
+def configure_tracing(path=None, sample_rate=None):
+    """
+    Set where traces are written and the share of turns that are traced (0 to 1).
+    """
+    if path is not None:
+        tracer.path = path
+    if sample_rate is not None:
+        tracer.sample_rate = sample_rate
+    return tracer
+
+
+def current_span():
+    """
+    The active span, or a no-op span outside a sampled trace.
+    """
+    span = _current.get()
+    return span if span is not None else NOOP_SPAN
+
+
+def span(name, **attributes):
+    return tracer.span(name, **attributes)
+
+
+def context_runner(fn, parent=None):
+    """
+    Wrap fn to run in a copy of the caller's context (with `parent` as the current span
+    if given), so spans started in a worker thread nest under the submitting span.
+    """
+    context = contextvars.copy_context()
+    if parent is not None:
+        context.run(_current.set, parent)
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# ----------------------------------------------------------------------
+# OTLP JSON
+# ----------------------------------------------------------------------
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace):
+    spans = []
+    for s in trace.spans:
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent_id or "",
+            "name": s.name,
+            "kind": 1,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": s.error} if s.error else {"code": STATUS_OK},
+        }
+        spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "services.tracing"}, "spans": spans}],
+        }]
+    }
@@ -0,0 +1,32 @@
+"""
+Pytest configuration file.
+This file is automatically loaded by pytest and configures the test environment.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root to sys.path so tests can import the services package
+project_root = Path(__file__).parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from services import comprehensive_drug_dbutil, interactions_dbutil
+
+
+@pytest.fixture
+def comprehensive_db(tmp_path, monkeypatch):
+    """Load the shipped comprehensive drug CSV into a temporary database."""
+    monkeypatch.setattr(comprehensive_drug_dbutil, "DB_PATH", str(tmp_path / "comprehensive_drug.db"))
+    comprehensive_drug_dbutil.insert_comprehensive_drugs_from_csv()
+    return comprehensive_drug_dbutil.DB_PATH
+
+
+@pytest.fixture
+def interactions_db(tmp_path, monkeypatch):
+    """Load the shipped drug interaction JSON into a temporary database."""
+    monkeypatch.setattr(interactions_dbutil, "DB_PATH", str(tmp_path / "drug_interactions.db"))
+    interactions_dbutil.insert_interactions_from_json()
+    return interactions_dbutil.DB_PATH
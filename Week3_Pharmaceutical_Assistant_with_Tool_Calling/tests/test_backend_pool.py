@@ -0,0 +1,128 @@
+"""
+Tests for the hedged backend pool, with scripted streams in place of OpenAI clients.
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.backend_pool import Backend, BackendPool
+
+
+def chunk(content=None, role=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, role=role,
+                                                                          tool_calls=None))])
+
+
+class FakeStream:
+    """
+    Yields (delay, chunk) steps; stops early once closed.
+    """
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.closed = False
+
+    def __iter__(self):
+        for delay, item in self.steps:
+            time.sleep(delay)
+            if self.closed:
+                return
+            yield item
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeClient:
+    def __init__(self, steps=None, error=None):
+        self.steps = steps or []
+        self.error = error
+        self.streams = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        if self.error is not None:
+            raise self.error
+        self.streams.append(FakeStream(self.steps))
+        return self.streams[-1]
+
+
+def make_pool(*clients):
+    backends = [Backend(f"http://node{i}/v1", client=client) for i, client in enumerate(clients)]
+    return BackendPool(backends, default_hedge_delay=0.05), backends
+
+
+def contents(chunks):
+    return [c.choices[0].delta.content for c in chunks if c.choices[0].delta.content]
+
+
+def test_hedge_is_sent_after_the_delay_and_the_loser_is_cancelled():
+    slow = FakeClient([(0.5, chunk("slow"))])
+    fast = FakeClient([(0.0, chunk("fast"))])
+    pool, (primary, replica) = make_pool(slow, fast)
+
+    start = time.monotonic()
+    result = list(pool.stream_chat(model="m", messages=[]))
+
+    assert contents(result) == ["fast"]
+    assert time.monotonic() - start < 0.4
+    assert slow.streams[0].closed
+    assert replica.percentile(0.5) is not None and primary.percentile(0.5) is None
+
+
+def test_role_only_first_delta_does_not_win_the_race():
+    slow = FakeClient([(0.0, chunk(role="assistant")), (0.5, chunk("slow"))])
+    fast = FakeClient([(0.0, chunk(role="assistant")), (0.1, chunk("fast"))])
+    pool, (primary, replica) = make_pool(slow, fast)
+
+    result = list(pool.stream_chat(model="m", messages=[]))
+
+    assert result[0].choices[0].delta.role == "assistant"
+    assert contents(result) == ["fast"]
+    assert slow.streams[0].closed
+    assert primary.percentile(0.5) is None
+    assert replica.percentile(0.5) >= 0.1
+
+
+def test_error_on_first_backend_fails_over_and_records_failure():
+    broken = FakeClient(error=ConnectionError("refused"))
+    working = FakeClient([(0.0, chunk("ok"))])
+    pool, (first, second) = make_pool(broken, working)
+
+    result = list(pool.stream_chat(hedge=False, model="m", messages=[]))
+
+    assert contents(result) == ["ok"]
+    assert first.failures == 1 and second.failures == 0
+    assert first.stats()["failures"] == 1
+
+
+def test_failover_replacement_is_hedged_after_its_own_delay():
+    broken = FakeClient(error=ConnectionError("refused"))
+    replacement = FakeClient([(0.2, chunk("replacement"))])
+    spare = FakeClient([(0.0, chunk("spare"))])
+    pool, (first, second, _) = make_pool(broken, replacement, spare)
+    for _ in range(5):
+        first.record_latency(0.01)      # hedged after MIN_HEDGE_DELAY
+        second.record_latency(0.5)      # hedged after 0.5s
+
+    result = list(pool.stream_chat(model="m", messages=[]))
+
+    assert contents(result) == ["replacement"]
+    assert spare.streams == []
+
+
+def test_error_on_every_backend_is_raised():
+    pool, backends = make_pool(FakeClient(error=ConnectionError("a")), FakeClient(error=ConnectionError("b")))
+
+    with pytest.raises(ConnectionError):
+        list(pool.stream_chat(model="m", messages=[]))
+    assert [b.failures for b in backends] == [1, 1]
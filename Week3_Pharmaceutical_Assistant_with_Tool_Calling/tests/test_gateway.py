@@ -0,0 +1,230 @@
+"""
+Tests for the model gateway, driven through the ASGI interface with a fake upstream.
+"""
+
+import asyncio
+import json
+
+from services import gateway
+
+
+class FakeUpstream:
+    """
+    Stands in for HttpUpstream: answers every request after an optional gate opens.
+    """
+
+    def __init__(self, gate=None, stream_events=None, fail=None):
+        self.gate = gate
+        self.stream_events = stream_events or []
+        self.fail = fail
+        self.calls = []
+
+    async def complete(self, body, authorization=None):
+        self.calls.append(body)
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise self.fail
+        return {
+            "id": f"cmpl-{len(self.calls)}",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        }
+
+    async def stream(self, body, authorization=None):
+        self.calls.append(body)
+        for event in self.stream_events:
+            yield b"data: " + json.dumps(event).encode() + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    async def models(self, authorization=None):
+        return {"object": "list", "data": [{"id": "llama3.2", "object": "model"}]}
+
+
+def make_gateway(upstream, **config):
+    config.setdefault("batch_window_ms", 20)
+    return gateway.ModelGateway(gateway.load_config(**config), upstream_factory=lambda base_url, api_key: upstream)
+
+
+async def request(app, method, path, body=None, api_key=None):
+    messages = [{"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}]
+    headers = [(b"authorization", f"Bearer {api_key}".encode())] if api_key else []
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path, "headers": headers}, receive, send)
+    return sent[0]["status"], dict(sent[0]["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+
+def chat(content, **extra):
+    return dict({"model": "llama3.2", "messages": [{"role": "user", "content": content}]}, **extra)
+
+
+def test_identical_deterministic_requests_share_one_upstream_call():
+    upstream = FakeUpstream()
+
+    async def scenario():
+        app = make_gateway(upstream)
+        results = await asyncio.gather(
+            request(app, "POST", "/v1/chat/completions", chat("Dose of Ibuprofen?", temperature=0)),
+            request(app, "POST", "/v1/chat/completions", chat("Dose of Ibuprofen?", temperature=0)),
+            request(app, "POST", "/v1/chat/completions", chat("Dose of Ibuprofen?", temperature=0.7)),
+        )
+        metrics = json.loads((await request(app, "GET", "/metrics"))[2])
+        return results, metrics
+
+    results, metrics = asyncio.run(scenario())
+    assert [status for status, _, _ in results] == [200, 200, 200]
+    assert len(upstream.calls) == 2
+    assert json.loads(results[0][2])["id"] == json.loads(results[1][2])["id"]
+    assert metrics["batches"]["llama3.2"] == {"batches": 1, "requests": 3, "coalesced": 1, "largest": 3,
+                                              "mean_size": 3.0}
+    assert metrics["models"]["llama3.2"]["requests"] == 3
+    assert metrics["apps"]["default"]["completion_tokens"] == 15
+    assert "latency_p95" in metrics["apps"]["default"]
+
+
+def test_identical_requests_from_different_callers_are_not_merged():
+    upstream = FakeUpstream()
+
+    async def scenario():
+        app = make_gateway(upstream)
+        return await asyncio.gather(
+            request(app, "POST", "/v1/chat/completions", chat("Dose?", temperature=0), api_key="week1-key"),
+            request(app, "POST", "/v1/chat/completions", chat("Dose?", temperature=0), api_key="week3-key"),
+        )
+
+    first, second = asyncio.run(scenario())
+    assert len(upstream.calls) == 2
+    assert json.loads(first[2])["id"] != json.loads(second[2])["id"]
+
+
+def test_app_quota_returns_429_with_retry_after():
+    apps = {"week1-key": {"app": "week1", "requests_per_minute": 1}}
+
+    async def scenario():
+        app = make_gateway(FakeUpstream(), apps=apps, batch_window_ms=0)
+        first = await request(app, "POST", "/v1/chat/completions", chat("a"), api_key="week1-key")
+        second = await request(app, "POST", "/v1/chat/completions", chat("b"), api_key="week1-key")
+        other_app = await request(app, "POST", "/v1/chat/completions", chat("c"), api_key="someone-else")
+        return first, second, other_app, app.get_metrics()
+
+    first, second, other_app, metrics = asyncio.run(scenario())
+    assert first[0] == 200 and other_app[0] == 200
+    assert second[0] == 429 and int(second[1][b"retry-after"]) >= 1
+    assert json.loads(second[2])["error"]["type"] == "rate_limit_exceeded"
+    assert metrics["apps"]["week1"]["rejected"] == 1
+
+
+def test_api_key_never_appears_in_metrics_or_errors():
+    apps = {"sk-secret-week2": {"requests_per_minute": 1}}
+
+    async def scenario():
+        app = make_gateway(FakeUpstream(), apps=apps, batch_window_ms=0)
+        await request(app, "POST", "/v1/chat/completions", chat("a"), api_key="sk-secret-week2")
+        limited = await request(app, "POST", "/v1/chat/completions", chat("b"), api_key="sk-secret-week2")
+        metrics = await request(app, "GET", "/metrics")
+        return limited, metrics
+
+    limited, metrics = asyncio.run(scenario())
+    assert limited[0] == 429
+    assert b"sk-secret" not in limited[2] and b"sk-secret" not in metrics[2]
+    assert gateway.app_label("sk-secret-week2") in json.loads(metrics[2])["apps"]
+
+
+def test_full_queue_is_rejected_with_503():
+    async def scenario():
+        gate = asyncio.Event()
+        app = make_gateway(FakeUpstream(gate), max_concurrency=1, max_queue=0, batch_window_ms=0)
+        running = asyncio.create_task(request(app, "POST", "/v1/chat/completions", chat("first")))
+        await asyncio.sleep(0.05)
+        rejected = await request(app, "POST", "/v1/chat/completions", chat("second"))
+        gate.set()
+        return await running, rejected
+
+    first, rejected = asyncio.run(scenario())
+    assert first[0] == 200
+    assert rejected[0] == 503 and json.loads(rejected[2])["error"]["type"] == "server_busy"
+
+
+def test_busy_rejection_does_not_use_quota():
+    async def scenario():
+        gate = asyncio.Event()
+        app = make_gateway(FakeUpstream(gate), max_concurrency=1, max_queue=0, batch_window_ms=0,
+                           default_requests_per_minute=2)
+        running = asyncio.create_task(request(app, "POST", "/v1/chat/completions", chat("first")))
+        await asyncio.sleep(0.05)
+        rejected = await request(app, "POST", "/v1/chat/completions", chat("second"))
+        gate.set()
+        await running
+        retried = await request(app, "POST", "/v1/chat/completions", chat("second"))
+        return rejected, retried
+
+    rejected, retried = asyncio.run(scenario())
+    assert rejected[0] == 503
+    assert retried[0] == 200
+
+
+def test_stream_is_relayed_and_added_usage_event_dropped():
+    events = [
+        {"choices": [{"index": 0, "delta": {"content": "Hel"}}]},
+        {"choices": [{"index": 0, "delta": {"content": "lo"}}]},
+        {"choices": [], "usage": {"prompt_tokens": 7, "completion_tokens": 2, "total_tokens": 9}},
+    ]
+    upstream = FakeUpstream(stream_events=events)
+
+    async def scenario():
+        app = make_gateway(upstream)
+        result = await request(app, "POST", "/v1/chat/completions", chat("Hi", stream=True))
+        return result, app.get_metrics()
+
+    (status, headers, body), metrics = asyncio.run(scenario())
+    data = [line[6:] for line in body.decode().split("\n\n") if line.startswith("data: ")]
+    assert status == 200 and headers[b"content-type"] == b"text/event-stream"
+    assert upstream.calls[0]["stream_options"] == {"include_usage": True}
+    assert [json.loads(d)["choices"][0]["delta"]["content"] for d in data[:-1]] == ["Hel", "lo"]
+    assert data[-1] == "[DONE]"
+    assert metrics["models"]["llama3.2"]["prompt_tokens"] == 7
+    assert "ttft_p50" in metrics["models"]["llama3.2"]
+
+
+def test_upstream_errors_and_bad_requests():
+    failing = FakeUpstream(fail=gateway.UpstreamError(404, gateway.openai_error("model not found", "not_found")))
+
+    async def scenario():
+        app = make_gateway(failing, batch_window_ms=0)
+        return [
+            await request(app, "POST", "/v1/chat/completions", chat("x")),
+            await request(app, "POST", "/v1/chat/completions", {"messages": []}),
+            await request(app, "GET", "/v1/models"),
+            await request(app, "GET", "/nowhere"),
+        ]
+
+    upstream_error, missing_model, models, unknown = asyncio.run(scenario())
+    assert upstream_error[0] == 404 and json.loads(upstream_error[2])["error"]["message"] == "model not found"
+    assert missing_model[0] == 400
+    assert models[0] == 200 and json.loads(models[2])["data"][0]["id"] == "llama3.2"
+    assert unknown[0] == 404
+
+
+def test_routes_pick_upstream_by_model_prefix():
+    config = gateway.load_config(routes=[{"prefix": "gpt-", "base_url": "https://api.openai.com/v1"}])
+    created = {}
+    app = gateway.ModelGateway(config, upstream_factory=lambda base_url, api_key: created.setdefault(base_url, object()))
+    asyncio.run(app.startup())
+    assert app.upstream_for("gpt-4o-mini") is created["https://api.openai.com/v1"]
+    assert app.upstream_for("llama3.2") is created[config["upstream"]]
+
+
+def test_token_bucket_quota_refills():
+    quota = gateway.AppQuota("week2", requests_per_minute=60, tokens_per_minute=600)
+    assert quota.admit(now=0.0) == 0
+    quota.charge(700, now=0.0)
+    assert quota.admit(now=0.0) > 0
+    assert quota.admit(now=20.0) == 0
@@ -0,0 +1,176 @@
+"""
+Tests for the OpenFDA client against a local stub server.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services import openfda_api
+from services.openfda_client import OpenFDAClient, OpenFDAError, TokenBucket, set_client
+
+
+LABEL = {
+    "openfda": {"brand_name": ["Bayer"], "generic_name": ["ASPIRIN"]},
+    "active_ingredient": ["Aspirin 325 mg"],
+    "purpose": ["Pain reliever"],
+    "indications_and_usage": ["Temporarily relieves minor aches"],
+    "warnings": ["Reye's syndrome"],
+}
+
+
+class StubFDA:
+    """Local HTTP server that replays a scripted list of (status, headers) responses."""
+
+    def __init__(self):
+        self.script = []
+        self.hits = 0
+        self.delay = 0.0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(stub.delay)
+                status, headers = stub.script.pop(0) if stub.script else (200, {})
+                body = json.dumps({"results": [LABEL]} if status == 200 else {"error": {}}).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/drug/label.json"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubFDA()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def make_client(stub, tmp_path):
+    clients = []
+
+    def make(**kwargs):
+        kwargs.setdefault("backoff_base", 0.001)
+        client = OpenFDAClient(base_url=stub.url, cache_path=str(tmp_path / "cache.db"), **kwargs)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_repeat_lookup_served_from_disk_cache(stub, make_client):
+    client = make_client()
+    first = client.search_labels('openfda.generic_name:"aspirin"')
+    assert first[0]["purpose"] == ["Pain reliever"]
+
+    # A new client (new process) reuses the persisted response
+    second = make_client().search_labels('openfda.generic_name:"aspirin"')
+    assert second == first
+    assert stub.hits == 1
+
+
+def test_retries_429_and_5xx_with_backoff(stub, make_client):
+    stub.script = [(503, {}), (429, {"Retry-After": "0"}), (200, {})]
+    client = make_client()
+    assert client.search_labels("aspirin")
+    assert stub.hits == 3
+    assert client.stats["retries"] == 2
+
+
+def test_gives_up_after_max_retries(stub, make_client):
+    stub.script = [(500, {})] * 3
+    client = make_client(max_retries=2)
+    with pytest.raises(OpenFDAError) as error:
+        client.search_labels("aspirin")
+    assert error.value.status == 500
+    assert stub.hits == 3
+
+
+def test_stale_entry_served_while_revalidating(stub, make_client):
+    client = make_client(fresh_ttl=0)
+    client.search_labels("aspirin")
+    assert client.search_labels("aspirin")
+    assert client.stats["stale_hits"] == 1
+    deadline = time.time() + 2
+    while stub.hits < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert stub.hits == 2
+
+
+def test_expired_entry_served_when_api_down(stub, make_client):
+    make_client().search_labels("aspirin")
+    stub.script = [(503, {})] * 2
+    client = make_client(fresh_ttl=0, stale_ttl=0, max_retries=1)
+    assert client.search_labels("aspirin")[0]["warnings"] == ["Reye's syndrome"]
+
+
+def test_drug_lookup_uses_shared_client(stub, make_client):
+    set_client(make_client())
+    try:
+        result = openfda_api.drug_lookup(" Aspirin ")
+        assert result["brand_name"] == "Bayer"
+        assert result["warnings"] == "Reye's syndrome"
+        stub.script = [(404, {})]
+        assert "No results found" in openfda_api.drug_lookup("Notadrug")["error"]
+    finally:
+        set_client(None)
+
+
+def test_concurrent_identical_lookups_share_one_request(stub, make_client):
+    stub.delay = 0.2
+    client = make_client()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.search_labels("aspirin"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 5
+    assert stub.hits == 1
+    assert client.get_stats()["shared_requests"] == 4
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate_per_second=50, capacity=2)
+    start = time.monotonic()
+    for _ in range(7):
+        bucket.acquire()
+    # 2 from the burst, then 5 at 50/s
+    assert time.monotonic() - start >= 0.09
+
+
+def test_drug_lookup_many_runs_concurrently(stub, make_client):
+    stub.delay = 0.2
+    set_client(make_client())
+    try:
+        start = time.monotonic()
+        results = asyncio.run(openfda_api.drug_lookup_many(["Aspirin", "Ibuprofen", "Aspirin ", "Naproxen",
+                                                             "ibuprofen", " IBUPROFEN"]))
+        elapsed = time.monotonic() - start
+    finally:
+        set_client(None)
+    assert list(results) == ["Aspirin", "Ibuprofen", "Naproxen", "ibuprofen", "IBUPROFEN"]
+    assert all(result["brand_name"] == "Bayer" for result in results.values())
+    assert stub.hits == 3
+    assert elapsed < 0.5
@@ -0,0 +1,121 @@
+"""
+Tests for the ASGI chat server, driven directly through the ASGI interface.
+"""
+
+import asyncio
+import json
+
+from services import server
+from test_tool_calling import text_chunk, tool_chunk
+
+
+async def _aiter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+class FakeAsyncClient:
+    """
+    Stands in for AsyncOpenAI: each create() streams the next scripted round.
+    """
+
+    def __init__(self, rounds, gate=None):
+        self.rounds = rounds
+        self.gate = gate
+        self.closed = False
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **kwargs):
+        assert kwargs["stream"] is True
+        if self.gate is not None:
+            await self.gate.wait()
+        return _aiter(self.rounds.pop(0))
+
+    async def close(self):
+        self.closed = True
+
+
+def make_server(client, **config):
+    return server.ChatServer(server.load_config(client_pool_size=1, tool_workers=4, **config),
+                             create_client=lambda: client)
+
+
+async def request(app, method, path, body=None):
+    messages = [{"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path}, receive, send)
+    status = sent[0]["status"]
+    body = b"".join(m.get("body", b"") for m in sent[1:])
+    return status, body
+
+
+def test_chat_streams_ndjson_events(comprehensive_db):
+    rounds = [
+        [tool_chunk(0, "c1", "compare_drugs", '{"drug_list": ["Ibuprofen"]}')],
+        [text_chunk("Ibuprofen "), text_chunk("is an NSAID.")],
+    ]
+    client = FakeAsyncClient(rounds)
+
+    async def scenario():
+        app = make_server(client)
+        status, body = await request(app, "POST", "/v1/chat", {"message": "Compare", "history": [
+            {"role": "user", "content": "Hi"}, {"role": "assistant", "content": [{"text": "Hello"}]}]})
+        health = await request(app, "GET", "/healthz")
+        metrics = await request(app, "GET", "/metrics")
+        await app.shutdown()
+        return status, body, health, metrics
+
+    status, body, health, metrics = asyncio.run(scenario())
+    events = [json.loads(line) for line in body.decode().splitlines()]
+    assert status == 200
+    assert [e["type"] for e in events] == ["tool_start", "tool_end", "text", "text", "done"]
+    assert events[-1]["content"] == "Ibuprofen is an NSAID."
+    assert health[0] == 200 and json.loads(health[1])["active"] == 0
+    assert json.loads(metrics[1])["pool"]["admitted"] == 1
+    assert client.closed
+
+
+def test_full_queue_is_rejected_with_503(comprehensive_db):
+    async def scenario():
+        gate = asyncio.Event()
+        app = make_server(FakeAsyncClient([[text_chunk("a")], [text_chunk("b")]], gate), max_concurrency=1, max_queue=0)
+        await app.startup()
+        running = asyncio.create_task(request(app, "POST", "/v1/chat", {"message": "first"}))
+        await asyncio.sleep(0.05)
+        rejected = await request(app, "POST", "/v1/chat", {"message": "second"})
+        gate.set()
+        first = await running
+        return first, rejected
+
+    first, rejected = asyncio.run(scenario())
+    assert first[0] == 200
+    assert rejected[0] == 503 and "busy" in json.loads(rejected[1])["error"]
+
+
+def test_bad_requests():
+    async def scenario():
+        app = make_server(FakeAsyncClient([]))
+        results = [
+            await request(app, "POST", "/v1/chat", {"history": []}),
+            await request(app, "GET", "/nowhere"),
+            await request(app, "POST", "/v1/chat", {"message": "hi", "history": ["hi"]}),
+            await request(app, "POST", "/v1/chat", {"message": "hi", "history": [{}]}),
+            await request(app, "POST", "/v1/chat", {"message": "hi", "history": [{"role": "tool", "content": "x"}]}),
+            await request(app, "POST", "/v1/chat", {"message": "hi", "history": [{"role": "user", "content": [1]}]}),
+        ]
+        await app.shutdown()
+        return results
+
+    missing_message, unknown, *bad_history = asyncio.run(scenario())
+    assert missing_message[0] == 400
+    assert unknown[0] == 404
+    assert [status for status, _ in bad_history] == [400, 400, 400, 400]
+    assert "history item" in json.loads(bad_history[0][1])["error"]
@@ -0,0 +1,536 @@
+"""
+Unit tests for the services database layer.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services import check_drug_interaction, check_interactions_matrix, get_drug_details, get_drugs_by_class
+from services import get_drug_details_many, get_therapeutic_alternatives
+from services import comprehensive_drug_dbutil, dataset_sync, db_connection, indication_search, interactions_dbutil
+from services import bulk_loader, medicine_dbutil, read_model
+from services.name_resolver import DrugNameResolver, normalize_name
+
+
+class TestConnectionManager:
+    """Tests for the shared read-only connection handling."""
+
+    def test_paths_resolved_from_package(self):
+        """Test that database paths do not depend on the working directory."""
+        from services import medicine_dbutil
+        assert medicine_dbutil.DB_PATH.startswith(db_connection.BASE_DIR)
+
+    def test_connection_reused_within_thread(self, comprehensive_db):
+        """Test that repeated lookups on one thread share a connection."""
+        first = db_connection.get_read_connection(comprehensive_db)
+        second = db_connection.get_read_connection(comprehensive_db)
+        assert first is second
+
+    def test_connection_per_thread(self, comprehensive_db):
+        """Test that each thread gets its own connection."""
+        main_conn = db_connection.get_read_connection(comprehensive_db)
+        other = []
+        thread = threading.Thread(
+            target=lambda: other.append(db_connection.get_read_connection(comprehensive_db))
+        )
+        thread.start()
+        thread.join()
+        assert other[0] is not main_conn
+
+    def test_connection_is_read_only(self, comprehensive_db):
+        """Test that lookup connections cannot modify data."""
+        conn = db_connection.get_read_connection(comprehensive_db)
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM drugs")
+
+
+class TestBulkLoader:
+    """Tests for the batched streaming loaders."""
+
+    def test_loads_in_batches_and_skips_bad_rows(self, tmp_path, monkeypatch):
+        """Test that a failing batch falls back to row-by-row and reports skipped rows."""
+        csv_path = tmp_path / "medicines.csv"
+        lines = ["Medicine Name,Composition,Manufacturer,Uses,Side_effects"]
+        lines += [f"Med {i},Paracetamol (500mg),Cipla,Fever,Nausea" for i in range(10)]
+        lines.append("Broken Med,,Cipla,Fever,Nausea")  # composition is NOT NULL
+        csv_path.write_text("\n".join(lines))
+        monkeypatch.setattr(medicine_dbutil, "DB_PATH", str(tmp_path / "medicine_info.db"))
+
+        medicine_dbutil.insert_medicines_from_csv(csv_path=str(csv_path), batch_size=4)
+
+        conn = sqlite3.connect(medicine_dbutil.DB_PATH)
+        count = conn.execute("SELECT COUNT(*) FROM medicines").fetchone()[0]
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        conn.close()
+        assert count == 10
+        assert {"idx_medicine_name", "idx_composition"} <= indexes
+
+    def test_inserted_count_ignores_earlier_skipped_rows(self):
+        """Test that rows already in a caller's skipped_rows list do not lower the count."""
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE t (name TEXT NOT NULL)")
+        skipped = [(1, "earlier", "error from a previous file")]
+        inserted, _ = bulk_loader.bulk_insert(conn, "INSERT INTO t VALUES (?)", [[("a",), (None,), ("b",)]],
+                                              skipped_rows=skipped)
+        assert inserted == 2
+        assert len(skipped) == 2
+
+
+class TestMedicineSearch:
+    """Tests for the trigram FTS5 medicine search."""
+
+    @pytest.fixture
+    def medicine_db(self, tmp_path, monkeypatch):
+        csv_path = tmp_path / "medicines.csv"
+        lines = ["Medicine Name,Composition,Manufacturer,Uses,Side_effects"]
+        lines += [f"Calpol {i} Tablet,Paracetamol (500mg),GSK,Fever,Nausea" for i in range(8)]
+        lines.append("Paracip 650 Tablet,Paracetamol (650mg),Cipla,Fever,Nausea")
+        lines.append("Brufen 400 Tablet,Ibuprofen (400mg),Abbott,Pain,Nausea")
+        csv_path.write_text("\n".join(lines))
+        monkeypatch.setattr(medicine_dbutil, "DB_PATH", str(tmp_path / "medicine_info.db"))
+        monkeypatch.setattr(medicine_dbutil, "CSV_PATH", str(csv_path))
+        medicine_dbutil.insert_medicines_from_csv()
+        return tmp_path
+
+    def test_substring_match_is_case_insensitive(self, medicine_db):
+        results = medicine_dbutil.get_medicine_by_name("RUFEN")
+        assert [r["medicine_name"] for r in results] == ["Brufen 400 Tablet"]
+
+    def test_results_capped_at_five(self, medicine_db):
+        assert len(medicine_dbutil.get_medicine_by_name("calpol")) == 5
+
+    def test_falls_back_to_composition(self, medicine_db):
+        results = medicine_dbutil.get_medicine_info("paracetamol")
+        assert len(results) == 5
+        assert all("Paracetamol" in r["composition"] for r in results)
+
+    def test_prefix_matches_ranked_first(self, medicine_db):
+        """Test that 'Paracip' (prefix) outranks names that only contain the term."""
+        results = medicine_dbutil.get_medicine_by_composition("para")
+        assert results[0]["composition"].startswith("Para")
+
+    def test_prefix_match_survives_candidate_cap(self, tmp_path, monkeypatch):
+        """Test that a prefix match is found when the term matches more rows than the cap."""
+        csv_path = tmp_path / "medicines.csv"
+        lines = ["Medicine Name,Composition,Manufacturer,Uses,Side_effects"]
+        lines += [f"Dolo {i} Tablet,Paracetamol (500mg),Micro,Fever,Nausea"
+                  for i in range(medicine_dbutil.FTS_CANDIDATE_LIMIT + 50)]
+        lines.append("Tablet Sugar Free Mint Flavoured Chewable Oral Dispersible Junior Strength,"
+                     "Paracetamol (125mg),Micro,Fever,Nausea")
+        csv_path.write_text("\n".join(lines))
+        monkeypatch.setattr(medicine_dbutil, "DB_PATH", str(tmp_path / "medicine_info.db"))
+        monkeypatch.setattr(medicine_dbutil, "CSV_PATH", str(csv_path))
+        medicine_dbutil.insert_medicines_from_csv()
+
+        results = medicine_dbutil.get_medicine_by_name("tablet")
+        assert results[0]["medicine_name"].startswith("Tablet Sugar Free")
+        assert results == medicine_dbutil.get_medicine_by_name("tablet")
+
+    def test_latency_does_not_grow_with_matching_rows(self, tmp_path, monkeypatch):
+        """Test that a term matching every row costs about the same at 1x and 10x."""
+        def median_ms(rows):
+            csv_path = tmp_path / f"medicines_{rows}.csv"
+            lines = ["Medicine Name,Composition,Manufacturer,Uses,Side_effects"]
+            lines += [f"Paramed {i} Tablet,Paracetamol ({i % 7 * 100 + 100}mg),Cipla,Fever,Nausea"
+                      for i in range(rows)]
+            csv_path.write_text("\n".join(lines))
+            monkeypatch.setattr(medicine_dbutil, "DB_PATH", str(tmp_path / f"medicine_info_{rows}.db"))
+            medicine_dbutil.insert_medicines_from_csv(csv_path=str(csv_path))
+            timings = []
+            for term in ["tablet", "para", "paracetamol"] * 10:
+                start = time.perf_counter()
+                assert len(medicine_dbutil.get_medicine_info(term)) == 5
+                timings.append(time.perf_counter() - start)
+            return sorted(timings)[len(timings) // 2] * 1000
+
+        small, large = median_ms(3_000), median_ms(30_000)
+        assert large < 3 * small + 1.0, (small, large)
+
+    def test_short_terms_use_prefix_match(self, medicine_db):
+        results = medicine_dbutil.get_medicine_info("br")
+        assert [r["medicine_name"] for r in results] == ["Brufen 400 Tablet"]
+
+    def test_misspelled_term_resolved_before_giving_up(self, medicine_db):
+        results = medicine_dbutil.get_medicine_info("Calpoll")
+        assert results[0]["medicine_name"].startswith("Calpol")
+        assert results[0]["matched_term"] == "calpol"
+        assert 0 < results[0]["match_confidence"] < 1
+
+    def test_index_follows_incremental_sync(self, medicine_db):
+        """Test that the FTS triggers keep the index in sync with dataset_sync changes."""
+        dataset_sync.rebuild_dataset("medicines")
+        edited = medicine_db / "edited.csv"
+        edited.write_text(
+            (medicine_db / "medicines.csv").read_text().replace("Brufen 400", "Combiflam 400")
+        )
+        dataset_sync.sync_dataset("medicines", source_path=str(edited))
+        assert medicine_dbutil.get_medicine_by_name("brufen") is None
+        assert medicine_dbutil.get_medicine_by_name("combiflam")[0]["composition"] == "Ibuprofen (400mg)"
+
+
+class TestDatasetSync:
+    """Tests for incremental sync and atomic rebuilds."""
+
+    @pytest.fixture
+    def synced_interactions(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(interactions_dbutil, "DB_PATH", str(tmp_path / "drug_interactions.db"))
+        dataset_sync.sync_dataset("interactions")
+        return tmp_path
+
+    def test_first_sync_builds_database(self, synced_interactions):
+        version = dataset_sync.get_dataset_version("interactions")
+        assert version["version"] == 1
+        assert version["inserted"] == 80
+
+    def test_unchanged_source_is_noop(self, synced_interactions):
+        version = dataset_sync.sync_dataset("interactions")
+        assert version["version"] == 1
+
+    def test_incremental_sync_applies_only_changes(self, synced_interactions):
+        """Test that an edited source produces exactly one insert, update and delete."""
+        with open(interactions_dbutil.JSON_PATH) as f:
+            data = json.load(f)
+        interactions = data["ddi_database"]
+        interactions[0]["severity"] = "Minor"           # Warfarin + Ibuprofen
+        removed = interactions.pop(1)                    # Simvastatin + Clarithromycin
+        interactions.append(dict(interactions[2], interaction_id=999, drug_a="DrugX", drug_b="DrugY"))
+        source = synced_interactions / "edited.json"
+        source.write_text(json.dumps(data))
+
+        version = dataset_sync.sync_dataset("interactions", source_path=str(source))
+
+        assert (version["inserted"], version["updated"], version["deleted"]) == (1, 1, 1)
+        assert check_drug_interaction("Warfarin", "Ibuprofen")["severity"] == "Minor"
+        assert check_drug_interaction(removed["drug_a"], removed["drug_b"]) is None
+        assert check_drug_interaction("DrugX", "DrugY") is not None
+
+    def test_rebuild_replaces_data_for_open_readers(self, synced_interactions):
+        """Test that a reader opened before the rebuild sees the rebuilt data."""
+        before = db_connection.get_read_connection(interactions_dbutil.DB_PATH)
+        version = dataset_sync.rebuild_dataset("interactions")
+        after = db_connection.get_read_connection(interactions_dbutil.DB_PATH)
+
+        assert version["version"] == 2
+        assert after is not before
+        assert check_drug_interaction("Warfarin", "Ibuprofen") is not None
+        assert not (synced_interactions / "drug_interactions.db.building").exists()
+
+    def test_reader_open_across_rebuild_and_write_stays_consistent(self, synced_interactions):
+        """Test that a connection kept open through a rebuild and a later write reads the live data."""
+        db_path = interactions_dbutil.DB_PATH
+        reader = sqlite3.connect(db_path)
+        snapshot = sqlite3.connect(db_path, isolation_level=None)
+        assert reader.execute("SELECT COUNT(*) FROM drug_interactions").fetchone()[0] == 80
+        snapshot.execute("BEGIN")
+        snapshot.execute("SELECT COUNT(*) FROM drug_interactions").fetchone()
+
+        with open(interactions_dbutil.JSON_PATH) as f:
+            data = json.load(f)
+        del data["ddi_database"][40:]
+        source = synced_interactions / "smaller.json"
+        source.write_text(json.dumps(data))
+        dataset_sync.rebuild_dataset("interactions", source_path=str(source))
+
+        # Open read transactions finish on the old data
+        assert snapshot.execute("SELECT COUNT(*) FROM drug_interactions").fetchone()[0] == 80
+        snapshot.execute("COMMIT")
+
+        writer = db_connection.connect_writer(db_path)
+        writer.execute("DELETE FROM drug_interactions WHERE rowid = (SELECT MIN(rowid) FROM drug_interactions)")
+        writer.commit()
+        writer.close()
+
+        for conn in (reader, snapshot):
+            assert conn.execute("SELECT COUNT(*) FROM drug_interactions").fetchone()[0] == 39
+            assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert dataset_sync.get_dataset_version("interactions")["version"] == 2
+        reader.close()
+        snapshot.close()
+
+
+class TestDrugLookups:
+    """Tests for the comprehensive drug and interaction lookups."""
+
+    def test_get_drug_details(self, comprehensive_db):
+        details = get_drug_details("Ibuprofen")
+        assert details["generic_name"] == "Ibuprofen"
+        assert details["drug_class"] == "NSAID"
+
+    def test_get_drug_details_missing(self, comprehensive_db):
+        assert get_drug_details("Not A Drug") is None
+
+    def test_get_drugs_by_class(self, comprehensive_db):
+        drugs = get_drugs_by_class("NSAID")
+        assert drugs
+        assert all(drug["drug_class"] == "NSAID" for drug in drugs)
+
+    def test_get_drug_details_many_keeps_order(self, comprehensive_db):
+        details = get_drug_details_many(["Naproxen", "Not A Drug", "Ibuprofen", "Naproxen"])
+        assert [d["generic_name"] for d in details] == ["Naproxen", "Not A Drug", "Ibuprofen", "Naproxen"]
+        assert details[1]["error"] == "Drug not found"
+        assert details[2] == get_drug_details("Ibuprofen")
+
+    def test_get_therapeutic_alternatives_excludes_drug(self, comprehensive_db):
+        result = get_therapeutic_alternatives("Ibuprofen")
+        names = {drug["generic_name"] for drug in result["alternatives"]}
+        assert result["drug_class"] == "NSAID"
+        assert "Ibuprofen" not in names
+        assert names == {drug["generic_name"] for drug in get_drugs_by_class("NSAID")} - {"Ibuprofen"}
+        assert get_therapeutic_alternatives("Not A Drug") is None
+
+    def test_check_drug_interaction_both_directions(self, interactions_db):
+        forward = check_drug_interaction("Warfarin", "Ibuprofen")
+        backward = check_drug_interaction("Ibuprofen", "Warfarin")
+        assert forward is not None
+        assert forward == backward
+        assert forward["severity"] == "Major"
+
+    def test_interaction_matrix_sorted_by_severity(self, interactions_db):
+        result = check_interactions_matrix(["Warfarin", "Aspirin", "Paracetamol", "Lisinopril", "Lithium", "Warfarin"])
+        assert result["pairs_checked"] == 10
+        severities = [i["severity"] for i in result["interactions"]]
+        assert severities == sorted(severities, key=interactions_dbutil.SEVERITY_ORDER.get)
+        pairs = {frozenset((i["drug_a"], i["drug_b"])) for i in result["interactions"]}
+        assert frozenset(("Warfarin", "Aspirin")) in pairs
+        assert frozenset(("Warfarin", "Acetaminophen")) in pairs
+        assert frozenset(("Lithium", "ACE Inhibitors (e.g., Lisinopril)")) in pairs
+        assert result["not_in_database"] == []
+
+    def test_interaction_matrix_matches_pairwise_checks(self, interactions_db):
+        drugs = ["Warfarin", "Ibuprofen", "Aspirin", "Not A Drug"]
+        result = check_interactions_matrix(drugs)
+        pairwise = [check_drug_interaction(a, b) for i, a in enumerate(drugs) for b in drugs[i + 1:]]
+        expected = {i["interaction_id"] for i in pairwise if i}
+        assert {i["interaction_id"] for i in result["interactions"]} == expected
+        assert result["not_in_database"] == ["Not A Drug"]
+
+
+class TestNameResolver:
+    """Tests for normalized, alias and fuzzy name resolution."""
+
+    @pytest.fixture
+    def resolver(self):
+        resolver = DrugNameResolver()
+        for name in ["Ibuprofen", "Acetaminophen", "Amoxicillin-Clavulanate"]:
+            resolver.add_name("drugs", name)
+        resolver.add_name("interactions", "Proton Pump Inhibitors (e.g., Omeprazole)")
+        resolver.add_alias("paracetamol", "acetaminophen")
+        return resolver
+
+    def test_normalize_name(self):
+        assert normalize_name("  Amoxicillin-Clavulanate ") == "amoxicillin clavulanate"
+        assert normalize_name("Paracetamol 500 mg") == "paracetamol"
+
+    def test_exact_alias_and_fuzzy(self, resolver):
+        assert resolver.resolve("IBUPROFEN", "drugs")["method"] == "exact"
+        alias = resolver.resolve("Paracetamol", "drugs")
+        assert (alias["name"], alias["method"]) == ("Acetaminophen", "alias")
+        fuzzy = resolver.resolve("ibuprofin", "drugs")
+        assert (fuzzy["name"], fuzzy["method"]) == ("Ibuprofen", "fuzzy")
+        assert fuzzy["confidence"] < alias["confidence"] < 1.0
+
+    def test_parenthetical_examples_optional(self, resolver):
+        resolved = resolver.resolve("proton pump inhibitors", "interactions")
+        assert resolved["name"] == "Proton Pump Inhibitors (e.g., Omeprazole)"
+
+    def test_unknown_name(self, resolver):
+        assert resolver.resolve("Zzyzx", "drugs") is None
+        with pytest.raises(ValueError):
+            resolver.resolve("Ibuprofen", "unknown")
+
+    def test_lookups_resolve_names(self, comprehensive_db, interactions_db):
+        details = get_drug_details("ibuprofin")
+        assert details["generic_name"] == "Ibuprofen"
+        assert details["resolved_from"] == "ibuprofin"
+        assert get_drug_details("Ibuprofen")["match_confidence"] == 1.0
+        assert get_drugs_by_class("nsaids")
+        interaction = check_drug_interaction("Paracetamol", "warfarin")
+        assert {interaction["drug_a"], interaction["drug_b"]} == {"Warfarin", "Acetaminophen"}
+        assert interaction["match_confidence"] == 0.95
+
+
+class TestReadModel:
+    """Tests for answering lookups from the in-process read model."""
+
+    @pytest.fixture
+    def all_dbs(self, comprehensive_db, interactions_db, tmp_path, monkeypatch):
+        csv_path = tmp_path / "medicines.csv"
+        csv_path.write_text("\n".join([
+            "Medicine Name,Composition,Manufacturer,Uses,Side_effects",
+            "Calpol 500 Tablet,Paracetamol (500mg),GSK,Fever,Nausea",
+            "Paracip 650 Tablet,Paracetamol (650mg),Cipla,Fever,Nausea",
+            "Brufen 400 Tablet,Ibuprofen (400mg),Abbott,Pain,Nausea",
+        ]))
+        monkeypatch.setattr(medicine_dbutil, "DB_PATH", str(tmp_path / "medicine_info.db"))
+        medicine_dbutil.insert_medicines_from_csv(csv_path=str(csv_path))
+        yield tmp_path / "read_model.snapshot"
+        read_model.disable_read_model()
+
+    def lookups(self):
+        return [
+            get_drug_details("ibuprofin"),
+            get_drugs_by_class("NSAID"),
+            get_drug_details_many(["Naproxen", "Not A Drug", "Ibuprofen"]),
+            get_therapeutic_alternatives("Ibuprofen"),
+            check_drug_interaction("Ibuprofen", "warfarin"),
+            check_drug_interaction("Paracetamol", "Warfarin"),
+            medicine_dbutil.get_medicine_info("rufen"),
+            medicine_dbutil.get_medicine_info("br"),
+            medicine_dbutil.get_medicine_by_composition("paracetamol"),
+        ]
+
+    def test_answers_match_sqlite_without_queries(self, all_dbs, monkeypatch):
+        expected = self.lookups()
+        read_model.enable_read_model(snapshot_path=str(all_dbs))
+
+        def no_sql(*args, **kwargs):
+            raise AssertionError("read model should not query SQLite")
+
+        for module in (medicine_dbutil, interactions_dbutil, comprehensive_drug_dbutil):
+            monkeypatch.setattr(module, "fetch_all", no_sql)
+            monkeypatch.setattr(module, "fetch_one", no_sql, raising=False)
+        assert self.lookups() == expected
+
+    def test_snapshot_reused_until_sources_change(self, all_dbs, monkeypatch):
+        read_model.enable_read_model(snapshot_path=str(all_dbs))
+        assert all_dbs.exists()
+
+        with monkeypatch.context() as patch:
+            patch.setattr(read_model, "_load_rows", lambda paths: pytest.fail("snapshot not used"))
+            model = read_model.build_read_model(str(all_dbs))
+        assert model.drug_row("Ibuprofen")[0] == "Ibuprofen"
+
+        conn = sqlite3.connect(comprehensive_drug_dbutil.DB_PATH)
+        conn.execute("UPDATE drugs SET availability = 'Withdrawn' WHERE generic_name = 'Ibuprofen'")
+        conn.commit()
+        conn.close()
+        db_connection.invalidate(comprehensive_drug_dbutil.DB_PATH)
+        assert get_drug_details("Ibuprofen")["availability"] == "Withdrawn"
+
+
+    def test_snapshot_round_trips_columns_without_pickle(self, tmp_path):
+        path = str(tmp_path / "read_model.snapshot")
+        rows = {"interactions": [(1, "Warfarin", None), (2, "Ibuprofen — 400 mg", "Näproxen")],
+                "medicines": []}
+        read_model.save_snapshot(path, {"medicines": "m.db"}, {"medicines": ((1, 2, 3), None)}, rows)
+
+        assert read_model.load_snapshot(path, {"medicines": "m.db"}, {"medicines": ((1, 2, 3), None)}) == rows
+        assert read_model.load_snapshot(path, {"medicines": "m.db"}, {"medicines": ((1, 2, 4), None)}) is None
+        with open(path, "rb") as f:
+            header = json.loads(f.read(int.from_bytes(f.read(8), "little")))
+        assert header["format"] == read_model.SNAPSHOT_FORMAT
+
+    def test_medicine_search_matches_sqlite(self, tmp_path, monkeypatch):
+        """Test that both search paths return the same rows in the same order."""
+        csv_path = tmp_path / "medicines.csv"
+        lines = ["Medicine Name,Composition,Manufacturer,Uses,Side_effects"]
+        lines += [f"{['Dolo', 'Calpol', 'paracip', 'Zerodol'][i % 4]} {i * 37 % 1000} {'Tablet' * (i % 3 + 1)},"
+                  f"Paracetamol ({i % 9 * 50 + 100}mg),Micro,Fever,Nausea"
+                  for i in range(medicine_dbutil.FTS_CANDIDATE_LIMIT * 2)]
+        lines += ["Tab Para,Ibuprofen (200mg),Abbott,Pain,Nausea", "PARA,Aceclofenac (100mg),Intas,Pain,Nausea"]
+        csv_path.write_text("\n".join(lines))
+        monkeypatch.setattr(medicine_dbutil, "DB_PATH", str(tmp_path / "medicine_info.db"))
+        medicine_dbutil.insert_medicines_from_csv(csv_path=str(csv_path))
+
+        queries = [(column, term) for column in ("medicine_name", "composition")
+                   for term in ("para", "PARA", "tablet", "dol", "ca", "p", "10", "mg)", "zz")]
+        expected = [medicine_dbutil._search_medicines(column, term) for column, term in queries]
+        read_model.enable_read_model(snapshot_path=None)
+        try:
+            assert [medicine_dbutil._search_medicines(column, term) for column, term in queries] == expected
+        finally:
+            read_model.disable_read_model()
+        assert any(expected) and all(len(rows) <= 5 for rows in expected)
+
+
+class TestIndicationSearch:
+    """Tests for the TF-IDF search over drug indications and medicine uses."""
+
+    @pytest.fixture
+    def indexed_dbs(self, comprehensive_db, tmp_path, monkeypatch):
+        csv_path = tmp_path / "medicines.csv"
+        csv_path.write_text("\n".join([
+            "Medicine Name,Composition,Manufacturer,Uses,Side_effects",
+            "Amlong 5 Tablet,Amlodipine (5mg),Micro Labs,Treatment of Hypertension,Headache",
+            "Pantocid 40 Tablet,Pantoprazole (40mg),Sun Pharma,Treatment of Gastroesophageal reflux disease,Nausea",
+            "Brufen 400 Tablet,Ibuprofen (400mg),Abbott,Pain relief,Nausea",
+        ]))
+        monkeypatch.setattr(medicine_dbutil, "DB_PATH", str(tmp_path / "medicine_info.db"))
+        monkeypatch.setattr(medicine_dbutil, "CSV_PATH", str(csv_path))
+        medicine_dbutil.insert_medicines_from_csv()
+        return tmp_path
+
+    def test_finds_drugs_and_medicines_by_condition(self, indexed_dbs):
+        result = indication_search.search_by_indication("high blood pressure")
+        matches = result["matches"]
+        assert {m["source"] for m in matches} == {"drugs", "medicines"}
+        assert all("hypertension" in (m.get("indications") or m.get("uses")).lower() for m in matches)
+        assert [m["score"] for m in matches] == sorted((m["score"] for m in matches), reverse=True)
+
+        reflux = indication_search.search_by_indication("acid reflux")["matches"]
+        assert "Pantocid 40 Tablet" in [m.get("medicine_name") for m in reflux]
+        assert indication_search.search_by_indication("xyzzy") is None
+
+    def test_identical_text_scores_one(self):
+        index = indication_search.IndicationIndex.build([(1, "Migraine attacks"), (2, "Tension headache"),
+                                                         (3, "Migraine attacks"), (4, None)])
+        assert index.vectors == 3
+        assert index.search("migraine attack") == [(1, 1.0), (3, 1.0)]
+        assert index.search("headache")[0][0] == 2
+
+    def test_search_matches_dense_scoring(self):
+        words = ["pain", "fever", "infection", "migraine", "ulcer", "asthma", "cough", "rash"]
+        texts = [(i, " ".join(words[(i * k) % 7 + k % 2] for k in range(1, 5)) + f" code{i}") for i in range(400)]
+        index = indication_search.IndicationIndex.build(texts)
+        for query in ["pain", "fever infection", "migraine ulcer", "cough rash asthma"] * 2:
+            dense = np.zeros(index.vectors)
+            features = indication_search.text_features(query)
+            weights = {f: (1 + np.log(c)) * indication_search._idf(index.df[f], index.rows) for f, c in features.items()}
+            norm = np.sqrt(sum(w * w for w in weights.values()))
+            for feature, weight in weights.items():
+                begin, end = index.indptr[feature], index.indptr[feature + 1]
+                dense[index.postings[begin:end]] += index.weights[begin:end] * weight / norm
+
+            found = index.search(query, top_k=5)
+            expected = sorted(dense, reverse=True)[:5]
+            assert [score for _, score in found] == [round(float(score), 4) for score in expected]
+            assert all(round(float(dense[row_id]), 4) == score for row_id, score in found)
+
+    def test_search_time_follows_matching_rows_not_index_size(self):
+        """Test that a rare condition costs about the same in a small and a large index."""
+        def median_ms(rows):
+            texts = [(i, f"condition{i} variant{i % 97}") for i in range(rows)]
+            texts += [(rows + i, "migraine") for i in range(20)]
+            index = indication_search.IndicationIndex.build(texts)
+            timings = []
+            for _ in range(30):
+                start = time.perf_counter()
+                assert index.search("migraine")[0][1] == 1.0
+                timings.append(time.perf_counter() - start)
+            return sorted(timings)[len(timings) // 2] * 1000
+
+        small, large = median_ms(2_000), median_ms(100_000)
+        assert large < 2 * small + 0.1, (small, large)
+
+    def test_index_stored_with_database_and_follows_sync(self, indexed_dbs, monkeypatch):
+        with monkeypatch.context() as patch:
+            patch.setattr(indication_search.IndicationIndex, "build", lambda rows: pytest.fail("stored index not used"))
+            index = indication_search.load_indication_index("medicines")
+        assert index.rows == 3
+
+        dataset_sync.rebuild_dataset("medicines")
+        edited = indexed_dbs / "edited.csv"
+        edited.write_text((indexed_dbs / "medicines.csv").read_text().replace("Pain relief", "Migraine"))
+        dataset_sync.sync_dataset("medicines", source_path=str(edited))
+        matches = indication_search.search_by_indication("migraine")["matches"]
+        assert "Brufen 400 Tablet" in [m.get("medicine_name") for m in matches]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,183 @@
+"""
+Tests for the parallel tool-calling loop.
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from services import tool_calling
+from services.tool_registry import ToolRegistry, param
+
+
+def make_call(call_id, name, **args):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+
+@pytest.fixture
+def slow_tools():
+    registry = ToolRegistry()
+
+    @registry.tool(name="sleep", params={"seconds": param("How long", type="number")}, ttl=0,
+                   fallback=lambda args, reason: {"fallback": reason})
+    def sleeper(seconds):
+        time.sleep(seconds)
+        return {"slept": seconds}
+
+    @registry.tool(name="broken", ttl=0)
+    def broken():
+        raise RuntimeError("boom")
+
+    return registry
+
+
+def test_calls_run_in_parallel_and_keep_order(slow_tools):
+    calls = [make_call(f"call_{i}", "sleep", seconds=s) for i, s in enumerate([0.3, 0.1, 0.2])]
+    start = time.monotonic()
+    responses = tool_calling.handle_tool_calls(SimpleNamespace(tool_calls=calls), registry=slow_tools)
+    elapsed = time.monotonic() - start
+    assert [r["tool_call_id"] for r in responses] == ["call_0", "call_1", "call_2"]
+    assert [json.loads(r["content"])["slept"] for r in responses] == [0.3, 0.1, 0.2]
+    assert elapsed < 0.5
+
+
+def test_timeout_and_errors_use_fallbacks(slow_tools):
+    calls = [make_call("slow", "sleep", seconds=1.0), make_call("bad", "broken"), make_call("fast", "sleep", seconds=0)]
+    start = time.monotonic()
+    results = tool_calling.execute_tool_calls(calls, timeouts={"sleep": 0.2}, registry=slow_tools)
+    assert time.monotonic() - start < 0.8
+    assert results[0] == ("slow", "sleep", {"fallback": "timed out after 0.2s"})
+    assert "boom" in results[1][2]["error"]
+    assert results[2][2] == {"slept": 0}
+
+
+def test_timeouts_start_when_a_worker_picks_the_call_up(slow_tools):
+    """More calls than workers: queued calls get their full timeout once they start."""
+    calls = [make_call(f"call_{i}", "sleep", seconds=0.15) for i in range(4)]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = tool_calling.execute_tool_calls(calls, executor=executor, timeouts={"sleep": 0.25},
+                                                  registry=slow_tools)
+    assert [r[2] for r in results] == [{"slept": 0.15}] * 4
+
+
+def test_call_queued_too_long_is_given_up(slow_tools, monkeypatch):
+    monkeypatch.setattr(tool_calling, "QUEUE_TIMEOUT", 0.1)
+    calls = [make_call("busy", "sleep", seconds=0.4), make_call("queued", "sleep", seconds=0)]
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        results = tool_calling.execute_tool_calls(calls, executor=executor, timeouts={"sleep": 1.0},
+                                                  registry=slow_tools)
+    assert results[0][2] == {"slept": 0.4}
+    assert results[1][2]["fallback"].startswith("not started within 0.1s")
+
+
+def test_pool_held_by_timed_out_calls_is_replaced(slow_tools):
+    tool_calling.set_tool_workers(2)
+    try:
+        pool = tool_calling._executor
+        results = tool_calling.execute_tool_calls([make_call("slow", "sleep", seconds=0.3)],
+                                                  timeouts={"sleep": 0.05}, registry=slow_tools)
+        assert results[0][2] == {"fallback": "timed out after 0.05s"}
+        assert tool_calling._executor is not pool
+        fast = tool_calling.execute_tool_calls([make_call("fast", "sleep", seconds=0)], registry=slow_tools)
+        assert fast[0][2] == {"slept": 0}
+    finally:
+        tool_calling.set_tool_workers(tool_calling.MAX_WORKERS)
+
+
+def test_bad_arguments_and_unknown_tool():
+    results = tool_calling.execute_tool_calls([
+        SimpleNamespace(id="a", function=SimpleNamespace(name="get_medicine_info", arguments="{not json")),
+        {"id": "b", "function": {"name": "no_such_tool", "arguments": "{}"}},
+    ])
+    assert results[0][2] == {"error": "Missing required argument 'search_term'."}
+    assert results[1][2] == {"error": "Unknown tool called: no_such_tool"}
+
+
+def test_run_tool_loop_feeds_results_back(comprehensive_db):
+    replies = [
+        SimpleNamespace(content=None, tool_calls=[make_call("c1", "compare_drugs", drug_list=["Ibuprofen", "Nope"])]),
+        SimpleNamespace(content="Ibuprofen is an NSAID.", tool_calls=None),
+    ]
+    sent = []
+
+    def create(**kwargs):
+        sent.append([dict(m) for m in kwargs["messages"]])
+        return SimpleNamespace(choices=[SimpleNamespace(message=replies.pop(0))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    messages = tool_calling.build_messages("system", "Compare", [{"role": "user", "content": [{"text": "hi"}]}])
+    answer = tool_calling.run_tool_loop(client, "model", messages)
+
+    assert answer == "Ibuprofen is an NSAID."
+    tool_message = sent[1][-1]
+    assert tool_message["tool_call_id"] == "c1"
+    comparison = json.loads(tool_message["content"])["comparison"]
+    assert comparison[0]["generic_name"] == "Ibuprofen"
+    assert comparison[1]["error"] == "Drug not found"
+
+
+def text_chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text, tool_calls=None))])
+
+
+def tool_chunk(index, call_id=None, name=None, arguments=None):
+    delta = SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=[delta]))])
+
+
+def streaming_client(rounds, sent):
+    def create(**kwargs):
+        assert kwargs["stream"] is True
+        sent.append([dict(m) for m in kwargs["messages"]])
+        return iter(rounds.pop(0))
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def test_iter_tool_calls_reports_in_completion_order(slow_tools):
+    calls = [make_call("slow", "sleep", seconds=0.2), make_call("fast", "sleep", seconds=0)]
+    events = list(tool_calling.iter_tool_calls(calls, registry=slow_tools))
+    assert [(e["type"], e["id"]) for e in events] == [
+        ("tool_start", "slow"), ("tool_start", "fast"), ("tool_end", "fast"), ("tool_end", "slow")
+    ]
+    assert events[3]["ok"] and events[3]["seconds"] >= 0.2
+
+
+def test_stream_tool_loop_assembles_deltas_and_streams_answer(comprehensive_db):
+    rounds = [
+        [
+            tool_chunk(0, "c1", "compare_drugs", '{"drug_'),
+            tool_chunk(0, arguments='list": ["Ibuprofen"]}'),
+        ],
+        [text_chunk("Ibuprofen "), text_chunk("is an NSAID.")],
+    ]
+    sent = []
+    messages = tool_calling.build_messages("system", "Compare", [])
+    events = list(tool_calling.stream_tool_loop(streaming_client(rounds, sent), "model", messages))
+
+    assert [e["type"] for e in events] == ["tool_start", "tool_end", "text", "text", "done"]
+    assert events[0]["arguments"] == {"drug_list": ["Ibuprofen"]}
+    assert "result" not in events[1]
+    assert sent[1][-2]["tool_calls"][0]["function"] == {"name": "compare_drugs", "arguments": '{"drug_list": ["Ibuprofen"]}'}
+    assert json.loads(sent[1][-1]["content"])["comparison"][0]["generic_name"] == "Ibuprofen"
+
+    done = events[-1]
+    assert done["content"] == "Ibuprofen is an NSAID."
+    assert done["metrics"]["iterations"] == 1 and done["metrics"]["tool_calls"] == 1
+    assert done["metrics"]["ttfvo"] <= done["metrics"]["first_token"] <= done["metrics"]["total"]
+    assert tool_calling.stream_metrics()["turns"] >= 1
+
+
+def test_stream_chat_text_shows_progress_then_answer(comprehensive_db):
+    rounds = [
+        [tool_chunk(0, "c1", "compare_drugs", '{"drug_list": ["Ibuprofen"]}')],
+        [text_chunk("Done"), text_chunk(".")],
+    ]
+    messages = tool_calling.build_messages("system", "Compare", [])
+    outputs = list(tool_calling.stream_chat_text(streaming_client(rounds, []), "model", messages))
+    assert outputs[0] == "🔧 Calling compare_drugs…"
+    assert outputs[1].startswith("✓ compare_drugs (")
+    assert outputs[-1].endswith("\n\nDone.")
@@ -0,0 +1,77 @@
+"""
+Tests for the declarative tool registry.
+"""
+
+import pytest
+
+from services import comprehensive_drug_dbutil
+from services.phase2_medicine_llm_schema import MEDICINE_TOOLS as PHASE2_TOOLS
+from services.phase3_medicine_llm_schema import MEDICINE_TOOLS as PHASE3_TOOLS
+from services.tool_registry import ToolRegistry, param, registry
+
+
+@pytest.fixture
+def counting_registry():
+    reg = ToolRegistry()
+    calls = []
+
+    @reg.tool(
+        description="Look up a drug.",
+        params={
+            "name": param("Drug name", maps_to="generic_name"),
+            "limit": param("Max rows", type="integer", default=5),
+            "tags": param("Tags", type="array", items="string"),
+        },
+        on_empty={"error": "{name} not found"},
+    )
+    def lookup(generic_name, limit=5, tags=None):
+        calls.append((generic_name, limit, tags))
+        return {"name": generic_name, "limit": limit} if generic_name != "missing" else None
+
+    return reg, calls
+
+
+def test_schema_built_from_declaration(counting_registry):
+    reg, _ = counting_registry
+    schema = reg.schemas()[0]["function"]
+    assert schema["name"] == "lookup"
+    assert schema["parameters"]["required"] == ["name"]
+    assert schema["parameters"]["properties"]["tags"] == {"type": "array", "items": {"type": "string"}, "description": "Tags"}
+
+
+def test_arguments_validated_before_call(counting_registry):
+    reg, calls = counting_registry
+    assert reg.call("lookup", {}) == {"error": "Missing required argument 'name'."}
+    assert reg.call("lookup", {"name": 3}) == {"error": "Argument 'name' must be of type string."}
+    assert reg.call("lookup", {"name": "x", "limit": True})["error"].startswith("Argument 'limit'")
+    assert reg.call("lookup", {"name": "x", "tags": ["a", 1]})["error"].startswith("Every item in 'tags'")
+    assert reg.call("nope", {}) == {"error": "Unknown tool called: nope"}
+    assert calls == []
+    assert reg.call("lookup", {"name": "missing"}) == {"error": "missing not found"}
+
+
+def test_results_memoized(counting_registry):
+    reg, calls = counting_registry
+    first = reg.call("lookup", {"name": "aspirin"})
+    first["limit"] = 99   # callers get copies
+    assert reg.call("lookup", {"name": "aspirin", "limit": 5}) == {"name": "aspirin", "limit": 5}
+    assert len(calls) == 1
+    assert reg.stats["cache_hits"] == 1
+
+
+def test_memo_invalidated_when_dataset_reloaded(comprehensive_db):
+    registry.clear_cache()
+    first = registry.call("compare_drugs", {"drug_list": ["Ibuprofen"]})
+    assert registry.call("compare_drugs", {"drug_list": ["Ibuprofen"]}) == first
+    hits = registry.stats["cache_hits"]
+
+    comprehensive_drug_dbutil.insert_comprehensive_drugs_from_csv()
+    assert registry.call("compare_drugs", {"drug_list": ["Ibuprofen"]}) == first
+    assert registry.stats["cache_hits"] == hits
+
+
+def test_phase_tool_sets():
+    assert [t["function"]["name"] for t in PHASE2_TOOLS] == ["get_medicine_info", "drug_lookup"]
+    assert len(PHASE3_TOOLS) == 7
+    for schema in PHASE3_TOOLS:
+        assert registry.get(schema["function"]["name"]).schema is schema
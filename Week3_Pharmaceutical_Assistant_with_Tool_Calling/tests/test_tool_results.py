@@ -0,0 +1,75 @@
+"""
+Tests for tool result projection, pagination and token budgets.
+"""
+
+import pytest
+
+from services import tool_results
+from services.tool_registry import registry
+from services.tool_results import count_tokens, decode_cursor, shape_result, to_json
+
+
+@pytest.fixture(autouse=True)
+def byte_estimate(monkeypatch):
+    # Deterministic token counts without downloading tiktoken encodings
+    monkeypatch.setattr(tool_results, "_get_encoding", lambda: None)
+
+
+ROWS = [{"name": f"Drug {i}", "class": "NSAID", "notes": "x" * 400} for i in range(20)]
+
+
+def test_projection_and_limit_with_cursor():
+    first = shape_result({"rows": ROWS}, {"fields": ["class"], "limit": 8}, rows_key="rows",
+                         paginate=True, keep_fields=("name",), token_budget=None)
+    assert first["rows"][0] == {"name": "Drug 0", "class": "NSAID"}
+    assert len(first["rows"]) == 8
+    assert first["total_rows"] == 20
+
+    second = shape_result({"rows": ROWS}, {"limit": 8, "cursor": first["next_cursor"]}, rows_key="rows",
+                          paginate=True, token_budget=None)
+    assert second["rows"][0]["name"] == "Drug 8"
+    last = shape_result({"rows": ROWS}, {"cursor": second["next_cursor"]}, rows_key="rows",
+                        paginate=True, token_budget=None)
+    assert [r["name"] for r in last["rows"]] == [f"Drug {i}" for i in range(16, 20)]
+    assert "next_cursor" not in last
+
+
+def test_list_results_wrapped_only_when_paged():
+    assert shape_result(ROWS[:2], {}, paginate=True, token_budget=None) == ROWS[:2]
+    paged = shape_result(ROWS, {"limit": 2}, paginate=True, token_budget=None)
+    assert len(paged["results"]) == 2
+    assert decode_cursor(paged["next_cursor"]) == 2
+    assert shape_result(ROWS, {"cursor": "garbage"}, paginate=True)["error"].startswith("Invalid cursor")
+
+
+def test_budget_truncates_text_before_dropping_rows():
+    shaped = shape_result({"rows": ROWS[:5]}, {}, rows_key="rows", paginate=True, token_budget=400)
+    assert len(shaped["rows"]) == 5
+    assert shaped["rows"][0]["notes"].endswith(tool_results.TRUNCATION_MARKER)
+    assert count_tokens(to_json(shaped)) <= 400
+
+    shaped = shape_result({"rows": ROWS}, {}, rows_key="rows", paginate=True, token_budget=400)
+    assert len(shaped["rows"]) < 20
+    assert decode_cursor(shaped["next_cursor"]) == len(shaped["rows"])
+    assert count_tokens(to_json(shaped)) <= 400
+
+
+def test_non_row_results_are_capped():
+    shaped = shape_result({"warnings": "w" * 20000}, token_budget=300)
+    assert shaped["warnings"].endswith(tool_results.TRUNCATION_MARKER)
+    assert count_tokens(to_json(shaped)) <= 300
+
+
+def test_registry_pages_alternatives(comprehensive_db):
+    first = registry.run("get_therapeutic_alternatives", {"drug_name": "Ibuprofen", "fields": ["availability"], "limit": 5})
+    assert set(first["alternatives"][0]) == {"generic_name", "availability"}
+    rest = registry.run("get_therapeutic_alternatives", {"drug_name": "Ibuprofen", "cursor": first["next_cursor"]})
+    names = [d["generic_name"] for d in first["alternatives"] + rest["alternatives"]]
+    assert len(names) == first["total_rows"] == len(set(names))
+    assert registry.run("compare_drugs", {"drug_list": ["Ibuprofen"], "limit": "two"})["error"].startswith("Argument 'limit'")
+
+
+def test_paginated_tools_advertise_page_arguments():
+    properties = registry.get("get_therapeutic_alternatives").schema["function"]["parameters"]["properties"]
+    assert {"fields", "limit", "cursor"} <= set(properties)
+    assert "cursor" not in registry.get("drug_lookup").schema["function"]["parameters"]["properties"]
@@ -0,0 +1,100 @@
+"""
+Tests for span tracing and the trace CLI.
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from services import tool_calling, trace_report, tracing
+from services.tool_registry import registry
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracing.tracer, "path", str(path))
+    monkeypatch.setattr(tracing.tracer, "sample_rate", 1.0)
+    registry.clear_cache()
+    return path
+
+
+def make_call(call_id, name, **args):
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+
+def fake_client(replies):
+    def create(**kwargs):
+        message = replies.pop(0)
+        usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def run_turn():
+    client = fake_client([
+        SimpleNamespace(content=None, tool_calls=[make_call("c1", "compare_drugs", drug_list=["Ibuprofen"])]),
+        SimpleNamespace(content="Done.", tool_calls=None),
+    ])
+    return tool_calling.run_tool_loop(client, "model", tool_calling.build_messages("system", "Compare", []))
+
+
+def by_name(spans):
+    return {s["name"]: s for s in spans}
+
+
+def test_turn_spans_are_nested_and_exported_as_otlp(comprehensive_db, trace_file):
+    assert run_turn() == "Done."
+
+    document = json.loads(trace_file.read_text().splitlines()[0])
+    otlp_spans = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len({s["traceId"] for s in otlp_spans}) == 1
+
+    spans = by_name(trace_report.load_traces(str(trace_file))[0])
+    turn, tool, query = spans["chat.turn"], spans["tool.compare_drugs"], spans["sqlite.query"]
+    iterations = {s["attributes"]["llm.iteration"]: s
+                  for s in trace_report.load_traces(str(trace_file))[0] if s["name"] == "llm.iteration"}
+    assert turn["parent_id"] is None and turn["attributes"]["llm.iterations"] == 1
+    assert sorted(iterations) == [0, 1]
+    assert tool["parent_id"] == iterations[0]["span_id"]
+    assert query["parent_id"] == tool["span_id"]
+    assert tool["attributes"]["tool.cache_hit"] is False
+    assert tool["attributes"]["tool.result_bytes"] > 0
+    assert spans["llm.completion"]["attributes"]["gen_ai.usage.input_tokens"] == 100
+
+
+def test_streamed_turn_traces_tools_under_iteration(comprehensive_db, trace_file):
+    chunk = SimpleNamespace(index=0, id="c1", function=SimpleNamespace(name="compare_drugs",
+                                                                       arguments='{"drug_list": ["Ibuprofen"]}'))
+    rounds = [
+        [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=[chunk]))])],
+        [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="Done.", tool_calls=None))])],
+    ]
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kw: iter(rounds.pop(0)))))
+    list(tool_calling.stream_tool_loop(client, "model", tool_calling.build_messages("system", "Compare", [])))
+
+    spans = trace_report.load_traces(str(trace_file))[0]
+    named = by_name(spans)
+    first_iteration = next(s for s in spans if s["name"] == "llm.iteration" and s["attributes"]["llm.iteration"] == 0)
+    assert named["tool.compare_drugs"]["parent_id"] == first_iteration["span_id"]
+    assert "chat.ttfvo_ms" in named["chat.turn"]["attributes"]
+
+
+def test_unsampled_turns_record_nothing(comprehensive_db, trace_file, monkeypatch):
+    monkeypatch.setattr(tracing.tracer, "sample_rate", 0.0)
+    run_turn()
+    assert not trace_file.exists()
+
+
+def test_cli_prints_critical_path(comprehensive_db, trace_file, capsys):
+    run_turn()
+    spans = trace_report.load_traces(str(trace_file))[0]
+    path = [s["name"] for s in trace_report.critical_path(spans)]
+    assert path[0] == "chat.turn" and path[1] == "llm.iteration"
+
+    trace_report.main([str(trace_file), "--top", "1"])
+    output = capsys.readouterr().out
+    assert "1 traced turns" in output
+    assert "chat.turn" in output and "llm.iteration" in output